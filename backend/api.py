@@ -1,13 +1,43 @@
-from fastapi import APIRouter, Query, HTTPException, Depends
+from fastapi import APIRouter, Query, HTTPException, Depends, Request
+from fastapi.responses import StreamingResponse
 from typing import Optional, Dict, Any, List
 from pydantic import BaseModel
-from database import User, Product, Menu, Account, CountData, ChartData, OrderData, VideoData, WeekUserData, RealTimePrice
+from database import User, Product, Menu, Account, CountData, ChartData, OrderData, VideoData, WeekUserData, RealTimePrice, PriceAlert, PRICE_SCALE, _INSTRUMENT_IDS, _INSTRUMENT_NAMES, get_instrument_id, datetime_to_ts, ts_to_datetime, now_ts, latest_ticks
+from price_window import RECENT_TICKS, SEQ_BASE, tick_seq, seq_after_ts
+from price_archive import archived_until, read_archive
+from price_rollups import ROLLUPS, choose_resolution, rollup_history
+from price_indicators import INDICATORS
+from price_stream import PRICE_STREAM, STREAM_HEARTBEAT
+from price_alerts import ALERTS, CONDITIONS, Triggered
+from price_asof import MAX_ASOF_POINTS, load_series, as_of
+from price_analytics import MAX_INSTRUMENTS, correlation
+from response_formats import negotiate, render
+from single_flight import coalesce
+from sql_templates import SqlTemplate
+from db_replicas import is_read_request, use_primary
+from db_guard import DB_ERRORS, error_response, serve_stale
+import numpy as np
+import asyncio
+import base64
 import json
+from urllib.parse import urlencode
+from starlette.exceptions import HTTPException as StarletteHTTPException
 from datetime import datetime, timedelta
 
 # 创建API路由器
 router = APIRouter()
 
+
+def _parse_fields(fields: Optional[str], available) -> List[str]:
+    """fields参数（逗号分隔的响应字段名）对应的字段列表，按available中的顺序排列；未提供时为全部字段，包含未知字段时返回400"""
+    if not fields:
+        return list(available)
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested - set(available)
+    if unknown or not requested:
+        raise HTTPException(status_code=400, detail={"code": -999, "message": f"无效的字段: {', '.join(sorted(unknown))}，可选值: {', '.join(available)}"})
+    return [field for field in available if field in requested]
+
 # Pydantic模型定义
 class UserCreate(BaseModel):
     name: str
@@ -27,26 +57,49 @@ class UserUpdate(BaseModel):
     salesperson_id: Optional[int] = None
 
 
+class PriceAlertCreate(BaseModel):
+    owner: str
+    name: str
+    condition: str  # above/below/drop/rise
+    value: float  # above/below为价格，drop/rise为百分比
+    window: Optional[int] = None  # drop/rise的时间窗口（秒）
+
+
+class PriceAsOfQuery(BaseModel):
+    names: List[str]
+    timestamps: List[int] = []  # 毫秒时间戳
+    times: List[str] = []  # YYYY-MM-DD HH:MM:SS，与timestamps二选一
+
+
+class BatchItem(BaseModel):
+    method: str = "GET"
+    url: str  # 接口路径，如 /home/getTableData（可带/api前缀和查询字符串）
+    params: Dict[str, Any] = {}  # 查询参数，值为列表时重复该参数
+    body: Optional[Any] = None  # JSON请求体
+
+
+class BatchRequest(BaseModel):
+    requests: List[BatchItem]
+
+
 class LoginData(BaseModel):
     username: str
     password: str
 
 
 # Home相关API
+# 首页表格的响应字段 -> Product表的列
+_TABLE_FIELDS = {"name": "name", "todayBuy": "today_buy", "monthBuy": "month_buy", "totalBuy": "total_buy"}
+
+
 @router.get("/home/getTableData", response_model=Dict[str, Any])
-async def get_table_data():
-    # 从Product表查询数据
-    products = await Product.all()
+@serve_stale
+async def get_table_data(fields: Optional[str] = None):
+    """获取首页表格数据，fields为逗号分隔的字段名（默认全部字段），只查询需要的列"""
+    selected = _parse_fields(fields, _TABLE_FIELDS)
     
-    # 将数据库数据格式化为前端所需格式
-    table_data = []
-    for product in products:
-        table_data.append({
-            "name": product.name,
-            "todayBuy": product.today_buy,
-            "monthBuy": product.month_buy,
-            "totalBuy": product.total_buy
-        })
+    # 从Product表查询需要的列，并按前端所需的字段名返回
+    table_data = await Product.all().values(**{field: _TABLE_FIELDS[field] for field in selected})
     
     return {
         "code": 200,
@@ -129,6 +182,7 @@ async def get_weekuser_data():
 
 
 @router.get("/home/getCountData", response_model=Dict[str, Any])
+@serve_stale
 async def get_count_data():
     # 从CountData表查询数据
     count_items = await CountData.all()
@@ -150,6 +204,8 @@ async def get_count_data():
 
 
 @router.get("/home/getChartData", response_model=Dict[str, Any])
+@serve_stale
+@coalesce()
 async def get_chart_data():
     # 构建图表数据字典
     chart_data = {}
@@ -215,28 +271,66 @@ async def get_chart_data():
 
 
 # User相关API
+# 用户列表的响应字段 -> 查询的列（salesperson_name需要关联accounts表）
+_USER_FIELDS = {
+    "id": "id",
+    "name": "name",
+    "addr": "addr",
+    "age": "age",
+    "birth": "birth",
+    "sex": "sex",
+    "salesperson_id": "salesperson_id",
+    "salesperson_name": "salesperson__username"
+}
+
+# 不按名称筛选时的分页查询，按选择的字段（tuple）分别编译
+_USER_PAGE = SqlTemplate(
+    "user_page",
+    lambda selected, offset, limit: User.all().offset(offset).limit(limit).values(
+        **{field: _USER_FIELDS[field] for field in selected}
+    ),
+    offset=int, limit=int
+)
+
+
 @router.get("/user/getUserData", response_model=Dict[str, Any])
-async def get_user_data(name: Optional[str] = None, page: int = 1, limit: int = 10):
-    # 使用select_related加载关联的salesperson数据
-    query = User.all().select_related("salesperson")
+async def get_user_data(
+    request: Request,
+    name: Optional[str] = None,
+    page: int = 1,
+    limit: int = 10,
+    fields: Optional[str] = None,
+    response_format: Optional[str] = Query(None, alias="format")
+):
+    """获取用户列表
+
+    fields为逗号分隔的字段名（默认全部字段），只查询需要的列，不需要salesperson_name时不关联accounts表；
+    format（或Accept头）可选columnar/msgpack/arrow，见response_formats.py
+    """
+    output = negotiate(request, response_format)
+    selected = _parse_fields(fields, _USER_FIELDS)
+    
+    query = User.all()
     if name:
         query = query.filter(name__contains=name)
     
     total_count = await query.count()
-    users = await query.offset((page - 1) * limit).limit(limit)
-    
-    user_list = [{
-        "id": str(u.id),
-        "name": u.name,
-        "addr": u.addr,
-        "age": u.age,
-        "birth": str(u.birth),
-        "sex": u.sex,
-        "salesperson_id": u.salesperson.id if u.salesperson else None,
-        "salesperson_name": u.salesperson.username if u.salesperson else ""
-    } for u in users]
+    # 只有需要负责人名称时才关联salesperson，负责人ID直接读取外键列
+    if name:
+        user_list = await query.offset((page - 1) * limit).limit(limit).values(
+            **{field: _USER_FIELDS[field] for field in selected}
+        )
+    else:
+        user_list = await _USER_PAGE.execute(tuple(selected), offset=(page - 1) * limit, limit=limit)
+    for user in user_list:
+        if "id" in user:
+            user["id"] = str(user["id"])
+        if "birth" in user:
+            user["birth"] = str(user["birth"])
+        if "salesperson_name" in user and user["salesperson_name"] is None:
+            user["salesperson_name"] = ""
     
-    return {"code": 200, "data": {"list": user_list, "count": total_count}}
+    return render({"code": 200, "data": {"list": user_list, "count": total_count}}, "list", output)
 
 
 @router.delete("/user/deleteUser", response_model=Dict[str, Any])
@@ -300,51 +394,51 @@ async def edit_user(id: str, user_data: UserUpdate):
 
 
 @router.get("/user/getSalespeople", response_model=Dict[str, Any])
-async def get_salespeople():
-    # 获取所有account_type为"user"的账户
-    salespeople = await Account.filter(account_type="user")
-    
-    # 格式化数据，返回id和username
-    salespeople_list = [
-        {"id": sp.id, "username": sp.username}
-        for sp in salespeople
-    ]
+@serve_stale
+async def get_salespeople(fields: Optional[str] = None):
+    """获取所有负责人（account_type为user的账户），fields为逗号分隔的字段名（id、username，默认全部）"""
+    selected = _parse_fields(fields, ("id", "username"))
+    salespeople_list = await Account.filter(account_type="user").values(*selected)
     
     return {"code": 200, "data": salespeople_list}
 
 
 # Permission相关API
+# 登录账户和账户的菜单（与account.menus.all()相同的查询）
+_ACCOUNT_BY_USERNAME = SqlTemplate(
+    "account_by_username",
+    lambda username: Account.filter(username=username).limit(1).values("id", "password", "account_type"),
+    username=str
+)
+_ACCOUNT_MENUS = SqlTemplate(
+    "account_menus",
+    lambda account_id: Menu.filter(accounts=account_id).values("id", "path", "name", "label", "icon", "url", "parent_id"),
+    account_id=int
+)
+
+
 @router.post("/permission/getMenu", response_model=Dict[str, Any])
 async def get_menu(login_data: LoginData):
     username = login_data.username
     password = login_data.password
     
     # 用户认证
-    try:
-        account = await Account.get(username=username)
-        if account.password != password:
-            raise HTTPException(status_code=401, detail={"code": -999, "data": {"message": "密码错误"}})
-        role = account.account_type
-    except Account.DoesNotExist:
+    accounts = await _ACCOUNT_BY_USERNAME.execute(username=username)
+    if not accounts:
         raise HTTPException(status_code=401, detail={"code": -999, "data": {"message": "用户不存在"}})
+    account = accounts[0]
+    if account["password"] != password:
+        raise HTTPException(status_code=401, detail={"code": -999, "data": {"message": "密码错误"}})
+    role = account["account_type"]
     
     # 从数据库获取菜单数据
     # 获取当前用户有权限访问的所有菜单项
-    menus = await account.menus.all()
+    menus = await _ACCOUNT_MENUS.execute(account_id=account["id"])
     
     # 将菜单项转换为字典，便于处理
     menu_dict = {}
     for menu in menus:
-        menu_dict[menu.id] = {
-            "id": menu.id,
-            "path": menu.path,
-            "name": menu.name,
-            "label": menu.label,
-            "icon": menu.icon,
-            "url": menu.url,
-            "parent_id": menu.parent_id,
-            "children": []
-        }
+        menu_dict[menu["id"]] = {**menu, "children": []}
     
     # 构建菜单树结构
     menu_tree = []
@@ -370,10 +464,120 @@ async def get_menu(login_data: LoginData):
     return {"code": 200, "data": {"menuList": menu_tree, "token": "fake-token-" + role, "message": "获取成功"}}
 
 # 商品页相关API - 实时价格数据接口
+# 增量拉取单次最多返回的记录数
+MAX_DELTA_TICKS = 1000
+
+
+def _delta_cursor(since: Optional[int], since_ts: Optional[int]) -> Optional[int]:
+    """增量拉取的序列号游标：since为序列号，since_ts为毫秒时间戳，都未提供时返回None"""
+    if since is not None:
+        return since
+    if since_ts is not None:
+        return seq_after_ts(since_ts)
+    return None
+
+
+def _parse_brands(names: Optional[str]) -> List[str]:
+    """逗号分隔的品牌名称，未提供时为全部品牌；包含无效品牌时返回400"""
+    brands = names.split(",") if names else ["苹果", "小米", "华为", "oppo", "vivo", "一加"]
+    for brand in brands:
+        if brand not in ["苹果", "小米", "华为", "oppo", "vivo", "一加"]:
+            raise HTTPException(status_code=400, detail={"code": -999, "message": "无效的品牌名称"})
+    return brands
+
+
+async def _brand_id(name: str) -> int:
+    """单个品牌名称对应的品牌ID，不是已登记的品牌（包括空字符串和逗号分隔的多个品牌）时返回400"""
+    instrument_id = await get_instrument_id(name) if name else None
+    if instrument_id is None:
+        raise HTTPException(status_code=400, detail={"code": -999, "message": "无效的品牌名称"})
+    return instrument_id
+
+
+def _tick_item(instrument_id: int, ts: int, price: int) -> Dict[str, Any]:
+    return {
+        "name": _INSTRUMENT_NAMES.get(instrument_id, ""),
+        "time": str(ts_to_datetime(ts)),
+        "value": price / PRICE_SCALE,
+        "seq": tick_seq(ts, instrument_id)
+    }
+
+
+async def _ticks_since(instrument_ids: List[int], since: int, limit: int) -> Dict[str, Any]:
+    """增量拉取seq大于since的价格记录（since不大于0时为各品牌的最新一条），返回记录和新的游标
+
+    优先从内存中的最近价格窗口读取；窗口无法完整覆盖游标之后的记录时，用一条查询从数据库读取
+    """
+    limit = min(limit, MAX_DELTA_TICKS)
+    ticks = RECENT_TICKS.since(instrument_ids, since, limit)
+    if ticks is None:
+        if since <= 0:
+            rows = await latest_ticks(instrument_ids)
+            ticks = sorted(((r["instrument_id"], r["ts"], r["price"]) for r in rows), key=lambda t: tick_seq(t[1], t[0]))
+        else:
+            # 与游标同一毫秒的记录可能还有instrument_id更大的未拉取，因此从该毫秒开始查询再按seq过滤
+            rows = await RealTimePrice.filter(
+                instrument_id__in=instrument_ids, ts__gte=since // SEQ_BASE
+            ).order_by("ts", "instrument_id").limit(limit + len(instrument_ids)).values_list("instrument_id", "ts", "price")
+            ticks = [t for t in rows if tick_seq(t[1], t[0]) > since][:limit]
+    return {
+        "seq": tick_seq(ticks[-1][1], ticks[-1][0]) if ticks else max(since, 0),
+        "ticks": [_tick_item(instrument_id, ts, price) for instrument_id, ts, price in ticks]
+    }
+
+
+# 品牌的最新一条价格记录
+_LATEST_PRICE = SqlTemplate(
+    "latest_price",
+    lambda instrument_id: RealTimePrice.filter(instrument_id=instrument_id).order_by("-ts").limit(1).values_list("ts", "price"),
+    instrument_id=int
+)
+
+
+def _price_item(name: str, ts: Optional[int], price: int) -> Dict[str, Any]:
+    """最新价格的响应格式，没有记录（ts为None）时价格为0、时间为当前时间"""
+    if ts is None:
+        return {"name": name, "value": 0, "time": str(datetime.now())}
+    return {"name": name, "value": price / PRICE_SCALE, "time": str(ts_to_datetime(ts))}
+
+
+async def _latest_price(name: str) -> Dict[str, Any]:
+    """品牌的最新价格"""
+    rows = await _LATEST_PRICE.execute(instrument_id=await get_instrument_id(name))
+    return _price_item(name, *rows[0]) if rows else _price_item(name, None, 0)
+
+
+async def _latest_prices(names: List[str]) -> List[Dict[str, Any]]:
+    """多个品牌的最新价格（一条查询），顺序与names相同"""
+    ids = [await get_instrument_id(name) for name in names]
+    latest = {row["instrument_id"]: row for row in await latest_ticks([i for i in ids if i is not None])}
+    return [
+        _price_item(name, latest[instrument_id]["ts"], latest[instrument_id]["price"])
+        if instrument_id in latest else _price_item(name, None, 0)
+        for name, instrument_id in zip(names, ids)
+    ]
+
+
 @router.get("/mall/getRealTimePrice", response_model=Dict[str, Any])
-async def get_real_time_price(name: Optional[str] = None):
-    """获取实时价格数据"""
-    query = RealTimePrice.all()
+@serve_stale
+@coalesce()
+async def get_real_time_price(
+    name: Optional[str] = None,
+    names: Optional[str] = None,
+    since: Optional[int] = None,
+    since_ts: Optional[int] = None,
+    limit: int = MAX_DELTA_TICKS
+):
+    """获取实时价格数据
+
+    提供since（序列号游标）或since_ts（毫秒时间戳）时为增量模式：一次返回names（逗号分隔，默认全部品牌）中
+    所有比游标新的价格记录及新的游标seq，下次请求带上该游标即可；since=0 返回各品牌的最新一条和当前游标
+    """
+    cursor = _delta_cursor(since, since_ts)
+    if cursor is not None:
+        brands = _parse_brands(names or name)
+        instrument_ids = [await get_instrument_id(brand) for brand in brands]
+        return {"code": 200, "data": await _ticks_since(instrument_ids, cursor, limit)}
     
     # 如果指定了品牌名称，只返回该品牌的数据
     if name:
@@ -382,69 +586,92 @@ async def get_real_time_price(name: Optional[str] = None):
             raise HTTPException(status_code=400, detail={"code": -999, "message": "无效的品牌名称"})
         
         # 获取该品牌的最新价格
-        latest_price = await RealTimePrice.filter(name=name).order_by("-time").first()
-        
-        if not latest_price:
-            return {"code": 200, "data": {"name": name, "value": 0, "time": str(datetime.now())}}
-        
-        return {
-            "code": 200,
-            "data": {
-                "name": latest_price.name,
-                "value": latest_price.value,
-                "time": str(latest_price.time)
-            }
-        }
+        return {"code": 200, "data": await _latest_price(name)}
     else:
         # 返回所有品牌的最新价格
-        all_prices = []
-        for brand in ["苹果", "小米", "华为", "oppo", "vivo", "一加"]:
-            latest_price = await RealTimePrice.filter(name=brand).order_by("-time").first()
-            if latest_price:
-                all_prices.append({
-                    "name": latest_price.name,
-                    "value": latest_price.value,
-                    "time": str(latest_price.time)
-                })
-            else:
-                all_prices.append({
-                    "name": brand,
-                    "value": 0,
-                    "time": str(datetime.now())
-                })
-        
         return {
             "code": 200,
-            "data": all_prices
+            "data": await _latest_prices(["苹果", "小米", "华为", "oppo", "vivo", "一加"])
         }
 
+# 价格历史记录中可能出现的字段：原始记录为time/value（增量拉取时还有seq），聚合记录还有开高低收、均价和记录数
+_HISTORY_FIELDS = ("time", "value", "seq", "open", "high", "low", "close", "avg", "count")
+
+
+def _project(rows: List[Dict[str, Any]], selected: Optional[List[str]]) -> List[Dict[str, Any]]:
+    """只保留selected中的字段（记录中没有的字段忽略）"""
+    if selected is None:
+        return rows
+    return [{field: row[field] for field in selected if field in row} for row in rows]
+
+
+def _price_history_query(newest: bool, has_start: bool, has_end: bool, instrument_id: int, start: int, end: int, limit: int):
+    # 时间范围直接作为ts列上的条件（不对列做函数转换），MySQL可以据此跳过范围外的分区；
+    # newest时按时间倒序取最近的limit条（调用方再反转为正序）
+    query = RealTimePrice.filter(instrument_id=instrument_id).order_by("-ts" if newest else "ts")
+    if has_start:
+        query = query.filter(ts__gte=start)
+    if has_end:
+        query = query.filter(ts__lte=end)
+    return query.limit(limit).values_list("ts", "price")
+
+
+# 原始价格记录的时间范围查询，按取最近记录/是否有开始/结束时间分别编译
+_PRICE_HISTORY = SqlTemplate("price_history", _price_history_query, instrument_id=int, start=int, end=int, limit=int)
+
+
 @router.get("/mall/getPriceHistory", response_model=Dict[str, Any])
 async def get_price_history(
+    request: Request,
     name: str,
     limit: int = 100,
     start_time: Optional[str] = None,
-    end_time: Optional[str] = None
+    end_time: Optional[str] = None,
+    resolution: str = Query("auto", pattern="^(auto|raw|1m|1h)$"),
+    since: Optional[int] = None,
+    since_ts: Optional[int] = None,
+    fields: Optional[str] = None,
+    response_format: Optional[str] = Query(None, alias="format")
 ):
-    """获取指定品牌的价格历史数据"""
+    """获取指定品牌的价格历史数据
+
+    resolution为raw时返回原始记录，为1m/1h时返回分钟/小时聚合（开高低收、均价、记录数）；
+    默认auto：指定了开始时间时按时间跨度选择能在limit个点内覆盖该范围的最细粒度，否则返回原始记录。
+    提供since或since_ts时只返回比游标新的原始记录（见getRealTimePrice的增量模式）。
+    format（或Accept头）可选columnar/msgpack/arrow，history按列返回，见response_formats.py；
+    fields为history中每条记录保留的字段（逗号分隔，如time,close），默认全部字段
+    """
+    output = negotiate(request, response_format)
+    selected = _parse_fields(fields, _HISTORY_FIELDS) if fields else None
+    
     # 检查品牌是否存在
     if name not in ["苹果", "小米", "华为", "oppo", "vivo", "一加"]:
         raise HTTPException(status_code=400, detail={"code": -999, "message": "无效的品牌名称"})
     
-    # 构建查询
-    query = RealTimePrice.filter(name=name).order_by("time")
+    cursor = _delta_cursor(since, since_ts)
+    if cursor is not None:
+        delta = await _ticks_since([await get_instrument_id(name)], cursor, min(limit, 1000))
+        return render({
+            "code": 200,
+            "data": {
+                "name": name,
+                "resolution": "raw",
+                "seq": delta["seq"],
+                "history": _project([{"time": t["time"], "value": t["value"], "seq": t["seq"]} for t in delta["ticks"]], selected)
+            }
+        }, "history", output)
     
-    # 添加时间范围过滤（如果提供）
+    # 解析时间范围（如果提供）
+    start_ts = end_ts = None
     if start_time:
         try:
-            start_datetime = datetime.strptime(start_time, "%Y-%m-%d %H:%M:%S")
-            query = query.filter(time__gte=start_datetime)
+            start_ts = datetime_to_ts(datetime.strptime(start_time, "%Y-%m-%d %H:%M:%S"))
         except ValueError:
             raise HTTPException(status_code=400, detail={"code": -999, "message": "无效的开始时间格式，应为YYYY-MM-DD HH:MM:SS"})
     
     if end_time:
         try:
-            end_datetime = datetime.strptime(end_time, "%Y-%m-%d %H:%M:%S")
-            query = query.filter(time__lte=end_datetime)
+            end_ts = datetime_to_ts(datetime.strptime(end_time, "%Y-%m-%d %H:%M:%S"))
         except ValueError:
             raise HTTPException(status_code=400, detail={"code": -999, "message": "无效的结束时间格式，应为YYYY-MM-DD HH:MM:SS"})
     
@@ -452,21 +679,391 @@ async def get_price_history(
     if limit > 1000:
         limit = 1000  # 最多返回1000条记录
     
-    # 执行查询
-    history_data = await query.limit(limit)
+    instrument_id = await get_instrument_id(name)
     
-    # 格式化结果
+    if resolution == "auto":
+        resolution = choose_resolution((end_ts or now_ts()) - start_ts, limit) if start_ts is not None else "raw"
+    
+    # 读取预聚合的分钟/小时数据，未指定开始时间时返回截至结束时间的最近limit个时间桶
+    if resolution != "raw":
+        end = end_ts or now_ts()
+        start = start_ts if start_ts is not None else end - (limit - 1) * ROLLUPS[resolution][1]
+        return render({
+            "code": 200,
+            "data": {
+                "name": name,
+                "resolution": resolution,
+                "history": _project(await rollup_history(instrument_id, resolution, start, end, limit), selected)
+            }
+        }, "history", output)
+    
+    # 开始时间早于归档水位线时，先从归档文件读取已归档的部分，其余从热数据表读取
     formatted_data = []
-    for item in history_data:
+    archive_until = archived_until().get(instrument_id)
+    if start_ts is not None and archive_until is not None and start_ts <= archive_until:
+        archive_end = archive_until if end_ts is None else min(end_ts, archive_until)
+        for ts, price in await read_archive(instrument_id, start_ts, archive_end, limit):
+            formatted_data.append({
+                "time": str(ts_to_datetime(ts)),
+                "value": price / PRICE_SCALE
+            })
+        start_ts = archive_until + 1
+    
+    # 执行查询：未指定开始时间时返回截至结束时间的最近limit条记录
+    history_data = []
+    if len(formatted_data) < limit:
+        newest = start_ts is None
+        history_data = await _PRICE_HISTORY.execute(
+            newest, start_ts is not None, end_ts is not None,
+            instrument_id=instrument_id, start=start_ts, end=end_ts, limit=limit - len(formatted_data)
+        )
+        if newest:
+            history_data.reverse()
+    
+    # 格式化结果
+    for ts, price in history_data:
         formatted_data.append({
-            "time": str(item.time),
-            "value": item.value
+            "time": str(ts_to_datetime(ts)),
+            "value": price / PRICE_SCALE
         })
     
-    return {
+    return render({
         "code": 200,
         "data": {
             "name": name,
-            "history": formatted_data
+            "resolution": "raw",
+            "history": _project(formatted_data, selected)
+        }
+    }, "history", output)
+
+
+
+@router.post("/mall/getPricesAsOf", response_model=Dict[str, Any])
+async def get_prices_as_of(query: PriceAsOfQuery):
+    """批量查询各品牌在一组时间点的价格（该时间点及之前最近的一条记录）
+
+    返回按列组织的结果：series中每个品牌的values与timestamps一一对应，tick_ts为实际使用的记录的时间戳，
+    时间点之前没有任何记录时两者均为null
+    """
+    instrument_ids = [await _brand_id(name) for name in query.names]
+    if query.times:
+        try:
+            timestamps = [datetime_to_ts(datetime.strptime(t, "%Y-%m-%d %H:%M:%S")) for t in query.times]
+        except ValueError:
+            raise HTTPException(status_code=400, detail={"code": -999, "message": "无效的时间格式，应为YYYY-MM-DD HH:MM:SS"})
+    else:
+        timestamps = query.timestamps
+    if not timestamps or len(timestamps) > MAX_ASOF_POINTS:
+        raise HTTPException(status_code=400, detail={"code": -999, "message": f"时间点数量应在1到{MAX_ASOF_POINTS}之间"})
+    
+    points = np.asarray(timestamps, dtype=np.int64)
+    series = await load_series(instrument_ids, int(points.min()), int(points.max()))
+    result = []
+    for name, instrument_id in zip(query.names, instrument_ids):
+        tick_ts, prices = as_of(series[instrument_id], points)
+        result.append({
+            "name": name,
+            "values": [p / PRICE_SCALE if t >= 0 else None for t, p in zip(tick_ts.tolist(), prices.tolist())],
+            "tick_ts": [t if t >= 0 else None for t in tick_ts.tolist()]
+        })
+    return {"code": 200, "data": {"timestamps": points.tolist(), "series": result}}
+
+
+@router.get("/mall/getCorrelation", response_model=Dict[str, Any])
+async def get_correlation(
+    names: Optional[str] = None,
+    window: int = Query(3600, gt=0),
+    end_time: Optional[str] = None,
+    resolution: str = Query("auto", pattern="^(auto|raw|1m|1h)$")
+):
+    """计算各品牌在截至end_time（默认现在）的window秒内的对数收益率相关系数矩阵、协方差矩阵和波动率
+
+    names默认为全部真实品牌，也可以指定已登记的模拟品牌（最多MAX_INSTRUMENTS个）；resolution默认按时间跨度自动选择网格粒度
+    （最多1000个网格点），数据已经不会再变化的时间范围按网格对齐后缓存
+    """
+    brands = names.split(",") if names else ["苹果", "小米", "华为", "oppo", "vivo", "一加"]
+    if len(set(brands)) != len(brands):
+        raise HTTPException(status_code=400, detail={"code": -999, "message": "无效的品牌名称"})
+    if len(brands) > MAX_INSTRUMENTS:
+        raise HTTPException(status_code=400, detail={"code": -999, "message": f"一次最多计算{MAX_INSTRUMENTS}个品牌"})
+    # 缓存中没有的品牌（如启动后新登记的模拟品牌）从数据库加载
+    instrument_ids = [await _brand_id(brand) for brand in brands]
+    end_ts = now_ts()
+    if end_time:
+        try:
+            end_ts = datetime_to_ts(datetime.strptime(end_time, "%Y-%m-%d %H:%M:%S"))
+        except ValueError:
+            raise HTTPException(status_code=400, detail={"code": -999, "message": "无效的结束时间格式，应为YYYY-MM-DD HH:MM:SS"})
+    
+    result = await correlation(instrument_ids, end_ts - window * 1000, end_ts, resolution)
+    return {
+        "code": 200,
+        "data": {
+            "names": brands,
+            "resolution": result["resolution"],
+            "start_time": str(ts_to_datetime(result["start"])),
+            "end_time": str(ts_to_datetime(result["end"])),
+            "points": result["points"],
+            "volatility": result["volatility"],
+            "correlation": result["correlation"],
+            "covariance": result["covariance"]
         }
-    }
\ No newline at end of file
+    }
+
+# 技术指标和价格推送
+def _indicator_item(name: str, values: Optional[Dict]) -> Dict[str, Any]:
+    """指标从定点值换算为价格；该品牌还没有任何记录时指标为空"""
+    if values is None:
+        return {"name": name, "time": None, "value": None, "indicators": {}}
+    indicators = {}
+    for window, item in values["windows"].items():
+        indicators[str(window)] = {
+            "count": item["count"],
+            "sma": round(item["sma"] / PRICE_SCALE, 4),
+            "ema": round(item["ema"] / PRICE_SCALE, 4),
+            "min": item["min"] / PRICE_SCALE,
+            "max": item["max"] / PRICE_SCALE,
+            "volatility": item["volatility"],
+            "twap": round(item["twap"] / PRICE_SCALE, 4)
+        }
+    return {
+        "name": name,
+        "time": str(ts_to_datetime(values["ts"])),
+        "value": values["price"] / PRICE_SCALE,
+        "indicators": indicators
+    }
+
+
+@router.get("/mall/getIndicators", response_model=Dict[str, Any])
+async def get_indicators(names: Optional[str] = None):
+    """获取各品牌（names逗号分隔，默认全部品牌）当前的技术指标
+
+    指标由价格生成任务逐批增量更新，按窗口（最近N条记录）分组：sma/ema移动平均、min/max最低/最高价、
+    volatility对数收益率标准差、twap时间加权平均价
+    """
+    brands = _parse_brands(names)
+    data = []
+    for brand in brands:
+        data.append(_indicator_item(brand, INDICATORS.values(await get_instrument_id(brand))))
+    return {"code": 200, "data": data}
+
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.get("/mall/streamPrices")
+async def stream_prices(names: Optional[str] = None, indicators: bool = False, owner: Optional[str] = None):
+    """订阅实时价格推送（Server-Sent Events）
+
+    连接后先发送一条ticks事件（各品牌的最新价格和当前游标），之后每批新价格发送一条ticks事件，
+    数据格式与增量拉取相同；indicators=true时每条ticks事件之后再发送一条indicators事件（这些品牌的当前指标）；
+    指定owner时，该接收者的价格提醒触发后发送alert事件（不限于names中的品牌）
+    """
+    brands = _parse_brands(names)
+    instrument_ids = [await get_instrument_id(brand) for brand in brands]
+    subscription = PRICE_STREAM.subscribe(instrument_ids, indicators, owner)
+    
+    async def events():
+        try:
+            yield _sse("ticks", await _ticks_since(instrument_ids, 0, MAX_DELTA_TICKS))
+            while True:
+                try:
+                    event, payload = await asyncio.wait_for(subscription.queue.get(), STREAM_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event == "ticks":
+                    ids, ts, prices = payload
+                    ticks = sorted(zip(ids.tolist(), ts.tolist(), prices.tolist()), key=lambda t: tick_seq(t[1], t[0]))
+                    yield _sse("ticks", {
+                        "seq": tick_seq(ticks[-1][1], ticks[-1][0]),
+                        "ticks": [_tick_item(*tick) for tick in ticks]
+                    })
+                    if subscription.indicators:
+                        yield _sse("indicators", [
+                            _indicator_item(_INSTRUMENT_NAMES.get(i, ""), INDICATORS.values(i)) for i in dict.fromkeys(ids.tolist())
+                        ])
+                elif event == "alert":
+                    yield _sse("alert", _triggered_item(payload))
+                else:
+                    yield _sse(event, payload)
+        finally:
+            PRICE_STREAM.unsubscribe(subscription)
+    
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+# 价格提醒
+def _alert_item(alert: PriceAlert) -> Dict[str, Any]:
+    return {
+        "id": alert.id,
+        "owner": alert.owner,
+        "name": _INSTRUMENT_NAMES.get(alert.instrument_id, ""),
+        "condition": alert.condition,
+        "value": alert.value,
+        "window": alert.window,
+        "active": alert.active,
+        "create_time": str(alert.create_time),
+        "triggered_time": str(ts_to_datetime(alert.triggered_ts)) if alert.triggered_ts is not None else None,
+        "triggered_price": alert.triggered_price / PRICE_SCALE if alert.triggered_price is not None else None
+    }
+
+
+def _triggered_item(triggered: Triggered) -> Dict[str, Any]:
+    alert = triggered.alert
+    return {
+        "id": alert.id,
+        "owner": alert.owner,
+        "name": _INSTRUMENT_NAMES.get(alert.instrument_id, ""),
+        "condition": alert.condition,
+        "value": alert.value / PRICE_SCALE if alert.condition in ("above", "below") else alert.value,
+        "window": alert.window,
+        "time": str(ts_to_datetime(triggered.ts)),
+        "price": triggered.price / PRICE_SCALE,
+        "seq": tick_seq(triggered.ts, alert.instrument_id)
+    }
+
+
+@router.post("/mall/addPriceAlert", response_model=Dict[str, Any])
+async def add_price_alert(alert_data: PriceAlertCreate):
+    """登记价格提醒：above/below为价格达到value，drop/rise为window秒内从最高点下跌/从最低点上涨value%
+
+    提醒触发一次后失效，通过 /mall/streamPrices?owner=... 推送给接收者
+    """
+    instrument_id = await _brand_id(alert_data.name)
+    if alert_data.condition not in CONDITIONS:
+        raise HTTPException(status_code=400, detail={"code": -999, "message": f"无效的提醒条件，可选值: {', '.join(CONDITIONS)}"})
+    if alert_data.value <= 0 or (alert_data.condition == "drop" and alert_data.value >= 100):
+        raise HTTPException(status_code=400, detail={"code": -999, "message": "无效的提醒数值"})
+    window = None
+    if alert_data.condition in ("drop", "rise"):
+        if not alert_data.window or alert_data.window <= 0:
+            raise HTTPException(status_code=400, detail={"code": -999, "message": "跌幅/涨幅提醒需要指定时间窗口（秒）"})
+        window = alert_data.window
+    
+    alert = await PriceAlert.create(
+        owner=alert_data.owner,
+        instrument_id=instrument_id,
+        condition=alert_data.condition,
+        value=alert_data.value,
+        window=window
+    )
+    ALERTS.add(alert.to_alert())
+    return {"code": 200, "data": _alert_item(alert), "message": "添加成功"}
+
+
+@router.get("/mall/getPriceAlerts", response_model=Dict[str, Any])
+async def get_price_alerts(owner: str, active: Optional[bool] = None):
+    """获取某个接收者的价格提醒，active=true/false只返回未触发/已触发的提醒"""
+    query = PriceAlert.filter(owner=owner).order_by("-id")
+    if active is not None:
+        query = query.filter(active=active)
+    return {"code": 200, "data": [_alert_item(alert) for alert in await query]}
+
+
+@router.delete("/mall/deletePriceAlert", response_model=Dict[str, Any])
+async def delete_price_alert(id: int):
+    deleted = await PriceAlert.filter(id=id).delete()
+    if not deleted:
+        raise HTTPException(status_code=400, detail={"code": -999, "message": "参数不正确"})
+    ALERTS.remove(id)
+    return {"code": 200, "message": "删除成功"}
+
+
+# 批量请求
+# 单次批量请求最多包含的子请求数
+MAX_BATCH_REQUESTS = 20
+
+# 不能放在批量请求中的接口（批量请求本身、流式推送）
+_BATCH_EXCLUDED = ("/api/batch", "/api/mall/streamPrices")
+
+
+def _query_value(value: Any) -> str:
+    return str(value).lower() if isinstance(value, bool) else str(value)
+
+
+async def _run_batch_item(request: Request, item: BatchItem) -> Dict[str, Any]:
+    """在进程内执行一个子请求：直接交给应用的路由，不经过中间件，返回状态码和响应体"""
+    path, _, query = item.url.partition("?")
+    path = "/" + path.lstrip("/")
+    if not path.startswith("/api/"):
+        path = "/api" + path
+    if path in _BATCH_EXCLUDED:
+        return {"status": 400, "body": {"detail": {"code": -999, "message": "该接口不支持批量请求"}}}
+    if not is_read_request(item.method.upper(), path):
+        # 批量请求整体按读请求路由，其中的写操作改用主库
+        use_primary()
+    
+    params = urlencode([
+        (key, _query_value(value))
+        for key, values in item.params.items()
+        for value in (values if isinstance(values, list) else [values])
+    ])
+    body = json.dumps(item.body).encode() if item.body is not None else b""
+    headers = [(b"accept", b"application/json")]
+    if body:
+        headers.append((b"content-type", b"application/json"))
+    # 沿用批量请求的scope（应用、异常处理器等），替换为子请求的方法、路径、参数和请求头
+    scope = {
+        **request.scope,
+        "method": item.method.upper(),
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": "&".join(part for part in (query, params) if part).encode(),
+        "headers": headers,
+    }
+    for key in ("route", "endpoint", "path_params"):
+        scope.pop(key, None)
+    
+    received = False
+    
+    async def receive():
+        nonlocal received
+        if received:
+            return {"type": "http.disconnect"}
+        received = True
+        return {"type": "http.request", "body": body, "more_body": False}
+    
+    status = 500
+    content_type = ""
+    chunks: List[bytes] = []
+    
+    async def send(message):
+        nonlocal status, content_type
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            content_type = next((v.decode("latin-1") for k, v in message["headers"] if k == b"content-type"), "")
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+    
+    try:
+        await request.app.router(scope, receive, send)
+    except StarletteHTTPException as e:
+        return {"status": e.status_code, "body": {"detail": e.detail}}
+    except DB_ERRORS as e:
+        status, detail = error_response(e)
+        return {"status": status, "body": {"detail": detail}}
+    except Exception as e:
+        print(f"批量请求中的子请求 {item.method} {item.url} 出错: {e}")
+        return {"status": 500, "body": {"detail": {"code": -999, "message": "服务器内部错误"}}}
+    
+    content = b"".join(chunks)
+    if content_type.startswith("application/json"):
+        return {"status": status, "body": json.loads(content) if content else None}
+    # 非JSON响应（如format=msgpack）以base64返回
+    return {"status": status, "content_type": content_type, "body": base64.b64encode(content).decode()}
+
+
+@router.post("/batch", response_model=Dict[str, Any])
+async def batch(request: Request, batch_request: BatchRequest):
+    """批量请求：在进程内并发执行多个子请求，一次返回全部结果
+
+    请求体为 {"requests": [{"method": "GET", "url": "/home/getTableData", "params": {...}, "body": {...}}, ...]}，
+    data为与requests一一对应的 {"status": 状态码, "body": 子请求的响应体}，单个子请求失败不影响其他子请求
+    """
+    if not batch_request.requests or len(batch_request.requests) > MAX_BATCH_REQUESTS:
+        raise HTTPException(status_code=400, detail={"code": -999, "message": f"子请求数量应在1到{MAX_BATCH_REQUESTS}之间"})
+    results = await asyncio.gather(*(_run_batch_item(request, item) for item in batch_request.requests))
+    return {"code": 200, "data": list(results)}
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+后端基准测试脚本
+默认使用SQLite内存数据库启动完整应用（自动建表并初始化数据），无需MySQL即可在本机或CI上运行
+用法: python benchmark.py [每个接口的请求次数]
+如需测试MySQL，设置 DB_BACKEND=mysql 后再运行
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+# 必须在导入应用之前设置，未显式指定时使用SQLite内存数据库
+os.environ.setdefault("DB_BACKEND", "sqlite")
+os.environ.setdefault("SQLITE_PATH", ":memory:")
+
+import httpx
+from tortoise import connections
+
+from main import app
+from api import _ACCOUNT_MENUS, _ACCOUNT_BY_USERNAME, _LATEST_PRICE, _PRICE_HISTORY, _USER_PAGE, _USER_FIELDS
+from database import Account, Product, get_db_display_url, get_instrument_id
+
+# 参与测试的只读接口
+GET_ENDPOINTS = [
+    "/api/home/getTableData",
+    "/api/home/getCountData",
+    "/api/home/getChartData",
+    "/api/user/getUserData?page=1&limit=10",
+    "/api/user/getSalespeople",
+    "/api/mall/getRealTimePrice",
+    "/api/mall/getPriceHistory?name=苹果&limit=100",
+]
+
+
+def format_stats(samples):
+    """把耗时样本（秒）格式化为毫秒统计信息"""
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    return (f"mean={statistics.mean(samples) * 1000:8.3f}ms  "
+            f"p50={statistics.median(samples) * 1000:8.3f}ms  "
+            f"p95={p95 * 1000:8.3f}ms")
+
+
+async def bench_endpoints(client, rounds):
+    """逐个接口发起请求，统计端到端耗时"""
+    print(f"\n--- 接口耗时（每个接口 {rounds} 次） ---")
+    for path in GET_ENDPOINTS:
+        samples = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            response = await client.get(path)
+            samples.append(time.perf_counter() - start)
+            response.raise_for_status()
+        print(f"{path:45s} {format_stats(samples)}")
+
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        response = await client.post("/api/permission/getMenu", json={"username": "admin", "password": "admin"})
+        samples.append(time.perf_counter() - start)
+        response.raise_for_status()
+    print(f"{'/api/permission/getMenu':45s} {format_stats(samples)}")
+
+
+async def bench_orm_overhead(rounds):
+    """对比同一查询经ORM执行与直接执行SQL的耗时，用于区分ORM开销和数据库开销"""
+    print(f"\n--- ORM开销 vs 数据库开销（{rounds} 次） ---")
+    conn = connections.get("default")
+    sql = "SELECT id, name, today_buy, month_buy, total_buy FROM products"
+
+    orm_samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        await Product.all()
+        orm_samples.append(time.perf_counter() - start)
+
+    raw_samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        await conn.execute_query_dict(sql)
+        raw_samples.append(time.perf_counter() - start)
+
+    print(f"{'ORM  Product.all()':45s} {format_stats(orm_samples)}")
+    print(f"{'RAW  execute_query_dict':45s} {format_stats(raw_samples)}")
+    overhead = statistics.mean(orm_samples) - statistics.mean(raw_samples)
+    print(f"{'ORM平均额外开销':45s} {overhead * 1000:8.3f}ms")
+
+
+async def bench_sql_templates(rounds):
+    """对比热点查询经ORM构建执行与使用预编译SQL模板执行的CPU耗时（每次调用的平均值）"""
+    print(f"\n--- 预编译SQL模板 vs ORM（{rounds} 次，CPU时间） ---")
+    account = await Account.get(username="admin")
+    cases = [
+        ("最新价格", _LATEST_PRICE, (), {"instrument_id": await get_instrument_id("苹果")}),
+        ("价格历史范围", _PRICE_HISTORY, (False, True, True),
+         {"instrument_id": await get_instrument_id("苹果"), "start": 0, "end": 2 ** 62, "limit": 100}),
+        ("用户分页", _USER_PAGE, (tuple(_USER_FIELDS),), {"offset": 0, "limit": 10}),
+        ("账户", _ACCOUNT_BY_USERNAME, (), {"username": "admin"}),
+        ("账户菜单", _ACCOUNT_MENUS, (), {"account_id": account.id}),
+    ]
+    for label, template, shape, params in cases:
+        await template.execute(*shape, **params)  # 编译
+        timings = []
+        for run in (lambda: template.build(*shape, **params), lambda: template.execute(*shape, **params)):
+            start = time.process_time()
+            for _ in range(rounds):
+                await run()
+            timings.append((time.process_time() - start) / rounds)
+        orm, compiled = timings
+        print(f"{label:12s} ORM={orm * 1e6:8.1f}us  模板={compiled * 1e6:8.1f}us  "
+              f"节省={(orm - compiled) * 1e6:8.1f}us ({(1 - compiled / orm) * 100:4.1f}%)")
+
+
+async def main(rounds):
+    print(f"数据库: {get_db_display_url()}")
+    # 手动驱动应用的lifespan，使数据库注册、建表和启动事件都和正式运行一致
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            await bench_endpoints(client, rounds)
+        await bench_orm_overhead(rounds)
+        await bench_sql_templates(rounds)
+
+
+if __name__ == "__main__":
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    asyncio.run(main(rounds))
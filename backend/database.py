@@ -1,5 +1,7 @@
-from tortoise import fields
+from tortoise import Tortoise, connections, fields
+from tortoise import timezone as tz_utils
 from tortoise.models import Model
+from tortoise.exceptions import OperationalError
 from tortoise.contrib.fastapi import register_tortoise
 from typing import Dict, Any, List, Optional
 import os
@@ -7,11 +9,62 @@ import json
 import asyncio
 import random
 import time
-from datetime import datetime
+from collections import deque
+from itertools import islice
+from datetime import datetime, timedelta, timezone as dt_timezone
+import numpy as np
+from db_replicas import ReplicaRouter, configure_replicas, read_connection
+from metrics import GENERATOR_TICKS, GENERATOR_ROWS, GENERATOR_FLUSH, GENERATOR_LAST_TICK, GENERATOR_BUFFERED, GENERATOR_SHED
+from db_guard import DB_ERRORS, deadline
+from price_simulator import PriceSimulator, SIM_SEED, build_simulator
+from price_window import RECENT_TICKS
+from price_indicators import INDICATORS
+from price_stream import PRICE_STREAM
+from price_alerts import ALERTS, Alert, Triggered
+from price_snapshot import SNAPSHOT_PATH, SNAPSHOT_INTERVAL, build_snapshot, write_snapshot, read_snapshot, restore_snapshot
+from price_replay import (
+    GENERATOR_MODE, SUPPORTED_MODES, SIM_START, SIM_SPEED, SIM_DURATION, REPLAY_SOURCE, REPLAY_REBASE, REPLAY_BATCH_MS,
+    WallClock, VirtualClock, simulated_batches, replay_records, replayed_batches,
+)
 
 # 数据库模型定义
 
+# 支持的数据库后端：mysql（默认，生产使用）、sqlite（本地/CI/基准测试，无需安装MySQL）
+SUPPORTED_DB_BACKENDS = ("mysql", "sqlite")
+
+
+def get_db_backend() -> str:
+    """获取当前选择的数据库后端（由DB_BACKEND环境变量决定）"""
+    backend = os.getenv('DB_BACKEND', 'mysql').strip().lower()
+    if backend not in SUPPORTED_DB_BACKENDS:
+        raise ValueError(f"不支持的数据库后端: {backend}，可选值: {', '.join(SUPPORTED_DB_BACKENDS)}")
+    return backend
+
+
+def is_memory_db() -> bool:
+    """当前是否使用SQLite内存数据库（每个进程独立、启动时为空）"""
+    return get_db_backend() == 'sqlite' and os.getenv('SQLITE_PATH', ':memory:') == ':memory:'
+
+
+def should_auto_init() -> bool:
+    """应用启动时是否自动创建表结构并初始化数据
+
+    内存数据库每次启动都是空的，因此默认开启；其他情况默认关闭，仍通过init_database.py处理
+    """
+    default = 'true' if is_memory_db() else 'false'
+    return os.getenv('DB_AUTO_INIT', default).strip().lower() in ('1', 'true', 'yes')
+
+
 def get_db_url() -> str:
+    """根据DB_BACKEND构建数据库连接字符串，所有脚本统一从这里获取"""
+    if get_db_backend() == 'sqlite':
+        path = os.getenv('SQLITE_PATH', ':memory:')
+        if path == ':memory:':
+            # 内存数据库不需要日志文件，直接放在内存中
+            return "sqlite://:memory:?journal_mode=MEMORY"
+        # 磁盘文件使用WAL模式：读写互不阻塞，synchronous=NORMAL在WAL下足够安全且写入更快
+        return f"sqlite://{path}?journal_mode=WAL&synchronous=NORMAL"
+
     # 从环境变量获取数据库配置参数
     DB_USERNAME = os.getenv('DB_USERNAME', 'root')
     DB_PASSWORD = os.getenv('DB_PASSWORD', '123456')  # 使用.env中的密码作为默认值
@@ -24,6 +77,28 @@ def get_db_url() -> str:
     return DATABASE_URL
 
 
+def get_replica_urls() -> List[str]:
+    """只读副本的连接字符串：SQLite为SQLITE_REPLICA_PATHS（逗号分隔的文件路径），
+    MySQL为DB_REPLICA_HOSTS（逗号分隔的host[:port]，用户名、密码和库名与主库相同）；未配置时为空"""
+    if get_db_backend() == 'sqlite':
+        paths = [path.strip() for path in os.getenv('SQLITE_REPLICA_PATHS', '').split(',') if path.strip()]
+        return [f"sqlite://{path}?journal_mode=WAL&synchronous=NORMAL" for path in paths]
+    hosts = [host.strip() for host in os.getenv('DB_REPLICA_HOSTS', '').split(',') if host.strip()]
+    primary = get_db_url()
+    prefix, _, database = primary.rpartition('/')
+    credentials = prefix.rpartition('@')[0]
+    return [f"{credentials}@{host if ':' in host else host + ':3306'}/{database}" for host in hosts]
+
+
+def get_db_display_url() -> str:
+    """用于日志输出的连接字符串（隐藏密码）"""
+    url = get_db_url()
+    password = os.getenv('DB_PASSWORD', '123456')
+    if get_db_backend() == 'mysql' and password:
+        url = url.replace(f":{password}@", ":******@", 1)
+    return url
+
+
 # 订单数据模型 - 对应order_data表
 class OrderData(Model):
     id = fields.IntField(pk=True, generated=True)
@@ -55,18 +130,302 @@ class WeekUserData(Model):
     class Meta:
         table = "week_user_data"
 
+# 品牌（交易品种）表 - 价格记录通过小整数ID引用品牌，不再每条记录重复存储品牌名
+class Instrument(Model):
+    id = fields.SmallIntField(pk=True, generated=True)
+    name = fields.CharField(max_length=100, unique=True)  # 品牌名称
+
+    class Meta:
+        table = "instruments"
+
+
+# 定点价格的缩放倍数：价格以"分"为单位的整数存储，避免浮点误差并缩小行宽
+PRICE_SCALE = 100
+
+# 品牌名称与ID的双向缓存，由load_instruments()加载
+_INSTRUMENT_IDS: Dict[str, int] = {}
+_INSTRUMENT_NAMES: Dict[int, str] = {}
+
+
+def datetime_to_ts(value: datetime) -> int:
+    """datetime转为毫秒时间戳（无时区的时间按Tortoise配置的时区解释）"""
+    if tz_utils.is_naive(value):
+        value = tz_utils.make_aware(value)
+    return int(round(value.timestamp() * 1000))
+
+
+def ts_to_datetime(ts: int) -> datetime:
+    """毫秒时间戳转为datetime，与Tortoise DatetimeField返回的形式保持一致"""
+    value = datetime.fromtimestamp(ts / 1000, tz=dt_timezone.utc)
+    return tz_utils.localtime(value) if tz_utils.get_use_tz() else tz_utils.make_naive(value)
+
+
+def now_ts() -> int:
+    """当前时间的毫秒时间戳"""
+    return int(time.time() * 1000)
+
+
 # 实时价格数据模型 - 对应real_time_price表
+# 紧凑的时序表结构：(instrument_id, ts) 复合主键（InnoDB聚簇索引 / SQLite WITHOUT ROWID），
+# 同一品牌的数据在物理上按时间连续存放，不再需要自增ID和(name, time)二级索引。
+# Tortoise不支持复合主键，模型中把ts声明为主键，实际表结构由create_price_tables()创建；
+# 因此不能按单个对象更新记录，删除也要同时带上instrument_id条件（见delete）
 class RealTimePrice(Model):
-    id = fields.IntField(pk=True, generated=True)
-    name = fields.CharField(max_length=100)  # 品牌名称
-    time = fields.DatetimeField(auto_now_add=True)  # 时间戳
-    value = fields.FloatField()  # 价格值
+    ts = fields.BigIntField(pk=True, generated=False)  # 毫秒时间戳
+    instrument = fields.ForeignKeyField('models.Instrument', related_name='ticks', db_constraint=False)
+    price = fields.IntField()  # 定点价格（实际价格 * PRICE_SCALE）
     
     class Meta:
         table = "real_time_price"
-        indexes = [
-            ("name", "time"),  # 在name和time字段上创建索引，提高查询效率
-        ]
+
+    @classmethod
+    def new_tick(cls, name: str, value: float, ts: Optional[int] = None) -> "RealTimePrice":
+        """根据品牌名称和价格构建一条（尚未保存的）价格记录"""
+        return cls(
+            instrument_id=_INSTRUMENT_IDS[name],
+            ts=now_ts() if ts is None else ts,
+            price=int(round(value * PRICE_SCALE)),
+        )
+
+    # 以下属性保持与原表结构(name, time, value)相同的访问方式
+    @property
+    def name(self) -> str:
+        return _INSTRUMENT_NAMES.get(self.instrument_id, "")
+
+    @property
+    def time(self) -> datetime:
+        return ts_to_datetime(self.ts)
+
+    @property
+    def value(self) -> float:
+        return self.price / PRICE_SCALE
+
+    async def save(self, *args, **kwargs) -> None:
+        # 价格记录只追加不修改；按ts主键更新会误改同一时刻其他品牌的记录
+        if self._saved_in_db:
+            raise TypeError("价格记录不支持修改")
+        await super().save(*args, **kwargs)
+
+    async def delete(self, using_db=None) -> None:
+        await RealTimePrice.filter(instrument_id=self.instrument_id, ts=self.ts).using_db(using_db).delete()
+
+
+# 价格聚合（分钟/小时K线）公共字段，由price_rollups.py根据原始价格记录增量维护
+# 与RealTimePrice相同，实际表结构为(instrument_id, bucket)复合主键，模型中把bucket声明为主键
+class PriceRollup(Model):
+    bucket = fields.BigIntField(pk=True, generated=False)  # 时间桶起始的毫秒时间戳
+    instrument = fields.ForeignKeyField('models.Instrument', related_name=False, db_constraint=False)
+    open = fields.IntField()  # 以下价格均为定点价格
+    high = fields.IntField()
+    low = fields.IntField()
+    close = fields.IntField()
+    total = fields.BigIntField()  # 桶内价格之和，用于计算均价
+    count = fields.IntField()  # 桶内原始记录数
+
+    class Meta:
+        abstract = True
+
+    @property
+    def time(self) -> datetime:
+        return ts_to_datetime(self.bucket)
+
+    @property
+    def avg(self) -> float:
+        return self.total / self.count / PRICE_SCALE if self.count else self.close / PRICE_SCALE
+
+
+class PriceRollupMinute(PriceRollup):
+    class Meta:
+        table = "price_rollup_1m"
+
+
+class PriceRollupHour(PriceRollup):
+    class Meta:
+        table = "price_rollup_1h"
+
+
+# 价格提醒，启动时加载到price_alerts.py的提醒引擎中，价格生成任务每写入一批检查一次，触发后失效
+class PriceAlert(Model):
+    id = fields.IntField(pk=True)
+    owner = fields.CharField(max_length=100, index=True)  # 提醒的接收者（如用户名），推送时按此匹配订阅者
+    instrument = fields.ForeignKeyField('models.Instrument', related_name=False, db_constraint=False)
+    condition = fields.CharField(max_length=10)  # above/below：价格达到阈值；drop/rise：window秒内从最高点下跌/从最低点上涨value%
+    value = fields.FloatField()  # above/below为价格，drop/rise为百分比
+    window = fields.IntField(null=True)  # drop/rise的时间窗口（秒）
+    active = fields.BooleanField(default=True, index=True)
+    create_time = fields.DatetimeField(auto_now_add=True)
+    triggered_ts = fields.BigIntField(null=True)  # 触发时间（毫秒时间戳）
+    triggered_price = fields.IntField(null=True)  # 触发时的定点价格
+
+    class Meta:
+        table = "price_alerts"
+
+    def to_alert(self) -> Alert:
+        """转换为提醒引擎使用的结构，阈值价格换算为定点价格"""
+        value = round(self.value * PRICE_SCALE) if self.condition in ("above", "below") else self.value
+        return Alert(self.id, self.owner, self.instrument_id, self.condition, value, self.window)
+
+
+async def insert_ticks(rows: List[tuple], ignore_duplicates: bool = False):
+    """批量写入价格记录，rows中每项为(instrument_id, ts, 定点价格)
+
+    模拟器每一步会产生所有品牌的记录，直接用一条executemany写入，不逐条构建模型对象；
+    ignore_duplicates时跳过已存在的记录（重试可能已部分写入的批次）
+    """
+    conn = connections.get("default")
+    mysql = conn.capabilities.dialect == "mysql"
+    placeholder = "%s" if mysql else "?"
+    insert = ("INSERT IGNORE" if mysql else "INSERT OR IGNORE") if ignore_duplicates else "INSERT"
+    await conn.execute_many(
+        f"{insert} INTO real_time_price (instrument_id, ts, price) VALUES ({placeholder}, {placeholder}, {placeholder})",
+        rows,
+    )
+
+
+# 数据库不可用时暂存的价格记录上限，超出时丢弃最早的记录
+TICK_BUFFER_ROWS = int(os.getenv("PRICE_TICK_BUFFER_ROWS", "200000"))
+
+# 每条executemany写入的最多记录数，恢复后分块补写暂存的记录，单条写入不会因为积压过多而超时
+TICK_WRITE_CHUNK = 5000
+
+# 等待写入的价格记录（之前写入失败的批次）
+_pending_ticks: deque = deque()
+
+
+async def write_ticks(rows: List[tuple]) -> bool:
+    """写入本批价格记录（连同之前暂存的记录），最多等待一个生成间隔（见_tick_deadline）
+
+    数据库不可用（熔断、超时、连接错误）时暂存到内存，下一轮继续写入，价格生成不会因此停顿；
+    暂存的记录按TICK_WRITE_CHUNK条分块写入，截止时间内没有写完的留到下一轮；
+    暂存超过TICK_BUFFER_ROWS条时丢弃最早的记录。返回是否全部写入
+    """
+    retrying = bool(_pending_ticks)
+    # 模拟和回放可能写入已存在的时间段（如不平移时间回放已有的数据），跳过已存在的记录
+    ignore_duplicates = retrying or GENERATOR_MODE != "live"
+    _pending_ticks.extend(rows)
+    overflow = len(_pending_ticks) - TICK_BUFFER_ROWS
+    if overflow > 0:
+        for _ in range(overflow):
+            _pending_ticks.popleft()
+        GENERATOR_SHED.inc(overflow)
+    try:
+        with deadline(_tick_deadline()):
+            while _pending_ticks:
+                chunk = list(islice(_pending_ticks, TICK_WRITE_CHUNK))
+                await insert_ticks(chunk, ignore_duplicates=ignore_duplicates)
+                for _ in range(len(chunk)):
+                    _pending_ticks.popleft()
+    except (*DB_ERRORS, OperationalError, OSError) as e:
+        if not retrying:
+            print(f"价格数据写入失败，暂存到内存等待重试: {e}")
+        GENERATOR_BUFFERED.set(len(_pending_ticks))
+        return False
+    if retrying:
+        print("数据库恢复，暂存的价格记录已全部补写")
+    GENERATOR_BUFFERED.set(0)
+    return True
+
+
+async def mark_alerts_triggered(triggered: List[Triggered]):
+    """把触发的提醒标记为失效，并记录触发时间和价格（一条executemany）"""
+    conn = connections.get("default")
+    placeholder = "%s" if conn.capabilities.dialect == "mysql" else "?"
+    await conn.execute_many(
+        f"UPDATE price_alerts SET active = {placeholder}, triggered_ts = {placeholder}, triggered_price = {placeholder} "
+        f"WHERE id = {placeholder}",
+        [(False, t.ts, t.price, t.alert.id) for t in triggered],
+    )
+
+
+async def load_price_alerts():
+    """把所有未触发的提醒加载到提醒引擎"""
+    alerts = await PriceAlert.filter(active=True)
+    ALERTS.load(alert.to_alert() for alert in alerts)
+    if alerts:
+        print(f"已加载{len(alerts)}条价格提醒")
+
+
+# real_time_price表的建表语句（复合主键无法由Tortoise自动生成）
+_PRICE_TABLE_DDL = {
+    "mysql": """CREATE TABLE IF NOT EXISTS `real_time_price` (
+    `instrument_id` SMALLINT NOT NULL,
+    `ts` BIGINT NOT NULL,
+    `price` INT NOT NULL,
+    PRIMARY KEY (`instrument_id`, `ts`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+    "sqlite": """CREATE TABLE IF NOT EXISTS "real_time_price" (
+    "instrument_id" SMALLINT NOT NULL,
+    "ts" BIGINT NOT NULL,
+    "price" INT NOT NULL,
+    PRIMARY KEY ("instrument_id", "ts")
+) WITHOUT ROWID""",
+}
+
+
+# 价格聚合表的建表语句，{table}为表名
+_ROLLUP_TABLE_DDL = {
+    "mysql": """CREATE TABLE IF NOT EXISTS `{table}` (
+    `instrument_id` SMALLINT NOT NULL,
+    `bucket` BIGINT NOT NULL,
+    `open` INT NOT NULL,
+    `high` INT NOT NULL,
+    `low` INT NOT NULL,
+    `close` INT NOT NULL,
+    `total` BIGINT NOT NULL,
+    `count` INT NOT NULL,
+    PRIMARY KEY (`instrument_id`, `bucket`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+    "sqlite": """CREATE TABLE IF NOT EXISTS "{table}" (
+    "instrument_id" SMALLINT NOT NULL,
+    "bucket" BIGINT NOT NULL,
+    "open" INT NOT NULL,
+    "high" INT NOT NULL,
+    "low" INT NOT NULL,
+    "close" INT NOT NULL,
+    "total" BIGINT NOT NULL,
+    "count" INT NOT NULL,
+    PRIMARY KEY ("instrument_id", "bucket")
+) WITHOUT ROWID""",
+}
+
+
+async def create_price_tables(conn=None):
+    """按紧凑结构创建real_time_price表和价格聚合表（已存在时跳过）"""
+    conn = conn or connections.get("default")
+    dialect = conn.capabilities.dialect
+    await conn.execute_script(_PRICE_TABLE_DDL[dialect])
+    for model in (PriceRollupMinute, PriceRollupHour):
+        await conn.execute_script(_ROLLUP_TABLE_DDL[dialect].format(table=model._meta.db_table))
+
+
+async def generate_schemas():
+    """创建全部表结构：先用自定义语句创建价格表，其余表由Tortoise生成（已存在的表会跳过）"""
+    await create_price_tables()
+    await Tortoise.generate_schemas(safe=True)
+
+
+async def load_instruments(names: Optional[List[str]] = None):
+    """确保所有品牌（默认为真实品牌）都已登记，并加载品牌名称与ID的缓存"""
+    names = list(_BASE_PRICES.keys()) if names is None else names
+    existing = set(await Instrument.all().values_list("name", flat=True))
+    missing = [name for name in names if name not in existing]
+    if missing:
+        await Instrument.bulk_create([Instrument(name=name) for name in missing])
+    # 先查询再一次性替换缓存，期间没有await，其他任务不会看到清空了一半的缓存
+    instruments = await Instrument.all()
+    _INSTRUMENT_IDS.clear()
+    _INSTRUMENT_NAMES.clear()
+    for instrument in instruments:
+        _INSTRUMENT_IDS[instrument.name] = instrument.id
+        _INSTRUMENT_NAMES[instrument.id] = instrument.name
+
+
+async def get_instrument_id(name: str) -> Optional[int]:
+    """获取品牌ID，缓存中没有时从数据库加载一次"""
+    if name not in _INSTRUMENT_IDS:
+        await load_instruments()
+    return _INSTRUMENT_IDS.get(name)
+
 
 # 存储各品牌的基础价格，用于生成浮动价格
 _BASE_PRICES = {
@@ -78,98 +437,268 @@ _BASE_PRICES = {
     "一加": 3500.0
 }
 
-# 价格浮动范围百分比
-_PRICE_FLUCTUATION_RANGE = 0.05  # 5%
+# 价格模拟器，由generate_real_time_price()按环境变量配置创建（回放模式下为None）
+_simulator: Optional[PriceSimulator] = None
+
+# 两次生成之间的间隔（秒），不配置时每次在2-5秒之间随机
+_TICK_INTERVAL = float(os.getenv("PRICE_TICK_INTERVAL") or 0)
 
-# 最大记录数
-MAX_RECORDS_PER_BRAND = 1000
+# 加速运行时每轮写入至少允许的时间（秒）
+_MIN_TICK_DEADLINE = 0.2
+
+
+def _tick_deadline() -> float:
+    """每轮写入数据库的截止时间（秒）：两批之间的真实间隔，写入不能拖慢下一批的生成
+
+    未配置PRICE_TICK_INTERVAL时取随机间隔的最小值；虚拟时钟和回放按倍速换算为真实时间
+    """
+    if GENERATOR_MODE == "replay":
+        interval = REPLAY_BATCH_MS / 1000
+    else:
+        interval = _TICK_INTERVAL or 2
+    if GENERATOR_MODE != "live" and SIM_SPEED > 0:
+        interval /= SIM_SPEED
+    return max(interval, _MIN_TICK_DEADLINE)
 
-# 全局变量，用于存储当前价格
-_current_prices = _BASE_PRICES.copy()
 
 # 数据生成任务标志
 _data_generation_task: Optional[asyncio.Task] = None
 
-async def generate_real_time_price():
-    """持续生成实时价格数据"""
-    global _current_prices, _data_generation_task
+
+def _to_fixed(prices: np.ndarray) -> np.ndarray:
+    """价格数组转换为定点价格"""
+    return np.rint(prices * PRICE_SCALE).astype(np.int64)
+
+
+def _tick_rows(ids: np.ndarray, ts: np.ndarray, fixed: np.ndarray) -> List[tuple]:
+    """把一批定点价格转换为insert_ticks()需要的记录"""
+    return list(zip(ids.tolist(), ts.tolist(), fixed.tolist()))
+
+
+def _sim_start() -> int:
+    """虚拟时钟的起点：PRICE_SIM_START，未配置时为当前时间"""
+    return datetime_to_ts(datetime.strptime(SIM_START, "%Y-%m-%d %H:%M:%S")) if SIM_START else now_ts()
+
+
+async def _price_source():
+    """按PRICE_GENERATOR_MODE创建价格数据源（见price_replay.py）"""
+    global _simulator
+    
+    if GENERATOR_MODE not in SUPPORTED_MODES:
+        raise ValueError(f"不支持的价格生成模式: {GENERATOR_MODE}，可选值: {', '.join(SUPPORTED_MODES)}")
+    
+    if GENERATOR_MODE == "replay":
+        await load_instruments()
+        clock = VirtualClock(_sim_start(), SIM_SPEED)
+        return replayed_batches(replay_records(REPLAY_SOURCE, dict(_INSTRUMENT_NAMES)), clock, REPLAY_REBASE, REPLAY_BATCH_MS)
+    
+    _simulator = build_simulator(_BASE_PRICES)
+    if GENERATOR_MODE == "simulate":
+        # 虚拟时钟模式从基础价格开始、不读取已有数据，保证相同配置的结果完全一致
+        await load_instruments(_simulator.names)
+        clock = VirtualClock(_sim_start(), SIM_SPEED)
+        return simulated_batches(_simulator, clock, _TICK_INTERVAL, SIM_SEED, SIM_DURATION)
     
     # 创建初始数据（每个品牌生成一些历史数据）
-    await init_initial_price_data()
+    await init_initial_price_data(_simulator)
+    return simulated_batches(_simulator, WallClock(), _TICK_INTERVAL)
+
+
+def _snapshot_enabled() -> bool:
+    """只有实时模式写入和使用快照；内存数据库每次启动都是空的，快照会与数据库不一致"""
+    return bool(SNAPSHOT_PATH) and GENERATOR_MODE == "live" and not is_memory_db()
+
+
+async def save_price_snapshot():
+    """保存价格生成状态快照（状态在事件循环中复制，文件在线程中写入）"""
+    if _simulator is None or not _snapshot_enabled():
+        return
+    table = build_snapshot(_simulator, RECENT_TICKS, _INSTRUMENT_IDS)
+    await asyncio.to_thread(write_snapshot, table)
+
+
+async def generate_real_time_price():
+    """持续生成实时价格数据"""
+    names: Optional[List[str]] = None
+    ids = np.zeros(0, dtype=np.int64)
+    next_snapshot = time.monotonic() + SNAPSHOT_INTERVAL
     
+    from price_rollups import mark_backfilled
+
     try:
-        while True:
-            # 为每个品牌生成新的价格数据
-            for brand, base_price in _BASE_PRICES.items():
-                # 生成随机浮动值（在基础价格的±5%范围内）
-                fluctuation = random.uniform(-_PRICE_FLUCTUATION_RANGE, _PRICE_FLUCTUATION_RANGE)
-                new_price = _current_prices[brand] * (1 + fluctuation)
-                
-                # 确保价格不会波动太大
-                max_price = base_price * (1 + _PRICE_FLUCTUATION_RANGE * 2)
-                min_price = base_price * (1 - _PRICE_FLUCTUATION_RANGE * 2)
-                new_price = max(min(new_price, max_price), min_price)
-                
-                # 更新当前价格
-                _current_prices[brand] = new_price
-                
-                # 创建新的价格记录
-                await RealTimePrice.create(
-                    name=brand,
-                    value=round(new_price, 2)
-                )
-                
-                # 清理旧数据，确保每个品牌不超过1000条记录
-                await cleanup_old_records(brand)
+        source = await _price_source()
+        # 最近价格窗口预热之后再加载价格提醒（时间窗口类提醒用窗口中的记录初始化）
+        await load_price_alerts()
+        async for batch_names, ts, prices in source:
+            tick_start = time.perf_counter()
             
-            # 等待一段时间后再次生成数据（每2-5秒生成一次）
-            await asyncio.sleep(random.uniform(2, 5))
+            # 模拟器每批的品牌列表是同一个对象，只在变化时重新映射品牌ID
+            if batch_names is not names:
+                missing = [name for name in dict.fromkeys(batch_names) if name not in _INSTRUMENT_IDS]
+                if missing:
+                    await load_instruments(missing)
+                names = batch_names
+                ids = np.array([_INSTRUMENT_IDS[name] for name in names], dtype=np.int64)
+            
+            # 每批价格一次批量写入，并追加到内存中的最近价格窗口
+            # 数据库不可用时暂存，内存中的价格、指标和推送照常更新
+            fixed = _to_fixed(prices)
+            await write_ticks(_tick_rows(ids, ts, fixed))
+            if GENERATOR_MODE != "live" and len(ts):
+                # 模拟和回放的时间戳可能早于聚合水位线，让聚合任务补上这段时间
+                mark_backfilled(int(ts.min()))
+            RECENT_TICKS.append(ids, ts, fixed)
+            # 增量更新技术指标，并推送给订阅了这些品牌的客户端
+            INDICATORS.update(ids, ts, fixed)
+            PRICE_STREAM.publish_ticks(ids, ts, fixed)
+            # 检查价格提醒，触发的提醒标记为失效后推送给提醒的接收者（标记失败时放回提醒引擎）
+            triggered = ALERTS.evaluate(ids, ts, fixed)
+            if triggered:
+                try:
+                    with deadline(_tick_deadline()):
+                        await mark_alerts_triggered(triggered)
+                except (*DB_ERRORS, OperationalError, OSError) as e:
+                    # 数据库中仍然有效：放回提醒引擎，下次触发时重新标记并推送
+                    print(f"更新{len(triggered)}条触发的价格提醒失败，稍后重试: {e}")
+                    for item in triggered:
+                        ALERTS.add(item.alert)
+                else:
+                    PRICE_STREAM.publish_alerts(triggered)
+            # 过期数据由分区维护任务按分区整体删除（见price_partitions.py），这里不再逐条清理
+            
+            # 记录本轮写入耗时和吞吐
+            GENERATOR_FLUSH.observe(time.perf_counter() - tick_start)
+            GENERATOR_TICKS.inc()
+            GENERATOR_ROWS.inc(len(ts))
+            GENERATOR_LAST_TICK.set(time.time())
+            
+            # 定期保存快照，重启时可以直接从快照恢复
+            if time.monotonic() >= next_snapshot:
+                next_snapshot = time.monotonic() + SNAPSHOT_INTERVAL
+                try:
+                    await save_price_snapshot()
+                except OSError as e:
+                    print(f"保存价格快照失败: {e}")
+        print("价格数据生成完成（模拟时长已到或回放数据已全部写入）")
     except asyncio.CancelledError:
         print("实时价格数据生成任务已取消")
     except Exception as e:
         print(f"实时价格数据生成任务出错: {e}")
 
-async def init_initial_price_data():
-    """初始化初始价格数据"""
-    # 检查是否已有数据
-    count = await RealTimePrice.all().count()
-    if count > 0:
-        # 如果已有数据，更新当前价格为最新价格
-        for brand in _BASE_PRICES.keys():
-            latest_price = await RealTimePrice.filter(name=brand).order_by('-time').first()
-            if latest_price:
-                _current_prices[brand] = latest_price.value
+
+# 预热时只读取最近这么长时间内的记录（秒），MySQL按ts分区时只会扫描最近的分区
+_WARM_START_WINDOW = int(os.getenv("PRICE_WARM_START_WINDOW", "3600"))
+
+# 每个品牌最近WINDOW_SIZE条记录（限定在预热时间范围内）；带上品牌ID条件，按主键(instrument_id, ts)逐个品牌范围扫描，
+# 只读取预热时间范围内的记录，不随表的大小增长
+_RECENT_TICKS_SQL = """SELECT instrument_id, ts, price FROM (
+    SELECT instrument_id, ts, price, ROW_NUMBER() OVER (PARTITION BY instrument_id ORDER BY ts DESC) AS rn
+    FROM real_time_price WHERE instrument_id IN ({ids}) AND ts >= {placeholder}
+) recent WHERE rn <= {placeholder} ORDER BY instrument_id, ts"""
+
+def latest_ticks_sql(placeholder: str, count: Optional[int] = None, before: bool = False) -> str:
+    """各品牌最新一条记录的查询：从品牌表出发，每个品牌按主键(instrument_id, ts)倒序各取一次时间戳和价格，
+    耗时只与品牌数有关，不随价格表的大小增长（不依赖MySQL的松散索引扫描）
+
+    count为品牌ID参数的个数（None为全部品牌）；before时只取早于某个时间戳的记录。
+    参数顺序：[时间戳, 时间戳（before时，两次）, 品牌ID...]
+    """
+    condition = f" AND ts < {placeholder}" if before else ""
+    where = f"\n    WHERE i.id IN ({', '.join([placeholder] * count)})" if count is not None else ""
+    return f"""SELECT instrument_id, ts, price FROM (
+    SELECT i.id AS instrument_id,
+        (SELECT ts FROM real_time_price WHERE instrument_id = i.id{condition} ORDER BY ts DESC LIMIT 1) AS ts,
+        (SELECT price FROM real_time_price WHERE instrument_id = i.id{condition} ORDER BY ts DESC LIMIT 1) AS price
+    FROM instruments i{where}
+) latest WHERE ts IS NOT NULL"""
+
+
+async def latest_ticks(instrument_ids: Optional[List[int]] = None) -> List[Dict[str, int]]:
+    """用一条查询获取各品牌（默认全部品牌）的最新一条记录：[{instrument_id, ts, price}, ...]"""
+    conn = connections.get(read_connection())
+    placeholder = "%s" if conn.capabilities.dialect == "mysql" else "?"
+    if instrument_ids is None:
+        return await conn.execute_query_dict(latest_ticks_sql(placeholder))
+    if not instrument_ids:
+        return []
+    return await conn.execute_query_dict(latest_ticks_sql(placeholder, len(instrument_ids)), list(instrument_ids))
+
+
+async def _snapshot_current(snapshot: Dict, names: List[str]) -> bool:
+    """快照是否包含数据库中各品牌的最新记录：异常退出时快照可能比数据库落后最多一个保存间隔，
+    用这样的快照恢复最近价格窗口会缺少中间的记录（增量拉取会漏掉这些记录，技术指标也不完整）"""
+    index = {name: i for i, name in enumerate(snapshot["names"])}
+    names = [name for name in names if name in index]
+    if not names:
+        return True
+    conn = connections.get("default")
+    placeholder = "%s" if conn.capabilities.dialect == "mysql" else "?"
+    ids = [_INSTRUMENT_IDS[name] for name in names]
+    latest = {row["instrument_id"]: row["ts"] for row in await conn.execute_query_dict(latest_ticks_sql(placeholder, len(ids)), ids)}
+    return all(latest.get(_INSTRUMENT_IDS[name], -1) <= int(snapshot["last_ts"][index[name]]) for name in names)
+
+
+async def init_initial_price_data(simulator: PriceSimulator):
+    """预热：恢复各品牌的当前价格和内存中的最近价格窗口，没有数据的品牌用一次批量写入生成初始历史数据
+
+    启动耗时与表的大小无关：最近的记录用一条窗口查询读取，只有在预热时间范围内没有记录的品牌才再查一次各品牌的最新价格
+    """
+    started = time.perf_counter()
+    await load_instruments(simulator.names)
+    
+    # 本地快照足够新、且不落后于数据库中的记录时直接恢复，只查询一次各品牌的最新时间戳
+    snapshot = read_snapshot() if _snapshot_enabled() else None
+    if snapshot and not await _snapshot_current(snapshot, simulator.names):
+        print("价格快照落后于数据库中的记录（上次可能没有正常停止），改为从数据库恢复")
+        snapshot = None
+    if snapshot and restore_snapshot(snapshot, simulator, RECENT_TICKS, _INSTRUMENT_IDS):
+        INDICATORS.load(RECENT_TICKS)
+        print(f"已从快照恢复价格数据（{(now_ts() - snapshot['saved_at']) / 1000:.0f}秒前保存），"
+              f"用时{(time.perf_counter() - started) * 1000:.1f}ms")
         return
     
-    # 为每个品牌生成一些历史数据
-    now = datetime.now()
-    for brand, base_price in _BASE_PRICES.items():
-        print(f"初始化{brand}的价格数据...")
-        # 生成50条历史数据，时间间隔为5秒
+    conn = connections.get("default")
+    placeholder = "%s" if conn.capabilities.dialect == "mysql" else "?"
+    
+    RECENT_TICKS.clear()
+    instrument_ids = [_INSTRUMENT_IDS[name] for name in simulator.names]
+    rows = await conn.execute_query_dict(
+        _RECENT_TICKS_SQL.format(ids=", ".join([placeholder] * len(instrument_ids)), placeholder=placeholder),
+        [*instrument_ids, now_ts() - _WARM_START_WINDOW * 1000, RECENT_TICKS.size]
+    )
+    restored = {row["instrument_id"] for row in rows}
+    if len(restored) < len(instrument_ids):
+        # 部分品牌最近没有数据（如服务停机较久），补充读取这些品牌的最新价格（每个品牌一次主键查找）
+        stale = [instrument_id for instrument_id in instrument_ids if instrument_id not in restored]
+        rows += await conn.execute_query_dict(latest_ticks_sql(placeholder, len(stale)), stale)
+    
+    # 为没有任何数据的品牌生成初始历史数据：模拟器从基础价格出发走50步，时间间隔为5秒，合并为一次批量写入
+    missing = {name for name in simulator.names} - {_INSTRUMENT_NAMES.get(row["instrument_id"]) for row in rows}
+    if missing:
+        print(f"初始化{len(missing)}个品牌的价格数据...")
+        ids = np.array([_INSTRUMENT_IDS[name] for name in simulator.names], dtype=np.int64)
+        seed = np.array([name in missing for name in simulator.names])
+        now = now_ts()
+        batches = []
         for i in range(50):
-            # 生成基于基础价格的随机价格
-            price = base_price * (1 + random.uniform(-0.1, 0.1))
-            # 计算历史时间戳
-            historical_time = now - datetime.timedelta(seconds=5*(50-i))
-            # 创建历史价格记录
-            await RealTimePrice.create(
-                name=brand,
-                value=round(price, 2),
-                time=historical_time
-            )
-        # 更新当前价格
-        _current_prices[brand] = base_price
-
-async def cleanup_old_records(brand: str):
-    """清理指定品牌的旧记录，确保不超过1000条"""
-    # 计算需要删除的记录数量
-    count = await RealTimePrice.filter(name=brand).count()
-    if count > MAX_RECORDS_PER_BRAND:
-        # 查询需要删除的记录
-        records_to_delete = await RealTimePrice.filter(name=brand).order_by('time').limit(count - MAX_RECORDS_PER_BRAND)
-        # 批量删除
-        for record in records_to_delete:
-            await record.delete()
+            ts, prices = simulator.step(now - 5000 * (50 - i))
+            batches.append((ids[seed], ts[seed], _to_fixed(prices[seed])))
+        seed_rows = [row for batch in batches for row in _tick_rows(*batch)]
+        await insert_ticks(seed_rows)
+        rows += [{"instrument_id": i, "ts": t, "price": p} for i, t, p in sorted(seed_rows)]
+    
+    # 恢复模拟器状态（最后一条记录的价格和时间戳）和最近价格窗口
+    for row in rows:
+        simulator.restore(_INSTRUMENT_NAMES[row["instrument_id"]], row["price"] / PRICE_SCALE, row["ts"])
+    if rows:
+        RECENT_TICKS.append(
+            np.array([row["instrument_id"] for row in rows], dtype=np.int64),
+            np.array([row["ts"] for row in rows], dtype=np.int64),
+            np.array([row["price"] for row in rows], dtype=np.int64),
+        )
+    INDICATORS.load(RECENT_TICKS)
+    print(f"价格数据预热完成：恢复{len(rows)}条记录，用时{(time.perf_counter() - started) * 1000:.1f}ms")
+
 
 async def start_price_generation():
     """启动价格生成任务"""
@@ -192,6 +721,11 @@ async def stop_price_generation():
             await _data_generation_task
         except asyncio.CancelledError:
             pass
+        # 停止时保存一次最新状态，正常重启可以直接从快照恢复
+        try:
+            await save_price_snapshot()
+        except OSError as e:
+            print(f"保存价格快照失败: {e}")
         print("实时价格数据生成任务已停止")
     
     _data_generation_task = None
@@ -273,18 +807,24 @@ class Menu(Model):
 
 # 注册数据库
 def register_db(app):
+    # 配置了只读副本时，副本注册为replica0、replica1...，由db_replicas.ReplicaRouter路由读查询
+    replica_urls = get_replica_urls()
+    replica_names = [f"replica{i}" for i in range(len(replica_urls))]
+    configure_replicas(replica_names)
     register_tortoise(
         app,
-        db_url=get_db_url(),
-        modules={"models": ["database"]},
-        generate_schemas=False,  # 不再自动创建表结构，通过独立脚本处理
+        config={
+            "connections": {"default": get_db_url(), **dict(zip(replica_names, replica_urls))},
+            "apps": {"models": {"models": ["database"], "default_connection": "default"}},
+            "routers": [ReplicaRouter] if replica_urls else [],
+        },
+        # 不自动创建表结构：由init_database.py处理，SQLite内存数据库在启动事件中调用generate_schemas()
+        generate_schemas=False,
         add_exception_handlers=True,
     )
 
 
 # 初始化数据
-import random
-import datetime
 from faker import Faker
 
 async def init_db():
@@ -418,7 +958,7 @@ async def init_db():
             # 随机生成年龄（18-65岁）
             age = random.randint(18, 65)
             # 随机生成出生日期
-            current_year = datetime.datetime.now().year
+            current_year = datetime.now().year
             birth_year = current_year - age
             birth_month = random.randint(1, 12)
             days_in_month = 31
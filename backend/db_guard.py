@@ -0,0 +1,251 @@
+"""
+数据库超时和熔断
+- 截止时间：DeadlineMiddleware按路由给/api下的每个请求设置截止时间（默认REQUEST_TIMEOUT秒，ROUTE_TIMEOUTS按路径覆盖，0为不限制），
+  请求中的每条查询以剩余时间作为超时；不在请求中的查询（后台任务）超时为DB_QUERY_TIMEOUT，价格生成任务以生成间隔为截止时间。
+  超时只取消客户端对查询的等待，请求返回504；服务器上的语句会继续执行到结束（MySQL可另外设置max_execution_time限制只读查询的执行时间）
+- 熔断器：统计最近DB_BREAKER_WINDOW条查询，失败（连接错误、超时）或慢查询（超过DB_BREAKER_SLOW_QUERY秒）的比例达到
+  DB_BREAKER_ERROR_RATE / DB_BREAKER_SLOW_RATE时打开；打开期间查询立即失败（返回503），不再排队等待连接，
+  DB_BREAKER_COOLDOWN秒后进入半开状态放行一条探测查询，成功则关闭，失败则继续打开。唯一约束冲突等由请求数据引起的错误不计入
+- 过期数据：@serve_stale的只读接口保存最近一次成功的响应，数据库不可用（熔断或超时）时返回该响应并带上X-Stale: 1头
+查询的超时和熔断通过db_hooks.set_query_guard()作用于所有数据库连接，不需要改动各处的查询代码
+"""
+import asyncio
+import functools
+import os
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import monotonic
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+from tortoise.exceptions import IntegrityError
+
+from db_replicas import read_connection
+from metrics import DB_BREAKER_REJECTED, DB_BREAKER_STATE, STALE_RESPONSES
+from single_flight import request_key
+
+# 请求的默认超时（秒），0为不限制
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "10"))
+
+# 不在请求中的查询（启动、后台任务）的超时（秒），0为不限制
+DB_QUERY_TIMEOUT = float(os.getenv("DB_QUERY_TIMEOUT", "30"))
+
+# 各路由的超时（秒），可用ROUTE_TIMEOUTS覆盖，如 /api/mall/getCorrelation=60,/api/batch=15
+ROUTE_TIMEOUTS: Dict[str, float] = {
+    "/api/mall/streamPrices": 0,  # 长连接推送，只读取内存
+    "/api/mall/getCorrelation": 30,
+    "/api/mall/getPricesAsOf": 30,
+}
+for _item in os.getenv("ROUTE_TIMEOUTS", "").split(","):
+    _path, _, _seconds = _item.partition("=")
+    if _path.strip() and _seconds.strip():
+        ROUTE_TIMEOUTS[_path.strip()] = float(_seconds)
+
+# 熔断器参数
+BREAKER_WINDOW = int(os.getenv("DB_BREAKER_WINDOW", "50"))
+BREAKER_MIN_CALLS = int(os.getenv("DB_BREAKER_MIN_CALLS", "20"))
+BREAKER_ERROR_RATE = float(os.getenv("DB_BREAKER_ERROR_RATE", "0.5"))
+BREAKER_SLOW_RATE = float(os.getenv("DB_BREAKER_SLOW_RATE", "0.8"))
+BREAKER_SLOW_QUERY = float(os.getenv("DB_BREAKER_SLOW_QUERY", "1.0"))
+BREAKER_COOLDOWN = float(os.getenv("DB_BREAKER_COOLDOWN", "5"))
+
+# 每个接口保存的过期响应数
+STALE_CACHE_SIZE = int(os.getenv("STALE_CACHE_SIZE", "256"))
+
+
+class DatabaseUnavailable(Exception):
+    """熔断器打开，查询没有执行"""
+
+
+class QueryTimeout(Exception):
+    """查询超过了请求的截止时间或查询超时"""
+
+
+# 数据库不可用时抛出的异常
+DB_ERRORS = (DatabaseUnavailable, QueryTimeout)
+
+
+def error_response(exc: Exception) -> Tuple[int, Dict[str, Any]]:
+    """数据库不可用异常对应的状态码和错误详情"""
+    if isinstance(exc, QueryTimeout):
+        return 504, {"code": -999, "message": "请求超时，请稍后重试"}
+    return 503, {"code": -999, "message": "数据库暂时不可用，请稍后重试"}
+
+
+async def db_error_handler(request, exc: Exception):
+    status, detail = error_response(exc)
+    return JSONResponse({"detail": detail}, status_code=status)
+
+
+# 截止时间（monotonic时间），None为不限制
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+@contextmanager
+def deadline(seconds: float):
+    """在代码块内设置截止时间（秒，0为不限制），块内的查询以剩余时间为超时"""
+    token = _deadline.set(monotonic() + seconds if seconds else None)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def _query_timeout() -> Optional[float]:
+    end = _deadline.get()
+    if end is not None:
+        return end - monotonic()
+    return DB_QUERY_TIMEOUT or None
+
+
+class CircuitBreaker:
+    """按最近查询的失败率和慢查询比例开关的熔断器，所有方法都在事件循环线程中调用"""
+    CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+    def __init__(self, window: int = BREAKER_WINDOW, min_calls: int = BREAKER_MIN_CALLS,
+                 error_rate: float = BREAKER_ERROR_RATE, slow_rate: float = BREAKER_SLOW_RATE,
+                 slow_query: float = BREAKER_SLOW_QUERY, cooldown: float = BREAKER_COOLDOWN):
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_query = slow_query
+        self.cooldown = cooldown
+        self.outcomes: deque = deque()  # (是否失败, 是否为慢查询)
+        self.failures = 0
+        self.slow = 0
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self.probing = False
+
+    def allow(self) -> bool:
+        """查询能否执行：打开状态下拒绝，冷却结束后每次只放行一条探测查询"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            if monotonic() - self.opened_at < self.cooldown:
+                return False
+            self.state = self.HALF_OPEN
+            self.probing = False
+        if self.probing:
+            return False
+        self.probing = True
+        return True
+
+    def record(self, failed: Optional[bool], elapsed: float):
+        """记录一条查询的结果，failed为None表示查询被取消（不计入）"""
+        if self.state == self.HALF_OPEN:
+            self.probing = False
+            if failed is None:
+                return
+            if failed or elapsed >= self.slow_query:
+                self._open()
+            else:
+                self._close()
+            return
+        if failed is None or self.state == self.OPEN:
+            return
+        slow = elapsed >= self.slow_query
+        self.outcomes.append((failed, slow))
+        self.failures += failed
+        self.slow += slow
+        if len(self.outcomes) > self.window:
+            old_failed, old_slow = self.outcomes.popleft()
+            self.failures -= old_failed
+            self.slow -= old_slow
+        calls = len(self.outcomes)
+        if calls >= self.min_calls and (self.failures / calls >= self.error_rate or self.slow / calls >= self.slow_rate):
+            self._open()
+
+    def _open(self):
+        if self.state != self.OPEN:
+            print(f"数据库熔断器打开：最近{len(self.outcomes)}条查询中失败{self.failures}条、慢查询{self.slow}条，"
+                  f"{self.cooldown:g}秒后重试")
+        self.state = self.OPEN
+        self.opened_at = monotonic()
+
+    def _close(self):
+        print("数据库熔断器关闭，查询恢复正常")
+        self.state = self.CLOSED
+        self.outcomes.clear()
+        self.failures = self.slow = 0
+
+
+BREAKER = CircuitBreaker()
+DB_BREAKER_STATE.set_function(lambda: BREAKER.state)
+
+
+async def guard_query(call: Callable[[], Awaitable]):
+    """查询守卫（由db_hooks在最外层的查询外调用）：检查熔断器，按截止时间设置超时，并记录查询结果"""
+    timeout = _query_timeout()
+    if timeout is not None and timeout <= 0:
+        raise QueryTimeout("已超过请求的截止时间，查询未执行")
+    if not BREAKER.allow():
+        DB_BREAKER_REJECTED.inc()
+        raise DatabaseUnavailable("数据库熔断中，查询未执行")
+    failed = None
+    start = monotonic()
+    try:
+        result = await asyncio.wait_for(call(), timeout) if timeout is not None else await call()
+        failed = False
+        return result
+    except TimeoutError:
+        failed = True
+        raise QueryTimeout(f"查询超时（{timeout:.2f}秒）") from None
+    except IntegrityError:
+        failed = False
+        raise
+    except Exception:
+        failed = True
+        raise
+    finally:
+        BREAKER.record(failed, monotonic() - start)
+
+
+class DeadlineMiddleware:
+    """ASGI中间件：按路由为/api下的请求设置截止时间"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith("/api/"):
+            await self.app(scope, receive, send)
+            return
+        with deadline(ROUTE_TIMEOUTS.get(scope["path"], REQUEST_TIMEOUT)):
+            await self.app(scope, receive, send)
+
+
+def serve_stale(func):
+    """接口装饰器：保存最近一次成功的响应，数据库不可用时返回该响应（X-Stale: 1）
+
+    只用于参数都是简单值、结果与调用者无关的只读接口，放在@router.get之下；按读取的连接分别保存，
+    读主库的客户端不会拿到副本上的旧响应
+    """
+    cache: "OrderedDict[Tuple, Any]" = OrderedDict()
+    route = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(**kwargs):
+        key = (read_connection(), request_key(kwargs))
+        try:
+            result = await func(**kwargs)
+        except DB_ERRORS:
+            cached = cache.get(key)
+            if cached is None:
+                raise
+            STALE_RESPONSES.labels(route).inc()
+            if isinstance(cached, Response):
+                return Response(cached.body, status_code=cached.status_code, media_type=cached.media_type,
+                                headers={"X-Stale": "1"})
+            return JSONResponse(jsonable_encoder(cached), headers={"X-Stale": "1"})
+        if not isinstance(result, Response) or getattr(result, "body", None) is not None:
+            cache[key] = result
+            cache.move_to_end(key)
+            if len(cache) > STALE_CACHE_SIZE:
+                cache.popitem(last=False)
+        return result
+
+    return wrapper
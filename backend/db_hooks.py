@@ -0,0 +1,95 @@
+"""
+数据库查询钩子
+在Tortoise数据库客户端的执行方法外层统一计时，并把每条查询的SQL、耗时和是否失败分发给监听器。
+指标采集、请求级查询追踪等功能都通过注册监听器接入，不需要改动业务代码
+"""
+import functools
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Awaitable, Callable, List, Optional
+
+# 监听器签名: (sql, 耗时秒数, 是否失败) -> None
+QueryListener = Callable[[str, float, bool], None]
+
+# 需要计时的客户端方法
+_EXECUTE_METHODS = ("execute_query", "execute_query_dict", "execute_insert", "execute_many", "execute_script")
+
+_listeners: List[QueryListener] = []
+
+# 查询守卫：在最外层的查询外调用（超时和熔断，见db_guard.py），签名: (call) -> 查询结果，call()执行查询
+_guard: Optional[Callable[[Callable[[], Awaitable]], Awaitable]] = None
+
+# 部分方法内部会互相调用（如事务包装类调用父类方法），只在最外层计时一次
+_in_query: ContextVar[bool] = ContextVar("db_hooks_in_query", default=False)
+
+
+def add_query_listener(listener: QueryListener):
+    """注册查询监听器（重复注册会被忽略）"""
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+
+def remove_query_listener(listener: QueryListener):
+    """移除查询监听器"""
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+
+def set_query_guard(guard: Optional[Callable[[Callable[[], Awaitable]], Awaitable]]):
+    """设置查询守卫（None为取消）"""
+    global _guard
+    _guard = guard
+
+
+def _wrap(func):
+    @functools.wraps(func)
+    async def wrapper(self, query, *args, **kwargs):
+        if _in_query.get():
+            return await func(self, query, *args, **kwargs)
+        token = _in_query.set(True)
+        failed = True
+        start = perf_counter()
+        try:
+            if _guard is None:
+                result = await func(self, query, *args, **kwargs)
+            else:
+                result = await _guard(functools.partial(func, self, query, *args, **kwargs))
+            failed = False
+            return result
+        finally:
+            elapsed = perf_counter() - start
+            _in_query.reset(token)
+            for listener in _listeners:
+                try:
+                    listener(str(query), elapsed, failed)
+                except Exception:
+                    # 监听器出错不能影响查询本身
+                    pass
+
+    wrapper.__db_hooked__ = True
+    return wrapper
+
+
+def _all_subclasses(cls):
+    for sub in cls.__subclasses__():
+        yield sub
+        yield from _all_subclasses(sub)
+
+
+def install(client_cls):
+    """为客户端类（含父类和所有子类，如事务包装类）安装计时钩子，可重复调用"""
+    classes = list(client_cls.__mro__) + list(_all_subclasses(client_cls))
+    for cls in classes:
+        for name in _EXECUTE_METHODS:
+            func = cls.__dict__.get(name)
+            if func is None or getattr(func, "__db_hooked__", False):
+                continue
+            setattr(cls, name, _wrap(func))
+
+
+def install_for_connections():
+    """为当前已配置的所有Tortoise连接安装钩子，需在Tortoise初始化之后调用"""
+    from tortoise import connections
+
+    for conn in connections.all():
+        install(type(conn))
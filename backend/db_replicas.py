@@ -0,0 +1,193 @@
+"""
+读写分离：只读副本路由
+配置了只读副本（SQLITE_REPLICA_PATHS / DB_REPLICA_HOSTS，见database.get_replica_urls）时，/api下读请求
+（GET以及READ_ONLY_POSTS中的POST接口）的读查询发往副本：ORM查询经Tortoise路由器，原始SQL使用read_connection()，
+多个副本按请求轮流使用。写操作、写请求以及价格生成等后台任务始终使用主库（default）。
+- 延迟感知：后台任务每REPLICA_CHECK_INTERVAL秒比较主库和各副本价格表的最新时间戳（价格每轮都会写入，相当于心跳），
+  落后超过REPLICA_MAX_LAG毫秒或检查失败的副本暂停使用，所有副本都不可用时读主库
+- 读己之写：写请求成功后响应设置cookie，REPLICA_STICKY_SECONDS秒内同一客户端的读请求都走主库，不会读到尚未同步的旧数据
+"""
+import asyncio
+import os
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from tortoise import connections
+
+from metrics import DB_REPLICA_HEALTHY, DB_REPLICA_LAG
+
+# 副本允许的最大延迟（毫秒）
+REPLICA_MAX_LAG = int(os.getenv("REPLICA_MAX_LAG", "5000"))
+
+# 检查副本延迟的间隔（秒）
+REPLICA_CHECK_INTERVAL = float(os.getenv("REPLICA_CHECK_INTERVAL", "2"))
+
+# 写请求之后同一客户端读主库的时长（秒），应大于副本的正常延迟
+REPLICA_STICKY_SECONDS = int(os.getenv("REPLICA_STICKY_SECONDS", "10"))
+
+STICKY_COOKIE = "db_primary"
+
+# 各连接价格表的最新时间戳（取ID最小的品牌，按主键查询）
+_HEARTBEAT_SQL = "SELECT MAX(ts) AS ts FROM real_time_price WHERE instrument_id = (SELECT MIN(id) FROM instruments)"
+
+# 使用POST但只读的接口，与GET请求一样读副本
+READ_ONLY_POSTS = ("/api/batch", "/api/permission/getMenu", "/api/mall/getPricesAsOf")
+
+
+class _Route:
+    """一个请求的路由状态：读查询使用的副本（None为主库），以及是否执行了写操作"""
+    __slots__ = ("replica", "wrote")
+
+    def __init__(self, replica: Optional[str]):
+        self.replica = replica
+        self.wrote = False
+
+
+_current_route: ContextVar[Optional[_Route]] = ContextVar("db_current_route", default=None)
+
+_monitor_task: Optional[asyncio.Task] = None
+
+
+class ReplicaSet:
+    """副本的健康状态和轮询选择，所有方法都在事件循环线程中调用"""
+
+    def __init__(self, names: List[str]):
+        self.names = names
+        # 启动后第一次检查之前不使用副本
+        self.healthy: Dict[str, bool] = {name: False for name in names}
+        self.lag: Dict[str, Optional[int]] = {name: None for name in names}
+        self._next = 0
+
+    def pick(self) -> Optional[str]:
+        """轮流选择一个可用的副本，没有可用副本时返回None"""
+        for _ in range(len(self.names)):
+            name = self.names[self._next % len(self.names)]
+            self._next += 1
+            if self.healthy[name]:
+                return name
+        return None
+
+    async def check(self):
+        """检查各副本相对主库的延迟，更新可用状态"""
+        try:
+            rows = await connections.get("default").execute_query_dict(_HEARTBEAT_SQL)
+            primary_ts = rows[0]["ts"] if rows else None
+        except Exception as e:
+            print(f"检查主库价格时间戳失败: {e}")
+            return
+        for name in self.names:
+            try:
+                rows = await connections.get(name).execute_query_dict(_HEARTBEAT_SQL)
+                replica_ts = rows[0]["ts"] if rows else None
+                if primary_ts is None:
+                    lag = 0
+                else:
+                    lag = primary_ts - replica_ts if replica_ts is not None else None
+            except Exception as e:
+                print(f"检查只读副本{name}失败: {e}")
+                lag = None
+            healthy = lag is not None and lag <= REPLICA_MAX_LAG
+            if healthy != self.healthy[name]:
+                print(f"只读副本{name}{'恢复使用' if healthy else '暂停使用'}（延迟: {lag}ms）")
+            self.healthy[name] = healthy
+            self.lag[name] = lag
+            DB_REPLICA_HEALTHY.labels(name).set(1 if healthy else 0)
+            DB_REPLICA_LAG.labels(name).set(-1 if lag is None else lag / 1000)
+
+
+REPLICAS = ReplicaSet([])
+
+
+def configure_replicas(names: List[str]):
+    """注册副本连接名（在Tortoise配置时调用）"""
+    REPLICAS.__init__(names)
+
+
+def read_connection() -> str:
+    """当前上下文中读查询使用的连接名"""
+    route = _current_route.get()
+    return route.replica if route is not None and route.replica else "default"
+
+
+def is_read_request(method: str, path: str) -> bool:
+    return method in ("GET", "HEAD") or path in READ_ONLY_POSTS
+
+
+def use_primary():
+    """当前任务之后的读查询改用主库，并让响应设置读主库的cookie（用于批量请求中的写操作）"""
+    route = _current_route.get()
+    if route is not None:
+        route.wrote = True
+        _current_route.set(_Route(None))
+
+
+class ReplicaRouter:
+    """Tortoise路由器：读查询按当前请求选择的副本，写查询始终使用主库"""
+
+    def db_for_read(self, model):
+        return read_connection()
+
+    def db_for_write(self, model):
+        return "default"
+
+
+def _sticky(headers) -> bool:
+    for name, value in headers:
+        if name == b"cookie" and f"{STICKY_COOKIE}=".encode() in value:
+            return True
+    return False
+
+
+class ReplicaRoutingMiddleware:
+    """ASGI中间件：为/api下的读请求选择副本，写请求成功后设置读主库的cookie"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not REPLICAS.names or not scope["path"].startswith("/api/"):
+            await self.app(scope, receive, send)
+            return
+
+        reading = is_read_request(scope["method"], scope["path"])
+        route = _Route(REPLICAS.pick() if reading and not _sticky(scope["headers"]) else None)
+        route.wrote = not reading
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and message["status"] < 400 and route.wrote:
+                cookie = f"{STICKY_COOKIE}=1; Max-Age={REPLICA_STICKY_SECONDS}; Path=/; SameSite=Lax"
+                message = {**message, "headers": [*message["headers"], (b"set-cookie", cookie.encode())]}
+            await send(message)
+
+        token = _current_route.set(route)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_route.reset(token)
+
+
+async def run_replica_monitor():
+    """定期检查副本延迟"""
+    while True:
+        await REPLICAS.check()
+        await asyncio.sleep(REPLICA_CHECK_INTERVAL)
+
+
+async def start_replica_monitor():
+    """启动副本延迟检查任务（未配置副本时不启动）"""
+    global _monitor_task
+    if not REPLICAS.names or (_monitor_task and not _monitor_task.done()):
+        return
+    _monitor_task = asyncio.create_task(run_replica_monitor())
+
+
+async def stop_replica_monitor():
+    """停止副本延迟检查任务"""
+    global _monitor_task
+    if _monitor_task and not _monitor_task.done():
+        _monitor_task.cancel()
+        try:
+            await _monitor_task
+        except asyncio.CancelledError:
+            pass
+    _monitor_task = None
@@ -6,28 +6,20 @@
 import asyncio
 from tortoise import Tortoise, run_async
 from dotenv import load_dotenv
-import os
 
 # 加载环境变量
 load_dotenv()
 
 # 从database模块导入所需的组件
-from database import User, Product, ChartData, CountData, Menu, Account, OrderData, VideoData, WeekUserData, RealTimePrice, init_db
+from price_partitions import maintain_price_partitions
+from database import User, Product, ChartData, CountData, Menu, Account, OrderData, VideoData, WeekUserData, RealTimePrice, init_db, generate_schemas, load_instruments, get_db_url, get_db_display_url
 
 async def initialize_database():
     """初始化数据库：创建连接、创建表结构、初始化数据"""
     try:
-        # 获取数据库配置参数
-        DB_USERNAME = os.getenv('DB_USERNAME', 'root')
-        DB_PASSWORD = os.getenv('DB_PASSWORD', 'password')
-        DB_HOST = os.getenv('DB_HOST', 'localhost')
-        DB_PORT = os.getenv('DB_PORT', '3306')
-        DB_NAME = os.getenv('DB_NAME', 'vue3_project')
-        
-        # 构建数据库连接URL
-        db_url = f"mysql://{DB_USERNAME}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-        print(f"正在连接到数据库: {DB_USERNAME}@{DB_HOST}:{DB_PORT}/{DB_NAME}")
-        print(f"连接URL: mysql://{DB_USERNAME}:******@{DB_HOST}:{DB_PORT}/{DB_NAME}")
+        # 获取数据库连接URL（由DB_BACKEND选择MySQL或SQLite）
+        db_url = get_db_url()
+        print(f"正在连接到数据库: {get_db_display_url()}")
         
         # 初始化Tortoise ORM（不依赖FastAPI应用）
         await Tortoise.init(
@@ -37,9 +29,13 @@ async def initialize_database():
         
         # 创建数据库表结构
         print("开始创建数据库表结构...")
-        await Tortoise.generate_schemas(safe=True)
+        await generate_schemas()
         print("数据库表结构创建完成")
         
+        # MySQL下为价格表创建时间分区（SQLite会跳过分区，只清理过期数据）
+        await load_instruments()
+        print(f"价格表分区维护: {await maintain_price_partitions()}")
+        
         # 初始化数据
         print("开始初始化数据...")
         await init_db()
@@ -0,0 +1,153 @@
+"""
+事件循环阻塞监控
+事件循环中的心跳协程按固定间隔更新时间戳，后台线程检查心跳是否超时：
+超过阈值说明有同步代码占住了事件循环，此时抓取事件循环线程的调用栈和当前任务，
+循环恢复后记录这次阻塞的时长，结果写入指标并保留最近若干条供管理员查看。
+通过环境变量 LOOP_WATCHDOG=1 开启，LOOP_STALL_THRESHOLD 设置阈值（秒，默认0.1）
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Dict, Optional
+
+from fastapi import APIRouter, Depends
+
+from metrics import Counter, Gauge, Histogram
+from profiling import require_admin
+
+logger = logging.getLogger("loop_watchdog")
+
+STALL_HISTORY = 50
+
+LOOP_STALLS = Counter("event_loop_stalls_total", "事件循环阻塞超过阈值的次数")
+LOOP_STALL_SECONDS = Histogram(
+    "event_loop_stall_seconds", "事件循环阻塞时长",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+LOOP_LAG = Gauge("event_loop_lag_seconds", "最近一次心跳相对计划时间的延迟")
+
+
+def is_enabled() -> bool:
+    return os.getenv("LOOP_WATCHDOG", "false").strip().lower() in ("1", "true", "yes")
+
+
+class LoopWatchdog:
+    """事件循环阻塞监控器"""
+
+    def __init__(self, threshold: float = 0.1):
+        self.threshold = threshold
+        # 心跳间隔取阈值的一部分，保证阻塞超过阈值时能及时发现
+        self.interval = max(threshold / 4, 0.005)
+        self.stalls: "deque[Dict]" = deque(maxlen=STALL_HISTORY)
+        self._last_beat = time.monotonic()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._pending: Optional[Dict] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            LOOP_LAG.set(lag)
+            self._last_beat = now
+            pending, self._pending = self._pending, None
+            if pending is not None or lag > self.threshold:
+                self._record_stall(lag, pending)
+
+    def _record_stall(self, duration: float, pending: Optional[Dict]):
+        LOOP_STALLS.inc()
+        LOOP_STALL_SECONDS.observe(duration)
+        stall = {
+            "time": time.time(),
+            "duration": round(duration, 4),
+            "task": pending["task"] if pending else None,
+            "stack": pending["stack"] if pending else [],
+        }
+        self.stalls.append(stall)
+        logger.warning("事件循环阻塞 %.3f 秒，任务: %s\n%s",
+                       duration, stall["task"], "".join(stall["stack"]))
+
+    def _capture(self) -> Dict:
+        """在监控线程中抓取事件循环线程当前的调用栈和正在执行的任务"""
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = traceback.format_stack(frame) if frame is not None else []
+        del frame
+        task = asyncio.current_task(self._loop)
+        task_desc = None
+        if task is not None:
+            coro = task.get_coro()
+            task_desc = f"{task.get_name()} ({getattr(coro, '__qualname__', coro)})"
+        return {"task": task_desc, "stack": stack}
+
+    def _monitor(self):
+        while not self._stop.wait(self.interval):
+            if self._pending is None and time.monotonic() - self._last_beat > self.threshold:
+                # 同一次阻塞只抓一次栈，阻塞时长在循环恢复后由心跳协程计算
+                self._pending = self._capture()
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._heartbeat(), name="loop-watchdog")
+        self._thread = threading.Thread(target=self._monitor, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+_watchdog: Optional[LoopWatchdog] = None
+
+
+async def start_watchdog():
+    """按环境变量配置启动监控（未开启时不做任何事）"""
+    global _watchdog
+    if not is_enabled() or _watchdog is not None:
+        return
+    _watchdog = LoopWatchdog(float(os.getenv("LOOP_STALL_THRESHOLD", "0.1")))
+    _watchdog.start()
+    print(f"事件循环阻塞监控已启动，阈值 {_watchdog.threshold} 秒")
+
+
+async def stop_watchdog():
+    global _watchdog
+    if _watchdog is not None:
+        await _watchdog.stop()
+        _watchdog = None
+
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+
+@router.get("/watchdog/stalls")
+async def get_stalls():
+    """最近记录的事件循环阻塞"""
+    if _watchdog is None:
+        return {"code": 200, "data": {"enabled": False, "stalls": []}}
+    return {"code": 200, "data": {
+        "enabled": True,
+        "threshold": _watchdog.threshold,
+        "stalls": list(reversed(_watchdog.stalls)),
+    }}
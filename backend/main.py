@@ -20,6 +20,32 @@ origins = [
     "http://127.0.0.1:5174",
 ]
 
+# 请求指标采集（放在CORS之前添加，位于CORS内层，只统计真正进入路由的请求）
+from metrics import MetricsMiddleware, record_query, watch_connection_pools, router as metrics_router
+app.add_middleware(MetricsMiddleware)
+
+# 请求级查询追踪：统计每个请求的查询次数/耗时，输出Server-Timing响应头并检测N+1查询
+from query_trace import QueryTraceMiddleware, record_query as trace_query
+app.add_middleware(QueryTraceMiddleware)
+
+# 管理员单请求CPU采样（请求头 X-Profile: 1 且 X-Admin-Token 正确时生效）
+from profiling import RequestProfilerMiddleware, router as profiling_router
+app.add_middleware(RequestProfilerMiddleware)
+
+# 较大的非流式响应按Accept-Encoding进行brotli/gzip压缩
+from response_formats import CompressionMiddleware
+app.add_middleware(CompressionMiddleware)
+
+# 读写分离：配置了只读副本时，/api下读请求的查询发往副本，写请求之后同一客户端短时间内读主库
+from db_replicas import ReplicaRoutingMiddleware, start_replica_monitor, stop_replica_monitor
+app.add_middleware(ReplicaRoutingMiddleware)
+
+# 按路由设置请求截止时间，查询以剩余时间为超时；数据库不可用（熔断、超时）时返回503/504
+from db_guard import DeadlineMiddleware, DatabaseUnavailable, QueryTimeout, db_error_handler, guard_query
+app.add_middleware(DeadlineMiddleware)
+app.add_exception_handler(DatabaseUnavailable, db_error_handler)
+app.add_exception_handler(QueryTimeout, db_error_handler)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -29,8 +55,11 @@ app.add_middleware(
 )
 
 # 导入数据库配置和API路由器
-from database import register_db, init_db, start_price_generation, stop_price_generation
+import db_hooks
+from database import register_db, init_db, generate_schemas, load_instruments, should_auto_init, start_price_generation, stop_price_generation
 from api import router as api_router
+from price_partitions import start_partition_maintenance, stop_partition_maintenance
+from price_rollups import start_rollup_maintenance, stop_rollup_maintenance
 
 # 注册数据库（关闭自动创建表结构）
 register_db(app)
@@ -38,9 +67,40 @@ register_db(app)
 # 注册API路由器，添加/api前缀
 app.include_router(api_router, prefix="/api")
 
+# 注册指标接口（不加/api前缀，供Prometheus抓取）
+app.include_router(metrics_router)
+
+# 注册性能诊断接口（仅管理员，需配置ADMIN_TOKEN）
+app.include_router(profiling_router, prefix="/admin")
+
+# 事件循环阻塞监控（LOOP_WATCHDOG=1 时启用），阻塞记录同样只对管理员开放
+from loop_watchdog import start_watchdog, stop_watchdog, router as watchdog_router
+app.include_router(watchdog_router, prefix="/admin")
+
 # 添加应用启动和关闭事件处理器
 @app.on_event("startup")
 async def startup_event():
+    # 为数据库连接安装查询计时钩子，并注册指标采集和请求级查询追踪
+    db_hooks.install_for_connections()
+    db_hooks.add_query_listener(record_query)
+    db_hooks.add_query_listener(trace_query)
+    db_hooks.set_query_guard(guard_query)
+    watch_connection_pools()
+    await start_watchdog()
+    
+    # SQLite内存数据库等场景下，启动时自动创建表结构并初始化数据
+    if should_auto_init():
+        print("初始化数据库表结构和数据...")
+        await generate_schemas()
+        await init_db()
+    # 加载品牌ID缓存，价格相关接口按品牌ID查询
+    await load_instruments()
+    # 价格表分区维护：提前创建未来分区、整体删除过期分区
+    await start_partition_maintenance()
+    # 增量维护价格分钟/小时聚合，长时间范围的价格历史直接读取聚合结果
+    await start_rollup_maintenance()
+    # 定期检查只读副本的延迟
+    await start_replica_monitor()
     print("启动实时价格数据生成任务...")
     await start_price_generation()
 
@@ -48,9 +108,13 @@ async def startup_event():
 async def shutdown_event():
     print("停止实时价格数据生成任务...")
     await stop_price_generation()
+    await stop_partition_maintenance()
+    await stop_rollup_maintenance()
+    await stop_replica_monitor()
+    await stop_watchdog()
 
 # 注意：数据库表结构和初始化数据已通过独立脚本init_database.py处理
-# 不再在应用启动时执行这些操作，以提高性能
+# 不再在应用启动时执行这些操作，以提高性能（DB_BACKEND=sqlite且使用内存数据库时除外）
 
 # 主程序启动代码（整合了run.py的功能）
 if __name__ == "__main__":
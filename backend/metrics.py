@@ -0,0 +1,345 @@
+"""
+进程内指标采集
+提供Prometheus风格的Counter/Gauge/Histogram，数据全部保存在进程内存中，
+通过 /metrics 接口以Prometheus文本格式输出
+"""
+from bisect import bisect_left
+from time import perf_counter
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+# 默认的耗时分桶（秒），覆盖从亚毫秒级查询到秒级慢请求
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    """转义标签值中的特殊字符"""
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """指标基类：按标签值缓存子指标，热点路径上只有一次字典查找"""
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        REGISTRY.register(self)
+
+    def labels(self, *values):
+        """获取指定标签值对应的子指标（不存在则创建）"""
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} 需要标签: {self.labelnames}")
+            child = self._children[key] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+    type_name = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def _samples(self):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}"
+                for key, child in self._children.items()]
+
+
+class _GaugeChild:
+    __slots__ = ("value", "function")
+
+    def __init__(self):
+        self.value = 0.0
+        self.function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+    def set_function(self, function: Callable[[], float]):
+        """采集时调用function获取当前值（用于连接池等外部状态）"""
+        self.function = function
+
+    def get(self) -> float:
+        if self.function is not None:
+            try:
+                return float(self.function())
+            except Exception:
+                return float("nan")
+        return self.value
+
+
+class Gauge(_Metric):
+    """可增可减的瞬时值"""
+    type_name = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self.labels().dec(amount)
+
+    def set_function(self, function: Callable[[], float]):
+        self.labels().set_function(function)
+
+    def _samples(self):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.get())}"
+                for key, child in self._children.items()]
+
+
+class _HistogramChild:
+    __slots__ = ("upper_bounds", "counts", "sum", "count")
+
+    def __init__(self, upper_bounds: Tuple[float, ...]):
+        self.upper_bounds = upper_bounds
+        # 每个分桶单独计数，输出时再累加，observe只需一次二分查找
+        self.counts = [0] * (len(upper_bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.upper_bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self):
+        return _Timer(self)
+
+
+class _Timer:
+    """用于 with 语句的计时器，退出时把耗时记录到直方图"""
+    __slots__ = ("child", "start")
+
+    def __init__(self, child: _HistogramChild):
+        self.child = child
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.child.observe(perf_counter() - self.start)
+
+
+class Histogram(_Metric):
+    """分桶直方图，用于统计耗时分布"""
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.upper_bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.upper_bounds)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def _samples(self):
+        lines = []
+        for key, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(self.upper_bounds + (float("inf"),), child.counts):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+            lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+class Registry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"指标重复注册: {metric.name}")
+        self._metrics[metric.name] = metric
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+REGISTRY = Registry()
+
+
+# HTTP接口指标
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP请求总数", ("method", "route", "status"))
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "HTTP请求耗时", ("method", "route"))
+HTTP_IN_PROGRESS = Gauge("http_requests_in_progress", "正在处理的HTTP请求数", ("method", "route"))
+
+SINGLE_FLIGHT_REQUESTS = Counter(
+    "single_flight_requests_total", "合并请求的接口调用次数（computed为实际计算，shared/cached为共享结果）", ("route", "source")
+)
+
+# 数据库指标
+DB_QUERY_LATENCY = Histogram("db_query_duration_seconds", "数据库查询耗时", ("operation",))
+DB_QUERY_ERRORS = Counter("db_query_errors_total", "数据库查询失败次数", ("operation",))
+DB_POOL_SIZE = Gauge("db_pool_connections", "连接池中的连接数", ("connection", "state"))
+DB_REPLICA_LAG = Gauge("db_replica_lag_seconds", "只读副本相对主库的延迟（-1为检查失败）", ("connection",))
+DB_REPLICA_HEALTHY = Gauge("db_replica_healthy", "只读副本是否在使用中", ("connection",))
+DB_BREAKER_STATE = Gauge("db_circuit_breaker_state", "数据库熔断器状态（0关闭 1半开 2打开）")
+DB_BREAKER_REJECTED = Counter("db_circuit_breaker_rejected_total", "熔断期间直接拒绝的查询数")
+STALE_RESPONSES = Counter("stale_responses_total", "数据库不可用时返回的过期响应数", ("route",))
+
+# 价格生成任务指标
+GENERATOR_TICKS = Counter("price_generator_ticks_total", "价格生成任务执行的轮次")
+GENERATOR_ROWS = Counter("price_generator_rows_total", "价格生成任务写入的价格记录数")
+GENERATOR_TICK_LAG = Histogram("price_generator_tick_lag_seconds", "实际开始时间相对计划时间的延迟")
+GENERATOR_FLUSH = Histogram("price_generator_flush_seconds", "每轮价格数据写入数据库的耗时")
+GENERATOR_LAST_TICK = Gauge("price_generator_last_tick_timestamp_seconds", "最近一轮价格生成的Unix时间戳")
+GENERATOR_BUFFERED = Gauge("price_generator_buffered_rows", "数据库不可用时暂存、等待写入的价格记录数")
+GENERATOR_SHED = Counter("price_generator_shed_rows_total", "暂存超出上限后丢弃的价格记录数")
+
+
+def _query_operation(sql: str) -> str:
+    """取SQL的第一个关键字作为操作类型，避免按完整SQL打标签导致基数爆炸"""
+    head = sql.lstrip()[:8].split(None, 1)
+    operation = head[0].upper() if head else ""
+    return operation if operation in ("SELECT", "INSERT", "UPDATE", "DELETE") else "OTHER"
+
+
+def record_query(sql: str, elapsed: float, failed: bool):
+    """数据库查询监听器：记录每条查询的耗时和失败次数"""
+    operation = _query_operation(sql)
+    DB_QUERY_LATENCY.labels(operation).observe(elapsed)
+    if failed:
+        DB_QUERY_ERRORS.labels(operation).inc()
+
+
+def watch_connection_pools():
+    """为当前所有带连接池的数据库连接注册连接池指标（SQLite没有连接池，会被跳过）"""
+    from tortoise import connections
+
+    for conn in connections.all():
+        if not hasattr(conn, "_pool"):
+            continue
+        name = conn.connection_name
+
+        def pool_attr(attr, conn=conn):
+            return lambda: getattr(conn._pool, attr, 0) if conn._pool else 0
+
+        DB_POOL_SIZE.labels(name, "total").set_function(pool_attr("size"))
+        DB_POOL_SIZE.labels(name, "free").set_function(pool_attr("freesize"))
+        DB_POOL_SIZE.labels(name, "max").set_function(pool_attr("maxsize"))
+
+
+class MetricsMiddleware:
+    """ASGI中间件：记录每个路由的请求数、耗时和并发数
+
+    本项目的接口都没有路径参数，匹配到路由的请求直接以请求路径作为路由标签；
+    没有匹配到任何路由的请求统一记为 unmatched，避免被随意构造的路径撑爆标签基数
+    """
+
+    def __init__(self, app):
+        self.app = app
+        # 已确认能匹配到路由的路径，用于在请求进入路由之前确定并发数的标签
+        self._known_paths: Set[Tuple[str, str]] = set()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        key = (method, scope["path"])
+        status_holder = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder[0] = message["status"]
+            await send(message)
+
+        in_progress = HTTP_IN_PROGRESS.labels(method, scope["path"] if key in self._known_paths else "unmatched")
+        in_progress.inc()
+        start = perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_progress.dec()
+            if scope.get("route") is not None:
+                route_path = scope["path"]
+                if len(self._known_paths) < 4096:
+                    self._known_paths.add(key)
+            else:
+                route_path = "unmatched"
+            HTTP_LATENCY.labels(method, route_path).observe(perf_counter() - start)
+            HTTP_REQUESTS.labels(method, route_path, status_holder[0]).inc()
+
+
+# 指标输出接口
+router = APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
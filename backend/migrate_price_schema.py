@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+价格表结构迁移脚本
+把旧结构的real_time_price表（自增id、品牌名称、datetime时间、浮点价格、(name, time)索引）
+迁移为紧凑结构：instrument_id小整数 + 毫秒时间戳 + 定点价格，(instrument_id, ts)复合主键。
+旧表会被重命名为real_time_price_legacy保留，确认无误后可手动删除。可重复执行，已迁移时直接跳过
+"""
+from tortoise import Tortoise, connections, fields, run_async
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+# 从database模块导入所需的组件
+from database import (
+    Instrument, PRICE_SCALE, get_db_url, get_db_display_url, generate_schemas,
+    load_instruments, datetime_to_ts, _INSTRUMENT_IDS,
+)
+
+LEGACY_TABLE = "real_time_price_legacy"
+
+# 每批迁移的记录数
+BATCH_SIZE = 5000
+
+
+async def get_columns(conn, table: str) -> list:
+    """获取表的列名（表不存在时返回空列表）"""
+    if conn.capabilities.dialect == "mysql":
+        rows = await conn.execute_query_dict(
+            "SELECT COLUMN_NAME AS name FROM information_schema.COLUMNS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s", [table]
+        )
+    else:
+        rows = await conn.execute_query_dict(f'PRAGMA table_info("{table}")')
+    return [row["name"] for row in rows]
+
+
+async def migrate_price_schema():
+    """执行迁移"""
+    try:
+        # 获取数据库连接URL（由DB_BACKEND选择MySQL或SQLite）
+        db_url = get_db_url()
+        print(f"正在连接到数据库: {get_db_display_url()}")
+
+        # 初始化Tortoise ORM（不依赖FastAPI应用）
+        await Tortoise.init(
+            db_url=db_url,
+            modules={"models": ["database"]}
+        )
+        conn = connections.get("default")
+        dialect = conn.capabilities.dialect
+        placeholder = "%s" if dialect == "mysql" else "?"
+        insert_ignore = "INSERT IGNORE" if dialect == "mysql" else "INSERT OR IGNORE"
+
+        columns = await get_columns(conn, "real_time_price")
+        if "name" not in columns:
+            print("real_time_price 已是紧凑结构（或不存在），无需迁移")
+            await generate_schemas()
+            return
+
+        # 1. 重命名旧表，创建新表和品牌表
+        print("重命名旧表...")
+        await conn.execute_script(f"ALTER TABLE real_time_price RENAME TO {LEGACY_TABLE}")
+        await generate_schemas()
+
+        # 2. 登记旧表中出现过的所有品牌
+        names = await conn.execute_query_dict(f"SELECT DISTINCT name FROM {LEGACY_TABLE}")
+        for row in names:
+            await Instrument.get_or_create(name=row["name"])
+        await load_instruments()
+        print(f"已登记 {len(_INSTRUMENT_IDS)} 个品牌")
+
+        # 3. 按id分批复制数据，时间和价格的转换在Python中完成，保证与应用写入时的规则一致
+        time_field = fields.DatetimeField()
+        last_id = 0
+        copied = 0
+        while True:
+            rows = await conn.execute_query_dict(
+                f"SELECT id, name, time, value FROM {LEGACY_TABLE} WHERE id > {placeholder} ORDER BY id LIMIT {BATCH_SIZE}",
+                [last_id],
+            )
+            if not rows:
+                break
+            values = [
+                [_INSTRUMENT_IDS[row["name"]],
+                 datetime_to_ts(time_field.to_python_value(row["time"])),
+                 int(round(row["value"] * PRICE_SCALE))]
+                for row in rows
+            ]
+            # 同一品牌同一毫秒的重复记录只保留一条
+            await conn.execute_many(
+                f"{insert_ignore} INTO real_time_price (instrument_id, ts, price) "
+                f"VALUES ({placeholder}, {placeholder}, {placeholder})",
+                values,
+            )
+            last_id = rows[-1]["id"]
+            copied += len(rows)
+            print(f"已复制 {copied} 条记录")
+
+        print(f"迁移完成，共复制 {copied} 条记录，旧表保留为 {LEGACY_TABLE}")
+
+    except Exception as e:
+        print(f"迁移过程中发生错误: {e}")
+        raise
+    finally:
+        # 关闭数据库连接
+        await Tortoise.close_connections()
+        print("数据库连接已关闭")
+
+def main():
+    """主函数，运行价格表结构迁移流程"""
+    print("=== 价格表结构迁移脚本开始执行 ===")
+
+    # 运行异步迁移函数
+    run_async(migrate_price_schema())
+
+    print("\n=== 价格表结构迁移脚本执行完成 ===")
+
+if __name__ == "__main__":
+    main()
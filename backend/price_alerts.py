@@ -0,0 +1,180 @@
+"""
+价格提醒引擎
+用户登记的价格提醒（price_alerts表）在启动时全部加载到内存，价格生成任务每写入一批就检查一次，触发后推送给订阅者并失效。
+提醒分两类：
+- above/below：价格达到阈值。每个品牌的阈值保存在有序列表中，另用按品牌ID索引的数组记录最低的above阈值和最高的below阈值，
+  一批价格先整体与这两个数组比较，只有可能触发的记录才在有序列表上二分查找，已触发的提醒正好是列表的一段前缀/后缀
+- drop/rise：window秒内从最高点下跌/从最低点上涨超过value%。同一品牌同一时间窗口的提醒共用一组按时间的单调队列
+  （窗口内最高价和最低价），每条记录只更新一次队列，再按当前跌幅/涨幅在有序的百分比列表上二分查找
+检查代价只与批内记录数和实际触发的提醒数有关，与登记的提醒总数无关
+"""
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from price_window import RECENT_TICKS, SEQ_BASE
+
+CONDITIONS = ("above", "below", "drop", "rise")
+
+
+class Alert(NamedTuple):
+    id: int
+    owner: str
+    instrument_id: int
+    condition: str
+    value: float  # above/below为定点价格，drop/rise为百分比
+    window: Optional[int]  # drop/rise的时间窗口（秒）
+
+
+class Triggered(NamedTuple):
+    alert: Alert
+    ts: int
+    price: int  # 触发时的定点价格
+
+
+class _WindowGroup:
+    """同一品牌同一时间窗口的drop/rise提醒，以及窗口内的最高/最低价单调队列"""
+
+    def __init__(self, window_ms: int):
+        self.window_ms = window_ms
+        self.highs: deque = deque()  # (ts, 价格)，价格从队首到队尾递减
+        self.lows: deque = deque()  # 价格从队首到队尾递增
+        self.drops: List[Tuple[float, int]] = []  # (比例, 提醒ID)，升序
+        self.rises: List[Tuple[float, int]] = []
+
+    def push(self, ts: int, price: int):
+        while self.highs and self.highs[-1][1] <= price:
+            self.highs.pop()
+        self.highs.append((ts, price))
+        while self.lows and self.lows[-1][1] >= price:
+            self.lows.pop()
+        self.lows.append((ts, price))
+        expired = ts - self.window_ms
+        while self.highs[0][0] < expired:
+            self.highs.popleft()
+        while self.lows[0][0] < expired:
+            self.lows.popleft()
+
+
+class AlertEngine:
+    """内存中的提醒索引，所有方法都在事件循环线程中调用"""
+
+    def __init__(self):
+        self.alerts: Dict[int, Alert] = {}
+        # 品牌ID -> 有序的(阈值, 提醒ID)
+        self.above: Dict[int, List[Tuple[float, int]]] = {}
+        self.below: Dict[int, List[Tuple[float, int]]] = {}
+        # 按品牌ID索引（instrument_id小于SEQ_BASE）：最低的above阈值、最高的below阈值、是否有drop/rise提醒
+        self.min_above = np.full(SEQ_BASE, np.inf)
+        self.max_below = np.full(SEQ_BASE, -np.inf)
+        self.has_window = np.zeros(SEQ_BASE, dtype=bool)
+        # 品牌ID -> {窗口毫秒数: _WindowGroup}
+        self.groups: Dict[int, Dict[int, _WindowGroup]] = {}
+
+    def __len__(self) -> int:
+        return len(self.alerts)
+
+    def clear(self):
+        self.__init__()
+
+    def load(self, alerts: Iterable[Alert]):
+        self.clear()
+        for alert in alerts:
+            self.add(alert)
+
+    def _refresh(self, instrument_id: int):
+        above = self.above.get(instrument_id)
+        below = self.below.get(instrument_id)
+        self.min_above[instrument_id] = above[0][0] if above else np.inf
+        self.max_below[instrument_id] = below[-1][0] if below else -np.inf
+        self.has_window[instrument_id] = bool(self.groups.get(instrument_id))
+
+    def add(self, alert: Alert):
+        if alert.condition not in CONDITIONS:
+            raise ValueError(f"不支持的提醒条件: {alert.condition}，可选值: {', '.join(CONDITIONS)}")
+        self.alerts[alert.id] = alert
+        instrument_id = alert.instrument_id
+        if alert.condition == "above":
+            insort(self.above.setdefault(instrument_id, []), (alert.value, alert.id))
+        elif alert.condition == "below":
+            insort(self.below.setdefault(instrument_id, []), (alert.value, alert.id))
+        else:
+            window_ms = alert.window * 1000
+            groups = self.groups.setdefault(instrument_id, {})
+            group = groups.get(window_ms)
+            if group is None:
+                # 新的时间窗口用内存中的最近价格初始化单调队列，不必等窗口重新积累
+                group = groups[window_ms] = _WindowGroup(window_ms)
+                for ts, price in RECENT_TICKS.recent(instrument_id):
+                    group.push(ts, price)
+            ratios = group.drops if alert.condition == "drop" else group.rises
+            insort(ratios, (alert.value / 100, alert.id))
+        self._refresh(instrument_id)
+
+    def remove(self, alert_id: int) -> Optional[Alert]:
+        alert = self.alerts.pop(alert_id, None)
+        if alert is None:
+            return None
+        instrument_id = alert.instrument_id
+        if alert.condition in ("above", "below"):
+            entries = (self.above if alert.condition == "above" else self.below)[instrument_id]
+            entries.pop(bisect_left(entries, (alert.value, alert.id)))
+        else:
+            groups = self.groups[instrument_id]
+            group = groups[alert.window * 1000]
+            ratios = group.drops if alert.condition == "drop" else group.rises
+            ratios.pop(bisect_left(ratios, (alert.value / 100, alert.id)))
+            if not group.drops and not group.rises:
+                del groups[alert.window * 1000]
+        self._refresh(instrument_id)
+        return alert
+
+    def _fire(self, entries: List[Tuple[float, int]], start: int, end: int, ts: int, price: int,
+              triggered: List[Triggered]):
+        for _, alert_id in entries[start:end]:
+            triggered.append(Triggered(self.alerts.pop(alert_id), ts, price))
+        del entries[start:end]
+
+    def evaluate(self, instrument_ids: np.ndarray, ts: np.ndarray, prices: np.ndarray) -> List[Triggered]:
+        """检查一批价格记录（定点价格，同一品牌按时间顺序），返回触发的提醒；触发的提醒从引擎中移除，
+        调用方把它们标记为失效失败时需要用add放回"""
+        triggered: List[Triggered] = []
+        if not self.alerts or len(instrument_ids) == 0:
+            return triggered
+        # 先整体比较，只逐条处理可能触发阈值提醒或需要更新时间窗口的记录
+        candidates = np.flatnonzero(
+            (prices >= self.min_above[instrument_ids])
+            | (prices <= self.max_below[instrument_ids])
+            | self.has_window[instrument_ids]
+        )
+        changed = set()
+        for i in candidates.tolist():
+            instrument_id, tick_ts, price = int(instrument_ids[i]), int(ts[i]), int(prices[i])
+            above = self.above.get(instrument_id)
+            if above and above[0][0] <= price:
+                self._fire(above, 0, bisect_right(above, (price, float("inf"))), tick_ts, price, triggered)
+                changed.add(instrument_id)
+            below = self.below.get(instrument_id)
+            if below and below[-1][0] >= price:
+                self._fire(below, bisect_left(below, (price, -1)), len(below), tick_ts, price, triggered)
+                changed.add(instrument_id)
+            for window_ms, group in list(self.groups.get(instrument_id, {}).items()):
+                group.push(tick_ts, price)
+                drop = 1 - price / group.highs[0][1]
+                rise = price / group.lows[0][1] - 1
+                if group.drops and group.drops[0][0] <= drop:
+                    self._fire(group.drops, 0, bisect_right(group.drops, (drop, float("inf"))), tick_ts, price, triggered)
+                if group.rises and group.rises[0][0] <= rise:
+                    self._fire(group.rises, 0, bisect_right(group.rises, (rise, float("inf"))), tick_ts, price, triggered)
+                if not group.drops and not group.rises:
+                    del self.groups[instrument_id][window_ms]
+                    changed.add(instrument_id)
+        for instrument_id in changed:
+            self._refresh(instrument_id)
+        return triggered
+
+
+# 价格生成任务使用的全局提醒引擎
+ALERTS = AlertEngine()
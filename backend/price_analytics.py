@@ -0,0 +1,117 @@
+"""
+跨品牌收益率分析
+把各品牌的价格序列对齐到同一个时间网格上，计算对数收益率的相关系数矩阵、协方差矩阵和各品牌的波动率。
+- 原始粒度：网格间隔为RAW_TICK_INTERVAL_MS，各品牌的价格序列一次读取（见price_asof.py），用searchsorted取每个网格点的as-of价格
+- 分钟/小时粒度：网格为聚合时间桶，所有品牌的收盘价用一条查询读取，缺失的时间桶沿用上一个收盘价
+整个计算都是对(品牌数 x 网格点数)矩阵的NumPy运算。结果（已转换为可序列化的列表）按(品牌, 粒度, 网格对齐后的起止时间)缓存，
+只缓存数据已经不会再变化的时间范围（原始记录早于写入延迟、聚合早于聚合水位线，见price_rollups.settled_until），
+包含最新数据或尚未聚合完成的时间范围（如刚启动时）每次重新计算
+"""
+import os
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from price_asof import as_of, load_series
+from price_rollups import ROLLUPS, RAW_TICK_INTERVAL_MS, choose_resolution, floor_bucket, settled_until
+
+# 单次计算最多使用的网格点数（按此选择粒度）
+MAX_GRID_POINTS = 1000
+
+# 单次计算最多的品牌数（结果为品牌数 x 品牌数的矩阵）
+MAX_INSTRUMENTS = int(os.getenv("PRICE_CORRELATION_MAX_NAMES", "50"))
+
+# 缓存的计算结果数
+CORRELATION_CACHE_SIZE = int(os.getenv("PRICE_CORRELATION_CACHE_SIZE", "128"))
+
+_cache: "OrderedDict[Tuple, Dict]" = OrderedDict()
+
+
+async def _raw_matrix(instrument_ids: List[int], start: int, end: int) -> np.ndarray:
+    """原始记录按as-of对齐到网格，网格点之前没有记录的位置为NaN"""
+    grid = np.arange(start, end + 1, RAW_TICK_INTERVAL_MS, dtype=np.int64)
+    series = await load_series(instrument_ids, start, end)
+    matrix = np.full((len(instrument_ids), len(grid)), np.nan)
+    for row, instrument_id in enumerate(instrument_ids):
+        tick_ts, prices = as_of(series[instrument_id], grid)
+        matrix[row] = np.where(tick_ts >= 0, prices, np.nan)
+    return matrix
+
+
+async def _rollup_matrix(instrument_ids: List[int], resolution: str, start: int, end: int) -> np.ndarray:
+    """聚合收盘价按时间桶排成矩阵，缺失的时间桶沿用上一个收盘价"""
+    model, width = ROLLUPS[resolution]
+    rows = await model.filter(
+        instrument_id__in=instrument_ids, bucket__gte=start, bucket__lte=end
+    ).values_list("instrument_id", "bucket", "close")
+    matrix = np.full((len(instrument_ids), (end - start) // width + 1), np.nan)
+    if rows:
+        data = np.array(rows, dtype=np.int64)
+        index = {instrument_id: row for row, instrument_id in enumerate(instrument_ids)}
+        matrix[[index[i] for i in data[:, 0].tolist()], (data[:, 1] - start) // width] = data[:, 2]
+    # 向前填充：每个位置取该行之前最近一个非空列的值
+    filled = np.where(np.isnan(matrix), 0, np.arange(matrix.shape[1]))
+    np.maximum.accumulate(filled, axis=1, out=filled)
+    matrix = matrix[np.arange(len(instrument_ids))[:, None], filled]
+    return matrix
+
+
+def _to_list(values: np.ndarray) -> List:
+    """转换为可直接序列化为JSON的列表，NaN转为None"""
+    return np.where(np.isnan(values), None, values).tolist()
+
+
+def _statistics(matrix: np.ndarray) -> Dict:
+    """从价格矩阵计算对数收益率的统计量；只使用所有品牌都有价格的网格点"""
+    complete = ~np.isnan(matrix).any(axis=0)
+    prices = matrix[:, complete]
+    returns = np.diff(np.log(prices), axis=1)
+    points = returns.shape[1]
+    if points < 2:
+        return {"points": points, "volatility": None, "covariance": None, "correlation": None}
+    covariance = np.atleast_2d(np.cov(returns))
+    volatility = np.sqrt(np.diag(covariance))
+    # 价格不变的品牌波动率为0，相关系数没有意义（记为NaN，返回时转为null）
+    with np.errstate(invalid="ignore", divide="ignore"):
+        correlation = covariance / np.outer(volatility, volatility)
+    np.fill_diagonal(correlation, np.where(volatility > 0, 1.0, np.nan))
+    return {
+        "points": points,
+        "volatility": _to_list(volatility),
+        "covariance": _to_list(covariance),
+        "correlation": _to_list(correlation),
+    }
+
+
+async def correlation(instrument_ids: List[int], start: int, end: int, resolution: str = "auto") -> Dict:
+    """计算[start, end]内各品牌收益率的统计量：{resolution, start, end, points, volatility, covariance, correlation}
+
+    volatility为每个网格间隔的对数收益率标准差（未年化），矩阵的行列顺序与instrument_ids相同
+    """
+    if resolution == "auto":
+        resolution = choose_resolution(end - start, MAX_GRID_POINTS)
+    width = RAW_TICK_INTERVAL_MS if resolution == "raw" else ROLLUPS[resolution][1]
+    # 起止时间对齐到网格，同一网格间隔内的请求共用缓存
+    start, end = floor_bucket(start, width), floor_bucket(end, width)
+    start = max(start, end - (MAX_GRID_POINTS - 1) * width)
+    key = (tuple(instrument_ids), resolution, start, end)
+    # 数据可能还会变化的范围不使用也不写入缓存（聚合水位线在回填历史时会降低，因此读取时也要检查）
+    settled = settled_until(resolution)
+    cacheable = settled is not None and end < settled
+    cached = _cache.get(key) if cacheable else None
+    if cached is not None:
+        _cache.move_to_end(key)
+        return cached
+
+    if resolution == "raw":
+        matrix = await _raw_matrix(instrument_ids, start, end)
+    else:
+        matrix = await _rollup_matrix(instrument_ids, resolution, start, end)
+    result = {"resolution": resolution, "start": start, "end": end, **_statistics(matrix)}
+
+    if cacheable:
+        _cache[key] = result
+        if len(_cache) > CORRELATION_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return result
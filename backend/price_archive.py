@@ -0,0 +1,146 @@
+"""
+价格冷数据归档
+超出热数据保留期的原始价格记录在删除分区之前写入本地Parquet文件（zstd压缩的列式存储），
+按品牌和日期分目录：{PRICE_ARCHIVE_DIR}/instrument_id=1/date=2026-10-19/part-<首条ts>-<末条ts>.parquet。
+文件名中的末条ts即该品牌的归档水位线，同一条记录不会被重复归档。
+归档之后才写入的、早于水位线的记录（模拟/回放补写的历史数据）单独写成backfill-<首条ts>-<末条ts>-<序号>.parquet，不影响水位线。
+读取时只列出该品牌目录下日期范围内的.parquet文件（不含写了一半的.tmp文件），并用文件内的ts统计信息跳过不相关的行组
+"""
+import asyncio
+import os
+import re
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from database import RealTimePrice, _INSTRUMENT_IDS
+
+# 是否在删除过期数据前归档
+ARCHIVE_ENABLED = os.getenv("PRICE_ARCHIVE", "true").strip().lower() in ("1", "true", "yes")
+
+# 归档文件根目录
+ARCHIVE_DIR = os.getenv("PRICE_ARCHIVE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "price_archive"))
+
+# 每次从数据库读取的记录数
+ARCHIVE_BATCH_SIZE = 50000
+
+_SCHEMA = pa.schema([("ts", pa.int64()), ("price", pa.int32())])
+_PARTITIONING = ds.partitioning(pa.schema([("instrument_id", pa.int16()), ("date", pa.string())]), flavor="hive")
+_PART_FILE = re.compile(r"^part-(\d+)-(\d+)\.parquet$")
+
+# 各品牌已归档到的最后一条记录的ts，由文件名恢复
+_archived_until: Optional[Dict[int, int]] = None
+
+
+def _day(ts: int) -> str:
+    return datetime.fromtimestamp(ts / 1000, tz=timezone.utc).strftime("%Y-%m-%d")
+
+
+def archived_until() -> Dict[int, int]:
+    """各品牌的归档水位线：ts不大于该值的记录都已在归档文件中"""
+    global _archived_until
+    if _archived_until is None:
+        watermarks: Dict[int, int] = {}
+        if os.path.isdir(ARCHIVE_DIR):
+            for root, _, files in os.walk(ARCHIVE_DIR):
+                instrument = re.search(r"instrument_id=(\d+)", root)
+                if instrument is None:
+                    continue
+                for file in files:
+                    match = _PART_FILE.match(file)
+                    if match:
+                        instrument_id = int(instrument.group(1))
+                        watermarks[instrument_id] = max(watermarks.get(instrument_id, -1), int(match.group(2)))
+        _archived_until = watermarks
+    return _archived_until
+
+
+def archive_files(instrument_id: Optional[int] = None,
+                  first_day: str = "0000-00-00", last_day: str = "9999-99-99") -> List[str]:
+    """列出归档文件：指定品牌时只遍历该品牌的目录，日期目录按[first_day, last_day]过滤，跳过.tmp临时文件"""
+    roots = [f"instrument_id={instrument_id}"] if instrument_id is not None else (
+        os.listdir(ARCHIVE_DIR) if os.path.isdir(ARCHIVE_DIR) else [])
+    files = []
+    for root in roots:
+        root = os.path.join(ARCHIVE_DIR, root)
+        if not os.path.isdir(root):
+            continue
+        for date in os.listdir(root):
+            if date.startswith("date=") and first_day <= date[5:] <= last_day:
+                directory = os.path.join(root, date)
+                files += [os.path.join(directory, f) for f in os.listdir(directory) if f.endswith(".parquet")]
+    return files
+
+
+def _write_part(instrument_id: int, rows: List[Tuple[int, int]], backfill: bool = False):
+    """把同一品牌同一天的记录写成一个Parquet文件（先写临时文件再改名，避免读到写了一半的文件）"""
+    directory = os.path.join(ARCHIVE_DIR, f"instrument_id={instrument_id}", f"date={_day(rows[0][0])}")
+    os.makedirs(directory, exist_ok=True)
+    name = f"part-{rows[0][0]}-{rows[-1][0]}"
+    if backfill:
+        name = f"backfill-{rows[0][0]}-{rows[-1][0]}-{time.time_ns()}"
+    path = os.path.join(directory, name + ".parquet")
+    table = pa.table({"ts": [r[0] for r in rows], "price": [r[1] for r in rows]}, schema=_SCHEMA)
+    pq.write_table(table, path + ".tmp", compression="zstd")
+    os.replace(path + ".tmp", path)
+
+
+async def _write_days(instrument_id: int, rows: List[Tuple[int, int]], backfill: bool = False):
+    """按天拆分文件写入"""
+    start = 0
+    for i in range(1, len(rows) + 1):
+        if i == len(rows) or _day(rows[i][0]) != _day(rows[start][0]):
+            await asyncio.to_thread(_write_part, instrument_id, rows[start:i], backfill)
+            start = i
+
+
+async def archive_ticks(before: int) -> int:
+    """把ts早于before、尚未归档的记录写入归档文件，返回归档的记录数
+
+    归档之后早于before的记录都会被删除，因此数据库中仍然存在的早于水位线的记录是之后补写的，同样需要归档
+    """
+    watermarks = archived_until()
+    archived = 0
+    for instrument_id in list(_INSTRUMENT_IDS.values()):
+        cursor = -1
+        while True:
+            rows = await RealTimePrice.filter(
+                instrument_id=instrument_id, ts__gt=cursor, ts__lt=before
+            ).order_by("ts").limit(ARCHIVE_BATCH_SIZE).values_list("ts", "price")
+            if not rows:
+                break
+            watermark = watermarks.get(instrument_id, -1)
+            await _write_days(instrument_id, [r for r in rows if r[0] <= watermark], backfill=True)
+            await _write_days(instrument_id, [r for r in rows if r[0] > watermark])
+            watermarks[instrument_id] = max(watermark, rows[-1][0])
+            cursor = rows[-1][0]
+            archived += len(rows)
+    return archived
+
+
+def _read_archive(instrument_id: int, start: int, end: int, limit: int) -> List[Tuple[int, int]]:
+    files = archive_files(instrument_id, _day(start), _day(end))
+    if not files:
+        return []
+    dataset = ds.dataset(files, schema=_SCHEMA, format="parquet")
+    table = dataset.to_table(filter=(ds.field("ts") >= start) & (ds.field("ts") <= end))
+    table = table.take(pc.sort_indices(table, sort_keys=[("ts", "ascending")]))
+    # 删除分区失败后重新归档、或补写了已归档的时间戳时，同一ts可能出现在多个文件中，只保留一条
+    ts = table.column("ts").to_numpy()
+    if len(ts) > 1:
+        table = table.filter(pa.array(np.concatenate(([True], ts[1:] != ts[:-1]))))
+    table = table.slice(0, limit)
+    return list(zip(table.column("ts").to_pylist(), table.column("price").to_pylist()))
+
+
+async def read_archive(instrument_id: int, start: int, end: int, limit: int) -> List[Tuple[int, int]]:
+    """读取归档中[start, end]范围内按时间排序的前limit条记录：(ts, 定点价格)"""
+    if not os.path.isdir(ARCHIVE_DIR) or instrument_id not in archived_until():
+        return []
+    return await asyncio.to_thread(_read_archive, instrument_id, start, end, limit)
@@ -0,0 +1,86 @@
+"""
+批量"as-of"价格查询
+给定一组品牌和一组时间点，求每个品牌在每个时间点的价格（该时间点及之前最近的一条记录）。
+每个品牌的价格序列只读取一次：时间点都落在内存中的最近价格窗口内时直接使用窗口，不访问数据库；
+否则所有品牌共用一条查询，读取覆盖全部时间点的范围以及范围开始之前的最后一条记录，早于归档水位线的部分从归档文件读取。
+之后用NumPy的searchsorted一次定位所有时间点，不逐个时间点查询
+"""
+from typing import Dict, List, Tuple
+
+import numpy as np
+from tortoise import connections
+
+from database import latest_ticks_sql
+from db_replicas import read_connection
+from price_archive import archived_until, read_archive
+from price_window import RECENT_TICKS
+
+# 单次请求最多的时间点数
+MAX_ASOF_POINTS = 100000
+
+# 从归档文件中查找范围开始之前的最后一条记录时，向前读取的时长（毫秒）
+_ARCHIVE_LOOKBACK_MS = 24 * 3600 * 1000
+
+# 价格序列：(按时间升序的时间戳数组, 定点价格数组)
+Series = Tuple[np.ndarray, np.ndarray]
+
+
+def _series(ts: List[int], prices: List[int]) -> Series:
+    """按时间排序并去掉重复的时间戳（归档和热数据可能在水位线附近重叠）"""
+    ts_array = np.asarray(ts, dtype=np.int64)
+    price_array = np.asarray(prices, dtype=np.int64)
+    ts_array, first = np.unique(ts_array, return_index=True)
+    return ts_array, price_array[first]
+
+
+async def load_series(instrument_ids: List[int], start: int, end: int) -> Dict[int, Series]:
+    """读取各品牌在[start, end]内的全部记录，以及start之前的最后一条记录"""
+    series: Dict[int, Series] = {}
+    missing = []
+    for instrument_id in instrument_ids:
+        recent = RECENT_TICKS.recent(instrument_id)
+        # 窗口中最早的记录不晚于start时，start之后的记录和start的as-of记录都在窗口中
+        if recent and recent[0][0] <= start:
+            series[instrument_id] = _series([r[0] for r in recent], [r[1] for r in recent])
+        else:
+            missing.append(instrument_id)
+    if not missing:
+        return series
+
+    conn = connections.get(read_connection())
+    placeholder = "%s" if conn.capabilities.dialect == "mysql" else "?"
+    ids = ", ".join([placeholder] * len(missing))
+    sql = (
+        f"SELECT instrument_id, ts, price FROM real_time_price "
+        f"WHERE instrument_id IN ({ids}) AND ts >= {placeholder} AND ts <= {placeholder}\nUNION ALL\n"
+        + latest_ticks_sql(placeholder, len(missing), before=True)
+    )
+    rows = await conn.execute_query_dict(sql, [*missing, start, end, start, start, *missing])
+    columns: Dict[int, Tuple[List[int], List[int]]] = {instrument_id: ([], []) for instrument_id in missing}
+    for row in rows:
+        ts, prices = columns[row["instrument_id"]]
+        ts.append(row["ts"])
+        prices.append(row["price"])
+
+    # 早于归档水位线的部分已从数据库删除（或即将删除），从归档文件补充
+    watermarks = archived_until()
+    for instrument_id in missing:
+        ts, prices = columns[instrument_id]
+        watermark = watermarks.get(instrument_id)
+        if watermark is not None and start <= watermark:
+            for tick_ts, price in await read_archive(instrument_id, start - _ARCHIVE_LOOKBACK_MS, min(end, watermark), 2 ** 62):
+                ts.append(tick_ts)
+                prices.append(price)
+        series[instrument_id] = _series(ts, prices)
+    return series
+
+
+def as_of(series: Series, timestamps: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """各时间点的as-of记录：(记录的时间戳, 定点价格)，时间点之前没有记录的位置为-1；timestamps不要求有序"""
+    ts, prices = series
+    if len(ts) == 0:
+        return np.full(len(timestamps), -1, dtype=np.int64), np.full(len(timestamps), -1, dtype=np.int64)
+    index = np.searchsorted(ts, timestamps, side="right") - 1
+    found = index >= 0
+    index = np.where(found, index, 0)
+    return np.where(found, ts[index], -1), np.where(found, prices[index], -1)
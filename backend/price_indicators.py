@@ -0,0 +1,188 @@
+"""
+流式技术指标
+价格生成任务每写入一批，就把这批记录增量更新到各品牌的指标状态中，查询时直接读取当前值，不需要回溯历史数据。
+每个窗口（按记录条数计）维护以下指标，每条记录的更新代价与窗口长度无关：
+- sma：简单移动平均，滚动求和（定点整数，没有累积误差）
+- ema：指数移动平均，平滑系数 2/(窗口+1)
+- min/max：窗口内最低/最高价，单调队列
+- volatility：窗口内对数收益率的样本标准差（每条记录的波动率，未年化），滚动维护收益率的和与平方和
+- twap：时间加权平均价（价格记录没有成交量，用每个价格持续的时长作为权重，相当于VWAP中的成交量）
+"""
+import os
+from collections import deque
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from price_window import TickWindow, batch_rounds
+
+# 指标窗口（记录条数），逗号分隔
+INDICATOR_WINDOWS = tuple(sorted({int(w) for w in os.getenv("PRICE_INDICATOR_WINDOWS", "20,60").split(",") if w.strip()}))
+
+
+class IndicatorEngine:
+    """按品牌增量维护各窗口的技术指标，状态按品牌分行保存在NumPy数组中，一批记录整批更新"""
+
+    def __init__(self, windows=INDICATOR_WINDOWS):
+        if not windows or min(windows) < 2:
+            raise ValueError(f"指标窗口必须至少包含2条记录: {windows}")
+        self.windows = tuple(windows)
+        # 环形缓冲区只需容纳最长的窗口，用于取出滑出窗口的记录
+        self.capacity = max(self.windows)
+        self.rows: Dict[int, int] = {}
+        self.ts = np.zeros((0, self.capacity), dtype=np.int64)
+        self.price = np.zeros((0, self.capacity), dtype=np.int64)
+        self.ret = np.zeros((0, self.capacity))  # 相对上一条记录的对数收益率
+        self.weighted = np.zeros((0, self.capacity))  # 上一条记录的价格 * 持续时长
+        self.duration = np.zeros((0, self.capacity), dtype=np.int64)
+        self.head = np.zeros(0, dtype=np.int64)
+        self.count = np.zeros(0, dtype=np.int64)
+        self.total = np.zeros(0, dtype=np.int64)  # 累计记录数，作为单调队列中的序号
+        k = len(self.windows)
+        self.price_sum = np.zeros((k, 0), dtype=np.int64)
+        self.ret_sum = np.zeros((k, 0))
+        self.ret_sq_sum = np.zeros((k, 0))
+        self.weighted_sum = np.zeros((k, 0))
+        self.duration_sum = np.zeros((k, 0), dtype=np.int64)
+        self.ema = np.zeros((k, 0))
+        self.low = np.zeros((k, 0), dtype=np.int64)
+        self.high = np.zeros((k, 0), dtype=np.int64)
+        # 单调队列：_low_queues[窗口序号][行号]中为(序号, 价格)，价格从队首到队尾递增（_high_queues递减）
+        self._low_queues: List[List[deque]] = [[] for _ in self.windows]
+        self._high_queues: List[List[deque]] = [[] for _ in self.windows]
+
+    def clear(self):
+        self.__init__(self.windows)
+
+    def _rows_for(self, instrument_ids: np.ndarray) -> np.ndarray:
+        """品牌ID映射为行号，新品牌追加新行"""
+        new = [i for i in dict.fromkeys(instrument_ids.tolist()) if i not in self.rows]
+        if new:
+            for instrument_id in new:
+                self.rows[instrument_id] = len(self.rows)
+            grow = len(new)
+            for name in ("ts", "price", "duration"):
+                setattr(self, name, np.vstack([getattr(self, name), np.zeros((grow, self.capacity), dtype=np.int64)]))
+            for name in ("ret", "weighted"):
+                setattr(self, name, np.vstack([getattr(self, name), np.zeros((grow, self.capacity))]))
+            for name in ("head", "count", "total"):
+                setattr(self, name, np.concatenate([getattr(self, name), np.zeros(grow, dtype=np.int64)]))
+            k = len(self.windows)
+            for name in ("price_sum", "duration_sum", "low", "high"):
+                setattr(self, name, np.hstack([getattr(self, name), np.zeros((k, grow), dtype=np.int64)]))
+            for name in ("ret_sum", "ret_sq_sum", "weighted_sum", "ema"):
+                setattr(self, name, np.hstack([getattr(self, name), np.zeros((k, grow))]))
+            for i in range(k):
+                self._low_queues[i] += [deque() for _ in range(grow)]
+                self._high_queues[i] += [deque() for _ in range(grow)]
+        return np.fromiter((self.rows[i] for i in instrument_ids.tolist()), dtype=np.int64, count=len(instrument_ids))
+
+    def update(self, instrument_ids: np.ndarray, ts: np.ndarray, prices: np.ndarray):
+        """用一批记录（定点价格）更新指标；同一批内同一品牌出现多次时按顺序分轮更新"""
+        if len(instrument_ids) == 0:
+            return
+        rows = self._rows_for(instrument_ids)
+        for selected in batch_rounds(rows):
+            self._update_unique(rows[selected], ts[selected], prices[selected])
+
+    def _update_unique(self, rows: np.ndarray, ts: np.ndarray, prices: np.ndarray):
+        cap = self.capacity
+        position = self.head[rows]
+        count = self.count[rows]
+        has_prev = count > 0
+        prev = (position - 1) % cap
+        prev_price = np.where(has_prev, self.price[rows, prev], prices)
+        prev_ts = np.where(has_prev, self.ts[rows, prev], ts)
+        ret = np.log(prices / prev_price)
+        duration = ts - prev_ts
+        weighted = prev_price * duration.astype(np.float64)
+
+        for i, window in enumerate(self.windows):
+            # 窗口已满时，最早的一条价格以及它之后的一条收益率滑出窗口（写入新记录之前读取）
+            full = count >= window
+            leaving = (position - window) % cap
+            leaving_pair = (position - window + 1) % cap
+            self.price_sum[i, rows] += prices - np.where(full, self.price[rows, leaving], 0)
+            self.ret_sum[i, rows] += ret - np.where(full, self.ret[rows, leaving_pair], 0)
+            self.ret_sq_sum[i, rows] += ret ** 2 - np.where(full, self.ret[rows, leaving_pair] ** 2, 0)
+            self.weighted_sum[i, rows] += weighted - np.where(full, self.weighted[rows, leaving_pair], 0)
+            self.duration_sum[i, rows] += duration - np.where(full, self.duration[rows, leaving_pair], 0)
+            alpha = 2 / (window + 1)
+            self.ema[i, rows] = np.where(has_prev, self.ema[i, rows] + alpha * (prices - self.ema[i, rows]), prices)
+
+        self.ts[rows, position] = ts
+        self.price[rows, position] = prices
+        self.ret[rows, position] = ret
+        self.weighted[rows, position] = weighted
+        self.duration[rows, position] = duration
+        self.head[rows] = (position + 1) % cap
+        self.count[rows] = np.minimum(count + 1, cap)
+
+        # 单调队列逐行更新（均摊每条记录O(1)）
+        sequence = self.total[rows]
+        self.total[rows] = sequence + 1
+        for i, window in enumerate(self.windows):
+            low_queues, high_queues = self._low_queues[i], self._high_queues[i]
+            low, high = self.low[i], self.high[i]
+            for row, n, price in zip(rows.tolist(), sequence.tolist(), prices.tolist()):
+                expired = n - window
+                queue = low_queues[row]
+                while queue and queue[-1][1] >= price:
+                    queue.pop()
+                queue.append((n, price))
+                if queue[0][0] <= expired:
+                    queue.popleft()
+                low[row] = queue[0][1]
+                queue = high_queues[row]
+                while queue and queue[-1][1] <= price:
+                    queue.pop()
+                queue.append((n, price))
+                if queue[0][0] <= expired:
+                    queue.popleft()
+                high[row] = queue[0][1]
+
+    def load(self, window: TickWindow):
+        """用最近价格窗口中的记录重建指标（预热和从快照恢复后调用）"""
+        self.clear()
+        if not window.rows:
+            return
+        instrument_ids = np.array(list(window.rows.keys()), dtype=np.int64)
+        rows = np.array(list(window.rows.values()), dtype=np.int64)
+        count = window.count[rows]
+        start = window.head[rows] - count
+        # 所有品牌按时间顺序逐条对齐，第k轮更新每个品牌的第k条记录
+        for k in range(int(count.max(initial=0))):
+            present = count > k
+            positions = (start[present] + k) % window.size
+            self.update(instrument_ids[present], window.ts[rows[present], positions], window.price[rows[present], positions])
+
+    def values(self, instrument_id: int) -> Optional[Dict]:
+        """品牌当前的指标：{ts, price, windows: {窗口: {count, sma, ema, min, max, volatility, twap}}}，价格均为定点值"""
+        row = self.rows.get(instrument_id)
+        if row is None or self.count[row] == 0:
+            return None
+        last = (self.head[row] - 1) % self.capacity
+        total = int(self.total[row])
+        result = {"ts": int(self.ts[row, last]), "price": int(self.price[row, last]), "windows": {}}
+        for i, window in enumerate(self.windows):
+            n = min(total, window)
+            returns = n - 1
+            volatility = None
+            if returns >= 2:
+                variance = (self.ret_sq_sum[i, row] - self.ret_sum[i, row] ** 2 / returns) / (returns - 1)
+                volatility = float(np.sqrt(max(variance, 0.0)))
+            span = int(self.duration_sum[i, row])
+            result["windows"][window] = {
+                "count": n,
+                "sma": int(self.price_sum[i, row]) / n,
+                "ema": float(self.ema[i, row]),
+                "min": int(self.low[i, row]),
+                "max": int(self.high[i, row]),
+                "volatility": volatility,
+                "twap": float(self.weighted_sum[i, row]) / span if span > 0 else float(self.price[row, last]),
+            }
+        return result
+
+
+# 价格生成任务维护的全局指标
+INDICATORS = IndicatorEngine()
@@ -0,0 +1,182 @@
+"""
+价格表分区维护
+MySQL下real_time_price按ts（毫秒时间戳）做RANGE分区，每个分区对应一天或一小时：
+- 提前创建未来的分区（从兜底分区pmax中拆分出来，pmax正常情况下为空，拆分几乎没有开销）
+- 超出保留期的分区整体DROP，代替逐行DELETE，不产生碎片也不需要维护索引
+SQLite不支持分区，退化为按品牌在主键范围内删除过期记录（同样按分区粒度对齐）。
+开启归档（PRICE_ARCHIVE）时，删除之前先把这些记录写入Parquet归档文件（见price_archive.py）
+"""
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from tortoise import connections
+
+from database import RealTimePrice, _INSTRUMENT_IDS, now_ts
+from price_archive import ARCHIVE_ENABLED, archive_ticks
+
+# 分区粒度：day 或 hour
+PARTITION_UNIT = os.getenv("PRICE_PARTITION_UNIT", "day").strip().lower()
+
+# 热数据保留时长（小时），超出的分区会被删除
+RETENTION_HOURS = float(os.getenv("PRICE_RETENTION_HOURS", "168"))
+
+# 提前创建的未来分区数量
+PARTITIONS_AHEAD = int(os.getenv("PRICE_PARTITIONS_AHEAD", "3"))
+
+# 维护任务执行间隔（秒）
+MAINTENANCE_INTERVAL = float(os.getenv("PRICE_MAINTENANCE_INTERVAL", "600"))
+
+_maintenance_task: Optional[asyncio.Task] = None
+
+
+def _unit() -> timedelta:
+    if PARTITION_UNIT not in ("day", "hour"):
+        raise ValueError(f"不支持的分区粒度: {PARTITION_UNIT}，可选值: day, hour")
+    return timedelta(days=1) if PARTITION_UNIT == "day" else timedelta(hours=1)
+
+
+def _floor(ts: int) -> datetime:
+    """把毫秒时间戳向下取整到分区粒度（UTC）"""
+    value = datetime.fromtimestamp(ts / 1000, tz=timezone.utc)
+    if PARTITION_UNIT == "day":
+        return value.replace(hour=0, minute=0, second=0, microsecond=0)
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def _to_ts(value: datetime) -> int:
+    return int(value.timestamp() * 1000)
+
+
+def partition_name(lower: datetime) -> str:
+    """分区按起始时间命名，如 p20261019（按天）或 p2026101914（按小时）"""
+    return "p" + lower.strftime("%Y%m%d" if PARTITION_UNIT == "day" else "%Y%m%d%H")
+
+
+def partition_bounds(start_ts: int, end_ts: int) -> List[Tuple[str, int]]:
+    """覆盖[start_ts, end_ts]所需的分区列表：(分区名, 上界毫秒时间戳)"""
+    step = _unit()
+    lower = _floor(start_ts)
+    bounds = []
+    while _to_ts(lower) <= end_ts:
+        bounds.append((partition_name(lower), _to_ts(lower + step)))
+        lower += step
+    return bounds
+
+
+def retention_cutoff(now: Optional[int] = None) -> int:
+    """保留期起点：早于该时间戳的记录都已过期"""
+    return (now_ts() if now is None else now) - int(RETENTION_HOURS * 3600 * 1000)
+
+
+async def _mysql_partitions(conn) -> List[Tuple[str, str]]:
+    """当前分区列表：(分区名, LESS THAN 的值)，未分区时返回空列表"""
+    rows = await conn.execute_query_dict(
+        "SELECT PARTITION_NAME AS name, PARTITION_DESCRIPTION AS bound FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'real_time_price' AND PARTITION_NAME IS NOT NULL "
+        "ORDER BY PARTITION_ORDINAL_POSITION"
+    )
+    return [(row["name"], str(row["bound"])) for row in rows]
+
+
+def _partition_clause(bounds: List[Tuple[str, int]]) -> str:
+    parts = [f"PARTITION {name} VALUES LESS THAN ({upper})" for name, upper in bounds]
+    parts.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+    return ", ".join(parts)
+
+
+async def _maintain_mysql(conn, now: int) -> Dict:
+    created: List[str] = []
+    dropped: List[str] = []
+    horizon = now + int(_unit().total_seconds() * 1000) * PARTITIONS_AHEAD
+    partitions = await _mysql_partitions(conn)
+
+    if not partitions:
+        # 首次分区：从保留期起点（或更晚的最早记录）开始，更早的记录都落在第一个分区，随后会被整体删除
+        rows = await conn.execute_query_dict("SELECT MIN(ts) AS min_ts FROM real_time_price")
+        start = max(rows[0]["min_ts"] or now, retention_cutoff(now))
+        bounds = partition_bounds(start, horizon)
+        await conn.execute_script(
+            f"ALTER TABLE real_time_price PARTITION BY RANGE (ts) ({_partition_clause(bounds)})"
+        )
+        created = [name for name, _ in bounds]
+        partitions = await _mysql_partitions(conn)
+    else:
+        # 提前创建未来分区：把空的pmax拆分为新的分区
+        uppers = [int(bound) for name, bound in partitions if bound != "MAXVALUE"]
+        last_upper = max(uppers) if uppers else _to_ts(_floor(now))
+        if last_upper <= horizon:
+            bounds = partition_bounds(last_upper, horizon)
+            await conn.execute_script(
+                f"ALTER TABLE real_time_price REORGANIZE PARTITION pmax INTO ({_partition_clause(bounds)})"
+            )
+            created = [name for name, _ in bounds]
+            partitions = await _mysql_partitions(conn)
+
+    # 整体删除上界不晚于保留期起点的分区（分区内全部记录都已过期）
+    cutoff = retention_cutoff(now)
+    expired = [name for name, bound in partitions if bound != "MAXVALUE" and int(bound) <= cutoff]
+    archived = 0
+    if expired:
+        if ARCHIVE_ENABLED:
+            archived = await archive_ticks(max(int(bound) for name, bound in partitions if name in expired))
+        await conn.execute_script(f"ALTER TABLE real_time_price DROP PARTITION {', '.join(expired)}")
+        dropped = expired
+
+    return {"created": created, "dropped": dropped, "archived": archived}
+
+
+async def _maintain_sqlite(now: int) -> Dict:
+    # 与MySQL一致，只删除整个分区粒度都已过期的记录
+    boundary = _to_ts(_floor(retention_cutoff(now)))
+    archived = await archive_ticks(boundary) if ARCHIVE_ENABLED else 0
+    # 按品牌在主键(instrument_id, ts)范围内删除，避免全表扫描
+    deleted = 0
+    for instrument_id in list(_INSTRUMENT_IDS.values()):
+        deleted += await RealTimePrice.filter(instrument_id=instrument_id, ts__lt=boundary).delete()
+    return {"deleted": deleted, "archived": archived}
+
+
+async def maintain_price_partitions(now: Optional[int] = None) -> Dict:
+    """执行一次分区维护：创建未来分区、删除过期分区"""
+    conn = connections.get("default")
+    now = now_ts() if now is None else now
+    if conn.capabilities.dialect == "mysql":
+        return await _maintain_mysql(conn, now)
+    return await _maintain_sqlite(now)
+
+
+async def run_partition_maintenance():
+    """定期执行分区维护"""
+    try:
+        while True:
+            try:
+                result = await maintain_price_partitions()
+                if any(result.values()):
+                    print(f"价格表分区维护完成: {result}")
+            except Exception as e:
+                print(f"价格表分区维护出错: {e}")
+            await asyncio.sleep(MAINTENANCE_INTERVAL)
+    except asyncio.CancelledError:
+        pass
+
+
+async def start_partition_maintenance():
+    """启动分区维护任务"""
+    global _maintenance_task
+    if _maintenance_task and not _maintenance_task.done():
+        return
+    _maintenance_task = asyncio.create_task(run_partition_maintenance())
+
+
+async def stop_partition_maintenance():
+    """停止分区维护任务"""
+    global _maintenance_task
+    if _maintenance_task and not _maintenance_task.done():
+        _maintenance_task.cancel()
+        try:
+            await _maintenance_task
+        except asyncio.CancelledError:
+            pass
+    _maintenance_task = None
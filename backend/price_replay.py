@@ -0,0 +1,191 @@
+"""
+价格生成的时钟和数据源
+价格生成任务从数据源逐批取出价格记录写入数据库，数据源有三种（PRICE_GENERATOR_MODE）：
+- live：实时模式（默认），模拟器按真实时间每隔几秒生成一批
+- simulate：虚拟时钟模拟，模拟器使用固定种子，在虚拟时钟上以N倍速运行，相同配置每次生成完全相同的数据，可用于可重复的基准测试和回填历史
+- replay：按N倍速回放录制的价格文件（CSV/Parquet，列为name, ts, value）或已归档的历史数据，
+  时间戳默认平移到虚拟时钟的起点（PRICE_SIM_START，默认当前时间），用于在几分钟内重放一整天的流量
+虚拟时钟不会超过真实的当前时间：加速运行追上当前时间之后按真实时间继续，价格表中不会出现未来的记录
+（倍速回放/模拟需要把PRICE_SIM_START设置为过去的时间）。文件和归档在线程中分块读取，不阻塞事件循环
+"""
+import asyncio
+import csv
+import os
+import random
+import time
+from typing import AsyncIterator, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from metrics import GENERATOR_TICK_LAG
+from price_simulator import PriceSimulator
+
+SUPPORTED_MODES = ("live", "simulate", "replay")
+
+# 价格生成模式
+GENERATOR_MODE = os.getenv("PRICE_GENERATOR_MODE", "live").strip().lower()
+
+# 虚拟时钟的起始时间（YYYY-MM-DD HH:MM:SS），不配置时从当前时间开始
+SIM_START = os.getenv("PRICE_SIM_START")
+
+# 虚拟时钟相对真实时间的倍速，0表示不等待、尽快生成
+SIM_SPEED = float(os.getenv("PRICE_SIM_SPEED", "1"))
+
+# 虚拟时钟模拟的总时长（秒），0表示一直运行
+SIM_DURATION = float(os.getenv("PRICE_SIM_DURATION", "0"))
+
+# 回放的数据来源：CSV/Parquet文件路径，或archive表示回放归档数据
+REPLAY_SOURCE = os.getenv("PRICE_REPLAY_SOURCE", "")
+
+# 回放时是否把时间戳平移到当前时间（关闭则保留原始时间戳，用于回填）
+REPLAY_REBASE = os.getenv("PRICE_REPLAY_REBASE", "true").strip().lower() in ("1", "true", "yes")
+
+# 回放时每批包含的时间跨度（毫秒）
+REPLAY_BATCH_MS = int(os.getenv("PRICE_REPLAY_BATCH_MS", "1000"))
+
+# 一批价格记录：(品牌名称列表, 时间戳数组, 价格数组)
+Batch = Tuple[List[str], np.ndarray, np.ndarray]
+
+# 待回放的一条记录：(品牌名称, 毫秒时间戳, 价格)
+Record = Tuple[str, int, float]
+
+# CSV文件每次读取的行数
+_CSV_CHUNK_ROWS = 10000
+
+
+async def _sleep(seconds: float):
+    """真实等待，同时记录实际唤醒时间相对计划时间的延迟"""
+    scheduled = time.perf_counter() + seconds
+    await asyncio.sleep(seconds)
+    GENERATOR_TICK_LAG.observe(max(0.0, time.perf_counter() - scheduled))
+
+
+class WallClock:
+    """真实时钟"""
+
+    def now(self) -> int:
+        return int(time.time() * 1000)
+
+    async def sleep(self, seconds: float):
+        await _sleep(seconds)
+
+
+class VirtualClock:
+    """虚拟时钟：sleep时虚拟时间前进seconds秒，真实时间只等待seconds/speed秒（speed为0时不等待）
+
+    虚拟时间不超过真实的当前时间：起点晚于当前时间时从当前时间开始，追上当前时间之后等到真实时间到达为止
+    """
+
+    def __init__(self, start: int, speed: float = 1.0):
+        self.current = min(start, int(time.time() * 1000))
+        self.speed = speed
+
+    def now(self) -> int:
+        return self.current
+
+    async def sleep(self, seconds: float):
+        self.current += int(round(seconds * 1000))
+        wait = seconds / self.speed if self.speed > 0 else 0
+        ahead = (self.current - time.time() * 1000) / 1000
+        # 即使不等待也让出一次事件循环，避免全速回放时阻塞接口请求
+        await _sleep(max(wait, ahead))
+
+
+async def simulated_batches(simulator: PriceSimulator, clock, interval: Optional[float] = None,
+                            seed: Optional[int] = None, duration: float = 0) -> AsyncIterator[Batch]:
+    """模拟器数据源：每一步生成一批，间隔固定为interval秒，未指定时在2-5秒之间随机（由seed决定）"""
+    rng = random.Random(seed)
+    end = clock.now() + int(duration * 1000) if duration > 0 else None
+    while end is None or clock.now() < end:
+        ts, prices = simulator.step(clock.now())
+        yield simulator.names, ts, prices
+        await clock.sleep(interval if interval else rng.uniform(2, 5))
+
+
+def _read_csv(path: str) -> Iterator[List[Record]]:
+    with open(path, newline="", encoding="utf-8") as f:
+        chunk = []
+        for row in csv.DictReader(f):
+            chunk.append((row["name"], int(row["ts"]), float(row["value"])))
+            if len(chunk) >= _CSV_CHUNK_ROWS:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def _read_parquet(path: str) -> Iterator[List[Record]]:
+    import pyarrow.parquet as pq
+
+    for batch in pq.ParquetFile(path).iter_batches(columns=["name", "ts", "value"]):
+        yield list(zip(*(batch.column(i).to_pylist() for i in range(3))))
+
+
+def _read_archive(names: dict) -> Iterator[List[Record]]:
+    """按日期逐天读取归档数据（每次只在内存中保留一天），同一天内所有品牌按时间排序"""
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    from database import PRICE_SCALE
+    from price_archive import ARCHIVE_DIR, _PARTITIONING, archive_files
+
+    files = archive_files()
+    if not files:
+        return
+    dataset = ds.dataset(files, format="parquet", partitioning=_PARTITIONING, partition_base_dir=ARCHIVE_DIR)
+    days = sorted(set(pc.unique(dataset.to_table(columns=["date"]).column("date")).to_pylist()))
+    for day in days:
+        table = dataset.to_table(columns=["instrument_id", "ts", "price"], filter=ds.field("date") == day)
+        table = table.sort_by([("ts", "ascending")])
+        yield [
+            (names[instrument_id], ts, price / PRICE_SCALE)
+            for instrument_id, ts, price in zip(*(table.column(c).to_pylist() for c in ("instrument_id", "ts", "price")))
+            if instrument_id in names
+        ]
+
+
+def replay_records(source: str, instrument_names: dict) -> Iterator[List[Record]]:
+    """按时间顺序分块读取待回放的记录：(品牌名称, 毫秒时间戳, 价格)，文件需已按ts排序"""
+    if source == "archive":
+        return _read_archive(instrument_names)
+    if source.endswith(".csv"):
+        return _read_csv(source)
+    if source.endswith(".parquet"):
+        return _read_parquet(source)
+    raise ValueError(f"不支持的回放数据来源: {source}，可选值: CSV/Parquet文件路径或archive")
+
+
+async def _records(chunks: Iterator[List[Record]]) -> AsyncIterator[Record]:
+    """在线程中读取下一块记录（CSV/Parquet解码、按天读取归档），不阻塞事件循环"""
+    while True:
+        chunk = await asyncio.to_thread(next, chunks, None)
+        if chunk is None:
+            return
+        for record in chunk:
+            yield record
+
+
+async def replayed_batches(chunks: Iterator[List[Record]], clock,
+                           rebase: bool = True, batch_ms: int = 1000) -> AsyncIterator[Batch]:
+    """回放数据源：按原始时间间隔（除以倍速）逐批输出，每批包含batch_ms毫秒内的记录"""
+    offset = None
+    batch_end = None
+    names: List[str] = []
+    stamps: List[int] = []
+    values: List[float] = []
+    async for name, ts, value in _records(chunks):
+        if offset is None:
+            # 平移时让第一批记录结束于时钟的当前时间，批次中的记录不会晚于输出时的时钟
+            offset = clock.now() - batch_ms - ts if rebase else 0
+            batch_end = ts + batch_ms
+        if ts >= batch_end:
+            yield names, np.array(stamps, dtype=np.int64), np.array(values)
+            # 等待到下一条记录所在的批次
+            wait = (ts - batch_end) // batch_ms * batch_ms + batch_ms
+            await clock.sleep(wait / 1000)
+            batch_end += wait
+            names, stamps, values = [], [], []
+        names.append(name)
+        stamps.append(ts + offset)
+        values.append(value)
+    if names:
+        yield names, np.array(stamps, dtype=np.int64), np.array(values)
@@ -0,0 +1,287 @@
+"""
+价格分钟/小时聚合（K线）
+后台任务按水位线增量维护：每轮只读取水位线之后的原始价格记录，按品牌聚合为每分钟的开高低收、总和、记录数，
+写入price_rollup_1m，再由分钟聚合合成小时聚合写入price_rollup_1h。水位线所在的时间桶可能还没结束，下一轮会重新聚合并覆盖。
+长时间范围的价格历史直接读取聚合表（几百行），不再扫描原始记录；没有记录的时间桶用上一个收盘价补齐
+"""
+import asyncio
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from tortoise import connections
+
+from database import (
+    PriceRollupMinute, PriceRollupHour, RealTimePrice, PRICE_SCALE, _INSTRUMENT_IDS, now_ts, ts_to_datetime,
+)
+
+MINUTE_MS = 60 * 1000
+HOUR_MS = 60 * MINUTE_MS
+
+# 聚合粒度：名称 -> (模型, 时间桶宽度毫秒)，按从细到粗排列
+ROLLUPS = {
+    "1m": (PriceRollupMinute, MINUTE_MS),
+    "1h": (PriceRollupHour, HOUR_MS),
+}
+
+# 价格生成任务平均每3.5秒写入一条记录，用于估算一段时间内的原始记录数
+RAW_TICK_INTERVAL_MS = 3500
+
+# 聚合任务执行间隔（秒）
+ROLLUP_INTERVAL = float(os.getenv("PRICE_ROLLUP_INTERVAL", "10"))
+
+# 水位线比当前时间晚这么多毫秒，给正在写入的记录留出提交时间
+_LATENESS_MS = 5000
+
+# 每次从原始表读取的时间窗口，避免首次聚合时一次读入全部历史
+_BATCH_MS = 6 * HOUR_MS
+
+# 每条查询最多读取的记录数（估算）和品牌数，品牌按此分组后每组一条范围查询
+_MAX_QUERY_ROWS = 200000
+_MAX_QUERY_INSTRUMENTS = 500
+
+
+def _edge_sql(table: str, column: str, last: bool) -> str:
+    """各品牌最早（last为False）或最晚的一条记录中最早/最晚的时间，按主键(instrument_id, 时间)逐个品牌取一条，
+    避免按时间排序扫描全表"""
+    aggregate_, order = ("MAX", "DESC") if last else ("MIN", "ASC")
+    return (f"SELECT {aggregate_}(t) AS t FROM ("
+            f"SELECT (SELECT {column} FROM {table} WHERE instrument_id = i.id ORDER BY {column} {order} LIMIT 1) AS t "
+            f"FROM instruments i) edges")
+
+
+_COLUMNS = ("instrument_id", "bucket", "open", "high", "low", "close", "total", "count")
+
+# 各粒度的水位线：该时间桶及之后的数据在下一轮重新聚合，None表示还没有可聚合的数据
+_watermarks: Dict[str, Optional[int]] = {name: None for name in ROLLUPS}
+
+# 模拟/回放写入的记录中最早的时间戳，可能早于水位线，下一轮聚合从该时间桶重新开始
+_backfill_from: Optional[int] = None
+
+_rollup_task: Optional[asyncio.Task] = None
+
+
+def floor_bucket(ts: int, width: int) -> int:
+    """时间戳所在时间桶的起始时间"""
+    return ts - ts % width
+
+
+def aggregate(rows: Iterable[Tuple], width: int) -> List[Tuple]:
+    """把按(instrument_id, 时间)排序的记录聚合到时间桶
+
+    每条记录为(instrument_id, ts, open, high, low, close, total, count)，原始价格记录的开高低收都是价格本身、count为1，
+    因此原始记录聚合为分钟、分钟聚合为小时使用同一套逻辑
+    """
+    buckets: Dict[Tuple[int, int], list] = {}
+    for instrument_id, ts, open_, high, low, close, total, count in rows:
+        key = (instrument_id, floor_bucket(ts, width))
+        bucket = buckets.get(key)
+        if bucket is None:
+            buckets[key] = [open_, high, low, close, total, count]
+        else:
+            bucket[1] = max(bucket[1], high)
+            bucket[2] = min(bucket[2], low)
+            bucket[3] = close
+            bucket[4] += total
+            bucket[5] += count
+    return [(instrument_id, bucket, *values) for (instrument_id, bucket), values in buckets.items()]
+
+
+async def _upsert(conn, table: str, rows: List[Tuple]):
+    """写入聚合结果，时间桶已存在时覆盖"""
+    if not rows:
+        return
+    if conn.capabilities.dialect == "mysql":
+        columns = ", ".join(f"`{c}`" for c in _COLUMNS)
+        updates = ", ".join(f"`{c}` = VALUES(`{c}`)" for c in _COLUMNS[2:])
+        sql = (f"INSERT INTO `{table}` ({columns}) VALUES ({', '.join(['%s'] * len(_COLUMNS))}) "
+               f"ON DUPLICATE KEY UPDATE {updates}")
+    else:
+        columns = ", ".join(f'"{c}"' for c in _COLUMNS)
+        sql = f'INSERT OR REPLACE INTO "{table}" ({columns}) VALUES ({", ".join(["?"] * len(_COLUMNS))})'
+    await conn.execute_many(sql, [list(row) for row in rows])
+
+
+async def _edge(conn, model, column: str, last: bool) -> Optional[int]:
+    rows = await conn.execute_query_dict(_edge_sql(model._meta.db_table, column, last))
+    return rows[0]["t"] if rows else None
+
+
+async def _load_watermarks(conn):
+    """进程启动后第一次聚合时，从已有的聚合结果恢复水位线"""
+    if _watermarks["1m"] is None:
+        last = await _edge(conn, PriceRollupMinute, "bucket", True)
+        if last is None:
+            # 还没有聚合过：从最早的原始记录开始
+            last = await _edge(conn, RealTimePrice, "ts", False)
+        _watermarks["1m"] = None if last is None else floor_bucket(last, MINUTE_MS)
+    if _watermarks["1h"] is None:
+        last = await _edge(conn, PriceRollupHour, "bucket", True)
+        _watermarks["1h"] = None if last is None else floor_bucket(last, HOUR_MS)
+
+
+def _instrument_groups(span_ms: int, interval_ms: int) -> Iterable[List[int]]:
+    """把品牌分组，使每组在span_ms时间范围内（每interval_ms一条记录）的记录数不超过_MAX_QUERY_ROWS"""
+    ids = sorted(_INSTRUMENT_IDS.values())
+    size = min(_MAX_QUERY_INSTRUMENTS, max(1, _MAX_QUERY_ROWS * interval_ms // max(span_ms, 1)))
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+
+async def _refresh_minutes(conn, start: int, now: int) -> int:
+    written = 0
+    table = PriceRollupMinute._meta.db_table
+    while start <= now:
+        end = start + _BATCH_MS
+        for ids in _instrument_groups(min(end, now + 1) - start, RAW_TICK_INTERVAL_MS):
+            # 一条查询读取一组品牌的时间范围，在主键(instrument_id, ts)上按品牌逐个范围扫描
+            rows = await RealTimePrice.filter(
+                instrument_id__in=ids, ts__gte=start, ts__lt=end
+            ).order_by("instrument_id", "ts").values_list("instrument_id", "ts", "price")
+            buckets = aggregate(((i, ts, p, p, p, p, p, 1) for i, ts, p in rows), MINUTE_MS)
+            await _upsert(conn, table, buckets)
+            written += len(buckets)
+        start = end
+    return written
+
+
+async def _refresh_hours(conn, start: int, now: int) -> int:
+    written = 0
+    table = PriceRollupHour._meta.db_table
+    for ids in _instrument_groups(now + 1 - start, MINUTE_MS):
+        rows = await PriceRollupMinute.filter(
+            instrument_id__in=ids, bucket__gte=start
+        ).order_by("instrument_id", "bucket").values_list(
+            "instrument_id", "bucket", "open", "high", "low", "close", "total", "count"
+        )
+        buckets = aggregate(rows, HOUR_MS)
+        await _upsert(conn, table, buckets)
+        written += len(buckets)
+    return written
+
+
+def settled_until(resolution: str) -> Optional[int]:
+    """该粒度下之前的数据已经不会再变化的时间（不含）：原始记录为当前时间减去写入延迟，聚合为水位线所在的时间桶，
+    还没有聚合过时为None"""
+    if resolution == "raw":
+        return now_ts() - _LATENESS_MS
+    return _watermarks[resolution]
+
+
+def mark_backfilled(ts: int):
+    """价格生成任务写入了时间戳为ts的历史记录（虚拟时钟模拟、不平移时间的回放），水位线降到ts所在的时间桶"""
+    global _backfill_from
+    _backfill_from = ts if _backfill_from is None else min(_backfill_from, ts)
+
+
+async def refresh_rollups(now: Optional[int] = None) -> Dict[str, int]:
+    """执行一次增量聚合，返回各粒度本轮写入（覆盖）的时间桶数量"""
+    global _backfill_from
+    conn = connections.get("default")
+    now = now_ts() if now is None else now
+    await _load_watermarks(conn)
+    if _backfill_from is not None:
+        for name, (_, width) in ROLLUPS.items():
+            bucket = floor_bucket(_backfill_from, width)
+            if _watermarks[name] is None or bucket < _watermarks[name]:
+                _watermarks[name] = bucket
+        _backfill_from = None
+    minute_start = _watermarks["1m"]
+    if minute_start is None:
+        return {"1m": 0, "1h": 0}
+
+    written = {"1m": await _refresh_minutes(conn, minute_start, now)}
+    # 小时聚合只依赖分钟聚合，从两者中较早的水位线所在小时开始重新合成
+    hour_start = floor_bucket(minute_start, HOUR_MS)
+    if _watermarks["1h"] is not None:
+        hour_start = min(hour_start, _watermarks["1h"])
+    written["1h"] = await _refresh_hours(conn, hour_start, now)
+
+    watermark = max(minute_start, now - _LATENESS_MS)
+    _watermarks["1m"] = floor_bucket(watermark, MINUTE_MS)
+    _watermarks["1h"] = floor_bucket(watermark, HOUR_MS)
+    return written
+
+
+def choose_resolution(span_ms: int, limit: int) -> str:
+    """选择能用不超过limit个点覆盖时间跨度的最细粒度：原始记录 -> 分钟 -> 小时（都超出时用小时）"""
+    if span_ms <= limit * RAW_TICK_INTERVAL_MS:
+        return "raw"
+    for name, (_, width) in ROLLUPS.items():
+        if span_ms <= limit * width:
+            return name
+    return name
+
+
+def _format_bucket(bucket: int, open_: int, high: int, low: int, close: int, avg: float, count: int) -> Dict:
+    return {
+        "time": str(ts_to_datetime(bucket)),
+        "value": close / PRICE_SCALE,
+        "open": open_ / PRICE_SCALE,
+        "high": high / PRICE_SCALE,
+        "low": low / PRICE_SCALE,
+        "avg": round(avg, 2),
+        "count": count,
+    }
+
+
+async def rollup_history(instrument_id: int, resolution: str, start: int, end: int, limit: int) -> List[Dict]:
+    """按聚合粒度读取[start, end]内最多limit个时间桶，缺失的时间桶用上一个收盘价补齐（count为0）"""
+    model, width = ROLLUPS[resolution]
+    first = floor_bucket(start, width)
+    last = min(floor_bucket(end, width), first + (limit - 1) * width)
+    rows = await model.filter(instrument_id=instrument_id, bucket__gte=first, bucket__lte=last).order_by("bucket")
+
+    # 范围开头没有数据时，取范围之前最近的一个时间桶作为补齐的起点
+    previous = None
+    if not rows or rows[0].bucket > first:
+        previous = await model.filter(instrument_id=instrument_id, bucket__lt=first).order_by("-bucket").first()
+    close = previous.close if previous else None
+
+    # 只补齐到已聚合的范围，避免把尚未聚合的时间段显示成价格不变
+    fill_end = last if _watermarks[resolution] is None else min(last, _watermarks[resolution])
+    if rows:
+        fill_end = max(fill_end, rows[-1].bucket)
+
+    by_bucket = {row.bucket: row for row in rows}
+    history = []
+    for bucket in range(first, fill_end + 1, width):
+        row = by_bucket.get(bucket)
+        if row is not None:
+            close = row.close
+            history.append(_format_bucket(bucket, row.open, row.high, row.low, row.close, row.avg, row.count))
+        elif close is not None:
+            history.append(_format_bucket(bucket, close, close, close, close, close / PRICE_SCALE, 0))
+    return history
+
+
+async def run_rollup_maintenance():
+    """定期执行增量聚合"""
+    try:
+        while True:
+            try:
+                await refresh_rollups()
+            except Exception as e:
+                print(f"价格聚合任务出错: {e}")
+            await asyncio.sleep(ROLLUP_INTERVAL)
+    except asyncio.CancelledError:
+        pass
+
+
+async def start_rollup_maintenance():
+    """启动价格聚合任务"""
+    global _rollup_task
+    if _rollup_task and not _rollup_task.done():
+        return
+    _rollup_task = asyncio.create_task(run_rollup_maintenance())
+
+
+async def stop_rollup_maintenance():
+    """停止价格聚合任务"""
+    global _rollup_task
+    if _rollup_task and not _rollup_task.done():
+        _rollup_task.cancel()
+        try:
+            await _rollup_task
+        except asyncio.CancelledError:
+            pass
+    _rollup_task = None
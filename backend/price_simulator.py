@@ -0,0 +1,88 @@
+"""
+向量化价格模拟器
+所有品牌的价格保存在NumPy数组中，每一步对整个数组做一次运算，一次生成全部品牌的新价格，
+数千个品牌也只需要一次批量写入。支持两种模型：
+- bounded：有界随机游走（默认，与原先的行为一致），每步在±volatility范围内均匀浮动，价格限制在基础价格±2*volatility之内
+- gbm：几何布朗运动，每步对数收益率服从N(-σ²/2, σ²)，σ为每步波动率
+"""
+import os
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+SUPPORTED_MODELS = ("bounded", "gbm")
+
+# 模拟的品牌总数，超出真实品牌数量的部分自动生成 SIM0007 这样的模拟品牌；0表示只模拟真实品牌
+SIM_INSTRUMENTS = int(os.getenv("PRICE_SIM_INSTRUMENTS", "0"))
+
+# 价格模型
+SIM_MODEL = os.getenv("PRICE_SIM_MODEL", "bounded").strip().lower()
+
+# 随机数种子，配置后模拟品牌的参数和价格序列完全可重复
+SIM_SEED = int(os.getenv("PRICE_SIM_SEED")) if os.getenv("PRICE_SIM_SEED") else None
+
+# 真实品牌的每步波动率；模拟品牌在此基础上随机放大或缩小（0.5~1.5倍）
+SIM_VOLATILITY = float(os.getenv("PRICE_SIM_VOLATILITY", "0.05"))
+
+
+class PriceSimulator:
+    """同时模拟多个品牌的价格"""
+
+    def __init__(self, names: Sequence[str], base_prices: Sequence[float], volatility: Sequence[float],
+                 model: str = "bounded", seed: Optional[int] = None):
+        if model not in SUPPORTED_MODELS:
+            raise ValueError(f"不支持的价格模型: {model}，可选值: {', '.join(SUPPORTED_MODELS)}")
+        self.names: List[str] = list(names)
+        self.model = model
+        self.rng = np.random.default_rng(seed)
+        self.base = np.asarray(base_prices, dtype=np.float64)
+        self.volatility = np.asarray(volatility, dtype=np.float64)
+        self.prices = self.base.copy()
+        # 各品牌最近一条记录的毫秒时间戳，保证同一品牌的时间戳严格递增（主键不冲突）
+        self.last_ts = np.zeros(len(self.names), dtype=np.int64)
+        self._index = {name: i for i, name in enumerate(self.names)}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def restore(self, name: str, price: float, ts: int):
+        """从已有数据恢复某个品牌的当前价格和最近时间戳"""
+        i = self._index.get(name)
+        if i is not None:
+            self.prices[i] = price
+            self.last_ts[i] = ts
+
+    def step(self, now: int):
+        """前进一步，返回 (时间戳数组, 价格数组)"""
+        if self.model == "gbm":
+            shocks = self.rng.standard_normal(len(self.names))
+            self.prices = self.prices * np.exp(self.volatility * shocks - 0.5 * self.volatility ** 2)
+        else:
+            fluctuation = self.rng.uniform(-self.volatility, self.volatility)
+            self.prices = np.clip(
+                self.prices * (1 + fluctuation),
+                self.base * (1 - self.volatility * 2),
+                self.base * (1 + self.volatility * 2),
+            )
+        self.last_ts = np.maximum(now, self.last_ts + 1)
+        return self.last_ts, self.prices
+
+
+def build_simulator(base_prices: Dict[str, float], instruments: int = None, model: str = None,
+                    volatility: float = None, seed: Optional[int] = SIM_SEED) -> PriceSimulator:
+    """按配置创建模拟器：先放入真实品牌，不足instruments个时补充模拟品牌"""
+    instruments = SIM_INSTRUMENTS if instruments is None else instruments
+    model = SIM_MODEL if model is None else model
+    volatility = SIM_VOLATILITY if volatility is None else volatility
+
+    # 模拟品牌的参数和价格序列都由同一个种子派生，相同种子得到完全相同的结果
+    rng = np.random.default_rng(seed)
+    names = list(base_prices.keys())
+    prices = list(base_prices.values())
+    vols = [volatility] * len(names)
+    extra = max(0, instruments - len(names))
+    if extra:
+        names += [f"SIM{i:04d}" for i in range(len(names) + 1, len(names) + extra + 1)]
+        prices += rng.uniform(10, 5000, extra).round(2).tolist()
+        vols += (volatility * rng.uniform(0.5, 1.5, extra)).tolist()
+    return PriceSimulator(names, prices, vols, model=model, seed=int(rng.integers(2 ** 63)))
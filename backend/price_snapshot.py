@@ -0,0 +1,113 @@
+"""
+价格生成状态快照
+定期把模拟器状态（各品牌当前价格、最近时间戳）和内存中的最近价格窗口写入本地Arrow IPC文件，
+每个品牌一行，窗口保存为定长列表列。写入时先写临时文件再原子替换，读取时通过内存映射直接读取列数据。
+重启时快照存在、足够新且不落后于数据库中的最新记录（见database.init_initial_price_data）就直接恢复，不再读取价格窗口
+"""
+import os
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+import pyarrow as pa
+
+from price_simulator import PriceSimulator
+from price_window import TickWindow
+
+# 快照文件路径，设置为空字符串时关闭快照
+SNAPSHOT_PATH = os.getenv(
+    "PRICE_SNAPSHOT_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "price_snapshot.arrow")
+)
+
+# 写入快照的间隔（秒）
+SNAPSHOT_INTERVAL = float(os.getenv("PRICE_SNAPSHOT_INTERVAL", "30"))
+
+# 超过该时长（秒）的快照视为过期，启动时改为从数据库恢复
+SNAPSHOT_MAX_AGE = float(os.getenv("PRICE_SNAPSHOT_MAX_AGE", "300"))
+
+
+def build_snapshot(simulator: PriceSimulator, window: TickWindow, instrument_ids: Dict[str, int]) -> pa.Table:
+    """在事件循环线程中复制当前状态，生成的表可以交给其他线程写入文件"""
+    size = window.size
+    count = len(simulator)
+    window_ts = np.zeros((count, size), dtype=np.int64)
+    window_price = np.zeros((count, size), dtype=np.int64)
+    head = np.zeros(count, dtype=np.int64)
+    filled = np.zeros(count, dtype=np.int64)
+    for i, name in enumerate(simulator.names):
+        row = window.rows.get(instrument_ids.get(name))
+        if row is not None:
+            window_ts[i] = window.ts[row]
+            window_price[i] = window.price[row]
+            head[i] = window.head[row]
+            filled[i] = window.count[row]
+    metadata = {"saved_at": str(int(time.time() * 1000)), "window_size": str(size)}
+    return pa.table({
+        "name": pa.array(simulator.names, type=pa.string()),
+        "price": pa.array(simulator.prices.copy()),
+        "last_ts": pa.array(simulator.last_ts.copy()),
+        "window_ts": pa.FixedSizeListArray.from_arrays(pa.array(window_ts.ravel()), size),
+        "window_price": pa.FixedSizeListArray.from_arrays(pa.array(window_price.ravel()), size),
+        "window_head": pa.array(head),
+        "window_count": pa.array(filled),
+    }).replace_schema_metadata(metadata)
+
+
+def write_snapshot(table: pa.Table, path: str = SNAPSHOT_PATH):
+    """原子写入快照：写临时文件并刷盘后再替换，进程中途退出不会留下损坏的快照"""
+    tmp = path + ".tmp"
+    with pa.OSFile(tmp, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    with open(tmp, "rb+") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _column(table: pa.Table, name: str) -> np.ndarray:
+    return table.column(name).combine_chunks().to_numpy()
+
+
+def read_snapshot(path: str = SNAPSHOT_PATH, max_age: float = SNAPSHOT_MAX_AGE) -> Optional[Dict]:
+    """读取快照，文件不存在、已过期或无法解析时返回None"""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with pa.memory_map(path, "r") as source:
+            table = pa.ipc.open_file(source).read_all()
+            metadata = table.schema.metadata or {}
+            saved_at = int(metadata[b"saved_at"])
+            size = int(metadata[b"window_size"])
+            if time.time() * 1000 - saved_at > max_age * 1000:
+                return None
+            # 从内存映射中读取后立即复制，关闭文件后数组仍然有效
+            return {
+                "saved_at": saved_at,
+                "names": table.column("name").to_pylist(),
+                "price": _column(table, "price").copy(),
+                "last_ts": _column(table, "last_ts").copy(),
+                "window_ts": table.column("window_ts").combine_chunks().flatten().to_numpy().reshape(-1, size).copy(),
+                "window_price": table.column("window_price").combine_chunks().flatten().to_numpy().reshape(-1, size).copy(),
+                "window_head": _column(table, "window_head").copy(),
+                "window_count": _column(table, "window_count").copy(),
+            }
+    except (OSError, KeyError, ValueError, pa.ArrowException) as e:
+        print(f"价格快照无法读取，改为从数据库恢复: {e}")
+        return None
+
+
+def restore_snapshot(snapshot: Dict, simulator: PriceSimulator, window: TickWindow,
+                     instrument_ids: Dict[str, int]) -> bool:
+    """用快照恢复模拟器和最近价格窗口；快照没有覆盖全部品牌或窗口大小不一致时不恢复，返回False"""
+    index = {name: i for i, name in enumerate(snapshot["names"])}
+    if any(name not in index for name in simulator.names) or snapshot["window_ts"].shape[1] != window.size:
+        return False
+    rows: List[int] = [index[name] for name in simulator.names]
+    for name, row in zip(simulator.names, rows):
+        simulator.restore(name, float(snapshot["price"][row]), int(snapshot["last_ts"][row]))
+    window.load(
+        np.array([instrument_ids[name] for name in simulator.names], dtype=np.int64),
+        snapshot["window_ts"][rows], snapshot["window_price"][rows],
+        snapshot["window_head"][rows], snapshot["window_count"][rows],
+    )
+    return True
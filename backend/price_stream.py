@@ -0,0 +1,74 @@
+"""
+价格推送通道
+客户端通过 GET /api/mall/streamPrices（Server-Sent Events）订阅，价格生成任务每写入一批就把其中订阅的品牌推送给客户端，
+不需要定时轮询。每个订阅者一个有界队列，生成任务只把这批记录的引用放入队列，序列化在各订阅者自己的协程中完成；
+客户端消费太慢时丢弃最早的消息（客户端可以用最后收到的seq通过增量拉取补齐），不会拖慢价格生成任务。
+订阅时指定owner的客户端还会收到该接收者的价格提醒触发消息
+"""
+import asyncio
+import os
+from typing import Any, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+# 每个订阅者最多积压的消息数
+STREAM_QUEUE_SIZE = int(os.getenv("PRICE_STREAM_QUEUE_SIZE", "100"))
+
+# 没有新消息时发送心跳的间隔（秒），避免代理因连接空闲而断开
+STREAM_HEARTBEAT = float(os.getenv("PRICE_STREAM_HEARTBEAT", "15"))
+
+
+class Subscription:
+    """一个订阅者：订阅的品牌ID和待发送的消息队列"""
+
+    def __init__(self, instrument_ids: Iterable[int], indicators: bool = False, owner: Optional[str] = None,
+                 maxsize: int = STREAM_QUEUE_SIZE):
+        self.instrument_ids = np.array(sorted(set(instrument_ids)), dtype=np.int64)
+        self.indicators = indicators
+        self.owner = owner
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.dropped = 0
+
+    def put(self, message: Tuple[str, Any]):
+        """放入一条消息，队列已满时丢弃最早的一条"""
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(message)
+
+
+class PriceStream:
+    """订阅者集合，所有方法都在事件循环线程中调用"""
+
+    def __init__(self):
+        self.subscriptions: Set[Subscription] = set()
+
+    def subscribe(self, instrument_ids: Iterable[int], indicators: bool = False, owner: Optional[str] = None) -> Subscription:
+        subscription = Subscription(instrument_ids, indicators, owner)
+        self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self.subscriptions.discard(subscription)
+
+    def publish_ticks(self, instrument_ids: np.ndarray, ts: np.ndarray, prices: np.ndarray):
+        """推送一批价格记录（定点价格）：每个订阅者收到("ticks", (品牌ID, 时间戳, 价格))，只包含其订阅的品牌"""
+        if not self.subscriptions:
+            return
+        for subscription in self.subscriptions:
+            selected = np.isin(instrument_ids, subscription.instrument_ids)
+            if selected.any():
+                subscription.put(("ticks", (instrument_ids[selected], ts[selected], prices[selected])))
+
+    def publish_alerts(self, triggered: List):
+        """推送触发的价格提醒：每个提醒发送给owner相同的订阅者，消息为("alert", Triggered)"""
+        for subscription in self.subscriptions:
+            if subscription.owner is None:
+                continue
+            for item in triggered:
+                if item.alert.owner == subscription.owner:
+                    subscription.put(("alert", item))
+
+
+# 全局推送通道
+PRICE_STREAM = PriceStream()
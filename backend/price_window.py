@@ -0,0 +1,134 @@
+"""
+内存中的最近价格窗口
+每个品牌保留最近PRICE_WINDOW_SIZE条记录，底层是按品牌分行的NumPy环形缓冲区，
+价格生成任务每写入一批就整批追加，查询最近价格时不需要访问数据库。
+
+每条价格记录有一个序列号 seq = ts * 32768 + instrument_id：(instrument_id, ts)是主键，序列号因此唯一，
+并且由记录本身决定（重启、从数据库读取都得到相同的值）。价格生成任务每批记录的时间戳都晚于上一批，
+所以按写入顺序单调递增，客户端用上次拿到的最大seq作为游标增量拉取，不会遗漏也不会重复
+"""
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# 每个品牌在内存中保留的最近记录数
+WINDOW_SIZE = int(os.getenv("PRICE_WINDOW_SIZE", "100"))
+
+# 序列号中时间戳的倍数（instrument_id为SMALLINT，小于32768）
+SEQ_BASE = 32768
+
+
+def tick_seq(ts: int, instrument_id: int) -> int:
+    """价格记录的序列号"""
+    return ts * SEQ_BASE + instrument_id
+
+
+def seq_after_ts(ts: int) -> int:
+    """时间戳游标转换为序列号游标：seq大于该值的记录即ts大于该时间戳的记录"""
+    return ts * SEQ_BASE + SEQ_BASE - 1
+
+
+def batch_rounds(rows: np.ndarray):
+    """把一批记录拆成若干轮，每轮中同一行最多出现一次：第k轮为每行在本批中的第k条记录（保持原顺序）"""
+    if len(np.unique(rows)) == len(rows):
+        yield np.arange(len(rows))
+        return
+    order = np.argsort(rows, kind="stable")
+    sorted_rows = rows[order]
+    starts = np.r_[0, np.flatnonzero(np.diff(sorted_rows)) + 1]
+    rank = np.arange(len(rows)) - np.repeat(starts, np.diff(np.r_[starts, len(rows)]))
+    for k in range(rank.max() + 1):
+        yield order[rank == k]
+
+
+class TickWindow:
+    """按品牌保存最近size条(ts, 定点价格)记录的环形缓冲区"""
+
+    def __init__(self, size: int = WINDOW_SIZE):
+        self.size = size
+        self.rows: Dict[int, int] = {}  # 品牌ID -> 行号
+        self.ts = np.zeros((0, size), dtype=np.int64)
+        self.price = np.zeros((0, size), dtype=np.int64)
+        self.head = np.zeros(0, dtype=np.int64)  # 下一条记录写入的位置
+        self.count = np.zeros(0, dtype=np.int64)
+
+    def clear(self):
+        self.__init__(self.size)
+
+    def load(self, instrument_ids: np.ndarray, ts: np.ndarray, price: np.ndarray, head: np.ndarray, count: np.ndarray):
+        """整体替换窗口内容（用于从快照恢复），各数组按instrument_ids的顺序排列"""
+        self.rows = {int(i): row for row, i in enumerate(instrument_ids.tolist())}
+        self.ts, self.price, self.head, self.count = ts, price, head, count
+
+    def _rows_for(self, instrument_ids: np.ndarray) -> np.ndarray:
+        """品牌ID映射为行号，新品牌追加新行"""
+        new = [i for i in dict.fromkeys(instrument_ids.tolist()) if i not in self.rows]
+        if new:
+            for instrument_id in new:
+                self.rows[instrument_id] = len(self.rows)
+            grow = len(new)
+            self.ts = np.vstack([self.ts, np.zeros((grow, self.size), dtype=np.int64)])
+            self.price = np.vstack([self.price, np.zeros((grow, self.size), dtype=np.int64)])
+            self.head = np.concatenate([self.head, np.zeros(grow, dtype=np.int64)])
+            self.count = np.concatenate([self.count, np.zeros(grow, dtype=np.int64)])
+        return np.fromiter((self.rows[i] for i in instrument_ids.tolist()), dtype=np.int64, count=len(instrument_ids))
+
+    def append(self, instrument_ids: np.ndarray, ts: np.ndarray, prices: np.ndarray):
+        """追加一批记录；同一批内同一品牌出现多次时按顺序分轮写入"""
+        rows = self._rows_for(instrument_ids)
+        for selected in batch_rounds(rows):
+            self._append_unique(rows[selected], ts[selected], prices[selected])
+
+    def _append_unique(self, rows: np.ndarray, ts: np.ndarray, prices: np.ndarray):
+        positions = self.head[rows]
+        self.ts[rows, positions] = ts
+        self.price[rows, positions] = prices
+        self.head[rows] = (positions + 1) % self.size
+        self.count[rows] = np.minimum(self.count[rows] + 1, self.size)
+
+    def latest(self, instrument_id: int) -> Optional[Tuple[int, int]]:
+        """品牌最新的一条记录：(ts, 定点价格)"""
+        row = self.rows.get(instrument_id)
+        if row is None or self.count[row] == 0:
+            return None
+        position = (self.head[row] - 1) % self.size
+        return int(self.ts[row, position]), int(self.price[row, position])
+
+    def recent(self, instrument_id: int, limit: Optional[int] = None) -> List[Tuple[int, int]]:
+        """品牌最近的limit条记录，按时间升序：[(ts, 定点价格), ...]"""
+        row = self.rows.get(instrument_id)
+        if row is None:
+            return []
+        count = int(self.count[row]) if limit is None else min(int(self.count[row]), limit)
+        positions = (self.head[row] - count + np.arange(count)) % self.size
+        return list(zip(self.ts[row, positions].tolist(), self.price[row, positions].tolist()))
+
+    def since(self, instrument_ids: List[int], since_seq: int, limit: int) -> Optional[List[Tuple[int, int, int]]]:
+        """seq大于since_seq的记录[(instrument_id, ts, 定点价格), ...]，按seq排序，最多limit条
+
+        since_seq不大于0时只返回每个品牌的最新一条。窗口中最早的记录已经比游标新时（中间的记录可能已被挤出窗口），
+        或者某个品牌不在窗口中，返回None，由调用方改为查询数据库
+        """
+        ticks = []
+        for instrument_id in instrument_ids:
+            row = self.rows.get(instrument_id)
+            if row is None or self.count[row] == 0:
+                return None
+            count = int(self.count[row])
+            positions = (self.head[row] - count + np.arange(count)) % self.size
+            ts = self.ts[row, positions]
+            if since_seq <= 0:
+                selected = positions[-1:]
+            else:
+                seqs = ts * SEQ_BASE + instrument_id
+                if seqs[0] > since_seq:
+                    return None
+                selected = positions[seqs > since_seq]
+            ticks += [(instrument_id, t, p) for t, p in zip(self.ts[row, selected].tolist(), self.price[row, selected].tolist())]
+        ticks.sort(key=lambda tick: tick_seq(tick[1], tick[0]))
+        return ticks[:limit]
+
+
+# 价格生成任务维护的全局窗口
+RECENT_TICKS = TickWindow()
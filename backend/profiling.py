@@ -0,0 +1,301 @@
+"""
+运行时性能诊断接口（仅管理员）
+- CPU：采样事件循环线程的调用栈，可按时间段采样，也可在请求头带 X-Profile: 1 时只采样该请求
+- 内存：基于tracemalloc的内存分配快照和两次快照之间的差异
+CPU采样和内存快照都支持输出折叠栈格式（folded），可直接交给 flamegraph.pl / speedscope 生成火焰图。
+通过请求头 X-Admin-Token 鉴权，未配置 ADMIN_TOKEN 环境变量时这些接口全部禁用
+"""
+import asyncio
+import hmac
+import itertools
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, deque
+from typing import Dict, List, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from starlette.datastructures import Headers, MutableHeaders
+
+# 单次CPU采样的最长时间（秒），避免误操作导致长时间采样
+MAX_PROFILE_SECONDS = 60
+
+# 保留最近的单请求采样结果数量
+REQUEST_PROFILE_HISTORY = 20
+
+
+def is_admin_token(token: Optional[str]) -> bool:
+    """校验管理员令牌（未配置ADMIN_TOKEN时一律视为无权限）"""
+    expected = os.getenv("ADMIN_TOKEN")
+    if not expected or not token:
+        return False
+    return hmac.compare_digest(token, expected)
+
+
+async def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """管理员鉴权依赖"""
+    if not os.getenv("ADMIN_TOKEN"):
+        raise HTTPException(status_code=403, detail={"code": -999, "message": "未配置ADMIN_TOKEN，诊断接口已禁用"})
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(status_code=403, detail={"code": -999, "message": "无权访问"})
+
+
+def frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def frame_stack(frame) -> List[str]:
+    """从栈顶帧构建调用栈（由外到内）"""
+    stack = []
+    while frame is not None:
+        stack.append(frame_label(frame))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def to_folded(stacks: Counter) -> str:
+    """输出折叠栈格式：每行 "帧1;帧2;帧3 次数" """
+    return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()) + "\n"
+
+
+class StackSampler:
+    """在后台线程中按固定间隔采样目标线程的调用栈"""
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started_at = 0.0
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            self.stacks[";".join(frame_stack(frame))] += 1
+            self.samples += 1
+            del frame
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration = time.perf_counter() - self.started_at
+        return self
+
+    def summary(self, limit: int = 30) -> Dict:
+        """按函数汇总：self为栈顶出现次数，total为出现在栈中的次数"""
+        self_counts: Counter = Counter()
+        total_counts: Counter = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            self_counts[frames[-1]] += count
+            for frame in set(frames):
+                total_counts[frame] += count
+        return {
+            "samples": self.samples,
+            "duration": round(self.duration, 3),
+            "interval": self.interval,
+            "self": [{"frame": f, "samples": c} for f, c in self_counts.most_common(limit)],
+            "total": [{"frame": f, "samples": c} for f, c in total_counts.most_common(limit)],
+        }
+
+
+def profile_response(sampler: StackSampler, format: str, limit: int = 30):
+    if format == "folded":
+        return PlainTextResponse(to_folded(sampler.stacks))
+    return {"code": 200, "data": sampler.summary(limit)}
+
+
+# 单请求采样结果，按采样ID保存最近若干条
+_request_profiles: "deque[Dict]" = deque(maxlen=REQUEST_PROFILE_HISTORY)
+_profile_ids = itertools.count(1)
+
+
+class RequestProfilerMiddleware:
+    """ASGI中间件：管理员请求带 X-Profile: 1 时采样该请求期间的事件循环，结果通过 X-Profile-Id 查询
+
+    采样对象是整个事件循环线程，同时在处理的其他请求和后台任务也会出现在结果中
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        if headers.get("x-profile") != "1" or not is_admin_token(headers.get("x-admin-token")):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = next(_profile_ids)
+        sampler = StackSampler(threading.get_ident()).start()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append("X-Profile-Id", str(profile_id))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.stop()
+            _request_profiles.append({
+                "id": profile_id,
+                "method": scope["method"],
+                "path": scope["path"],
+                "time": time.time(),
+                "sampler": sampler,
+            })
+
+
+# 上一次内存快照，用于计算差异
+_last_snapshot: Optional[tracemalloc.Snapshot] = None
+
+
+def _take_snapshot() -> tracemalloc.Snapshot:
+    # 排除tracemalloc自身和导入机制的分配，只关注业务代码
+    return tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    ))
+
+
+def _format_stat(stat) -> Dict:
+    frame = stat.traceback[0]
+    return {
+        "location": f"{frame.filename}:{frame.lineno}",
+        "size_kb": round(stat.size / 1024, 1),
+        "count": stat.count,
+    }
+
+
+def _format_diff(stat) -> Dict:
+    data = _format_stat(stat)
+    data["size_diff_kb"] = round(stat.size_diff / 1024, 1)
+    data["count_diff"] = stat.count_diff
+    return data
+
+
+def _snapshot_folded(snapshot: tracemalloc.Snapshot) -> str:
+    """按完整调用栈汇总内存，输出以KB为单位的折叠栈，用于生成内存火焰图"""
+    stacks: Counter = Counter()
+    for stat in snapshot.statistics("traceback"):
+        # traceback中的帧已按由外到内排列，与折叠栈格式一致
+        frames = [f"{os.path.basename(f.filename)}:{f.lineno}" for f in stat.traceback]
+        stacks[";".join(frames)] += max(1, stat.size // 1024)
+    return to_folded(stacks)
+
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+
+@router.get("/profile/cpu")
+async def profile_cpu(
+    seconds: float = Query(5.0, gt=0, le=MAX_PROFILE_SECONDS),
+    interval: float = Query(0.005, ge=0.001, le=1.0),
+    format: str = Query("json", pattern="^(json|folded)$"),
+    limit: int = 30,
+):
+    """采样事件循环线程指定秒数"""
+    sampler = StackSampler(threading.get_ident(), interval).start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        sampler.stop()
+    return profile_response(sampler, format, limit)
+
+
+@router.get("/profile/requests")
+async def list_request_profiles():
+    """最近的单请求采样记录"""
+    return {"code": 200, "data": [
+        {"id": p["id"], "method": p["method"], "path": p["path"], "time": p["time"],
+         "samples": p["sampler"].samples, "duration": round(p["sampler"].duration, 3)}
+        for p in reversed(_request_profiles)
+    ]}
+
+
+@router.get("/profile/requests/{profile_id}")
+async def get_request_profile(profile_id: int, format: str = Query("json", pattern="^(json|folded)$"), limit: int = 30):
+    """查看单个请求的采样结果"""
+    for p in _request_profiles:
+        if p["id"] == profile_id:
+            return profile_response(p["sampler"], format, limit)
+    raise HTTPException(status_code=404, detail={"code": -999, "message": "采样结果不存在或已过期"})
+
+
+@router.post("/memory/start")
+async def memory_start(frames: int = Query(10, ge=1, le=100)):
+    """开始跟踪内存分配（frames为每次分配记录的调用栈深度，越大开销越高）"""
+    global _last_snapshot
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+    tracemalloc.start(frames)
+    _last_snapshot = None
+    return {"code": 200, "message": f"已开始跟踪内存分配（栈深度{frames}）"}
+
+
+@router.post("/memory/stop")
+async def memory_stop():
+    """停止跟踪内存分配并释放跟踪数据"""
+    global _last_snapshot
+    tracemalloc.stop()
+    _last_snapshot = None
+    return {"code": 200, "message": "已停止跟踪内存分配"}
+
+
+@router.get("/memory/snapshot")
+async def memory_snapshot(
+    limit: int = Query(20, ge=1, le=500),
+    format: str = Query("json", pattern="^(json|folded)$"),
+):
+    """当前内存分配最多的位置，同时作为下一次diff的基准"""
+    global _last_snapshot
+    if not tracemalloc.is_tracing():
+        raise HTTPException(status_code=400, detail={"code": -999, "message": "未开始跟踪内存分配，请先调用 /memory/start"})
+    # 拍快照和统计都要遍历全部跟踪记录，放到线程中执行，不阻塞事件循环
+    snapshot = await asyncio.to_thread(_take_snapshot)
+    _last_snapshot = snapshot
+    if format == "folded":
+        return PlainTextResponse(await asyncio.to_thread(_snapshot_folded, snapshot))
+    current, peak = tracemalloc.get_traced_memory()
+    stats = await asyncio.to_thread(snapshot.statistics, "lineno")
+    return {"code": 200, "data": {
+        "current_kb": round(current / 1024, 1),
+        "peak_kb": round(peak / 1024, 1),
+        "top": [_format_stat(stat) for stat in stats[:limit]],
+    }}
+
+
+@router.get("/memory/diff")
+async def memory_diff(limit: int = Query(20, ge=1, le=500)):
+    """与上一次快照相比内存增长最多的位置，并把当前快照作为新的基准"""
+    global _last_snapshot
+    if not tracemalloc.is_tracing():
+        raise HTTPException(status_code=400, detail={"code": -999, "message": "未开始跟踪内存分配，请先调用 /memory/start"})
+    if _last_snapshot is None:
+        raise HTTPException(status_code=400, detail={"code": -999, "message": "还没有基准快照，请先调用 /memory/snapshot"})
+    baseline = _last_snapshot
+    snapshot = await asyncio.to_thread(_take_snapshot)
+    _last_snapshot = snapshot
+    stats = await asyncio.to_thread(snapshot.compare_to, baseline, "lineno")
+    return {"code": 200, "data": {"top": [_format_diff(stat) for stat in stats[:limit]]}}
@@ -0,0 +1,133 @@
+"""
+请求级查询追踪
+通过contextvar把每条数据库查询归属到当前请求，统计查询次数和耗时，
+在响应中输出 Server-Timing 头，并在同一形状的查询在一个请求内重复过多时给出N+1警告。
+测试中可以用 query_budget() 断言某段代码（如一次接口调用）的查询次数上限
+"""
+import logging
+import os
+import re
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from time import perf_counter
+from typing import List, Optional
+
+from starlette.datastructures import MutableHeaders
+
+logger = logging.getLogger("query_trace")
+
+# 同一形状的查询在一个请求内超过该次数时视为N+1问题
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "5"))
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=1024)
+def query_shape(sql: str) -> str:
+    """把SQL中的字面量替换为占位符，得到查询的"形状"，用于识别重复查询"""
+    shape = _STRING_LITERAL.sub("?", sql)
+    shape = _NUMBER_LITERAL.sub("?", shape)
+    shape = _IN_LIST.sub("IN (?)", shape)
+    return _WHITESPACE.sub(" ", shape).strip()
+
+
+class QueryTrace:
+    """一次请求（或一段代码）内的查询统计，嵌套时查询会同时计入外层"""
+
+    def __init__(self, parent: Optional["QueryTrace"] = None):
+        self.parent = parent
+        self.count = 0
+        self.duration = 0.0
+        self.shapes: Counter = Counter()
+
+    def add(self, sql: str, elapsed: float):
+        trace = self
+        shape = query_shape(sql)
+        while trace is not None:
+            trace.count += 1
+            trace.duration += elapsed
+            trace.shapes[shape] += 1
+            trace = trace.parent
+
+    def repeated_shapes(self, threshold: int = None) -> List[tuple]:
+        """返回重复次数超过阈值的查询形状及次数"""
+        threshold = N_PLUS_ONE_THRESHOLD if threshold is None else threshold
+        return [(shape, count) for shape, count in self.shapes.items() if count > threshold]
+
+
+_current_trace: ContextVar[Optional[QueryTrace]] = ContextVar("query_trace", default=None)
+
+
+def current_trace() -> Optional[QueryTrace]:
+    """获取当前上下文中的查询统计"""
+    return _current_trace.get()
+
+
+def record_query(sql: str, elapsed: float, failed: bool):
+    """数据库查询监听器：把查询计入当前请求的统计"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(sql, elapsed)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """查询次数超出预算"""
+
+
+@contextmanager
+def query_budget(max_queries: int):
+    """断言代码块内执行的查询次数不超过max_queries
+
+    用法:
+        with query_budget(2):
+            await client.get("/api/user/getUserData")
+    """
+    trace = QueryTrace(parent=_current_trace.get())
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+    if trace.count > max_queries:
+        details = "\n".join(f"  {count}x {shape}" for shape, count in trace.shapes.most_common())
+        raise QueryBudgetExceeded(f"执行了{trace.count}条查询，超出预算{max_queries}条:\n{details}")
+
+
+class QueryTraceMiddleware:
+    """ASGI中间件：为每个请求建立查询统计，并在响应头中输出 Server-Timing"""
+
+    def __init__(self, app, threshold: int = None):
+        self.app = app
+        self.threshold = N_PLUS_ONE_THRESHOLD if threshold is None else threshold
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = QueryTrace(parent=_current_trace.get())
+        token = _current_trace.set(trace)
+        start = perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                total = (perf_counter() - start) * 1000
+                headers = MutableHeaders(scope=message)
+                headers.append(
+                    "Server-Timing",
+                    f'db;dur={trace.duration * 1000:.2f};desc="{trace.count} queries", app;dur={total:.2f}'
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_trace.reset(token)
+            for shape, count in trace.repeated_shapes(self.threshold):
+                logger.warning("疑似N+1查询: %s %s 在一次请求中执行了%d次: %s",
+                               scope["method"], scope["path"], count, shape)
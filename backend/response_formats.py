@@ -0,0 +1,143 @@
+"""
+响应格式协商和压缩
+批量数据接口（价格历史、用户列表）默认仍返回按行组织的JSON；通过format参数或Accept头可以选择其他格式：
+- columnar：按列组织的JSON，行列表变为 {"time": [...], "value": [...]}，字段名只出现一次
+- msgpack：columnar结构的MessagePack编码（Accept: application/msgpack）
+- arrow：Arrow IPC流（Accept: application/vnd.apache.arrow.stream），行列表为一张表，响应中的其他字段（如name、count）
+  以JSON字符串形式放在schema元数据中
+CompressionMiddleware对超过COMPRESS_MIN_SIZE字节的非流式响应按Accept-Encoding进行brotli或gzip压缩
+"""
+import gzip
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+import brotli
+import msgpack
+import pyarrow as pa
+from fastapi import HTTPException, Request
+from fastapi.responses import Response
+
+FORMATS = ("json", "columnar", "msgpack", "arrow")
+
+_MEDIA_TYPES = {
+    "msgpack": "application/msgpack",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+_ACCEPT_FORMATS = {
+    "application/msgpack": "msgpack",
+    "application/x-msgpack": "msgpack",
+    "application/vnd.apache.arrow.stream": "arrow",
+}
+
+# 响应体超过该字节数才压缩
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+
+# 已经压缩过的格式不再压缩
+_COMPRESSIBLE_TYPES = ("application/json", "application/msgpack", "application/vnd.apache.arrow.stream", "text/")
+
+
+def negotiate(request: Request, format: Optional[str] = None) -> str:
+    """确定响应格式：format参数优先，其次为Accept头，默认json"""
+    if format:
+        if format not in FORMATS:
+            raise HTTPException(status_code=400, detail={"code": -999, "message": f"无效的响应格式，可选值: {', '.join(FORMATS)}"})
+        return format
+    for part in request.headers.get("accept", "").split(","):
+        media_type = part.split(";")[0].strip().lower()
+        if media_type in _ACCEPT_FORMATS:
+            return _ACCEPT_FORMATS[media_type]
+    return "json"
+
+
+def to_columns(rows: List[Dict[str, Any]]) -> Dict[str, List]:
+    """行列表转换为按列组织的字典（字段取第一行的字段）"""
+    keys = list(rows[0].keys()) if rows else []
+    return {key: [row.get(key) for row in rows] for key in keys}
+
+
+def _arrow_stream(columns: Dict[str, List], metadata: Dict[str, Any]) -> bytes:
+    table = pa.table(columns).replace_schema_metadata(
+        {key: json.dumps(value, ensure_ascii=False) for key, value in metadata.items()}
+    )
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def render(body: Dict[str, Any], rows_key: str, format: str):
+    """按协商的格式输出接口响应，body为原本的JSON响应，body["data"][rows_key]为行列表"""
+    if format == "json":
+        return body
+    data = dict(body["data"])
+    columns = to_columns(data.pop(rows_key))
+    if format == "arrow":
+        return Response(_arrow_stream(columns, {"code": body["code"], **data}), media_type=_MEDIA_TYPES["arrow"])
+    data[rows_key] = columns
+    columnar = {**body, "data": data}
+    if format == "msgpack":
+        return Response(msgpack.packb(columnar, use_bin_type=True), media_type=_MEDIA_TYPES["msgpack"])
+    return columnar
+
+
+def _accepted_encoding(headers) -> Optional[str]:
+    """按Accept-Encoding选择压缩算法，brotli优先"""
+    for name, value in headers:
+        if name == b"accept-encoding":
+            encodings = {part.split(";")[0].strip() for part in value.decode("latin-1").lower().split(",")}
+            if "br" in encodings:
+                return "br"
+            if "gzip" in encodings:
+                return "gzip"
+    return None
+
+
+class CompressionMiddleware:
+    """压缩较大的非流式响应（纯ASGI中间件，流式响应如Server-Sent Events原样转发）"""
+
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = _accepted_encoding(scope["headers"])
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+
+        async def send_wrapper(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                # 等到第一段响应体才能判断是否压缩
+                start_message = message
+                return
+            if start_message is not None:
+                start, start_message = start_message, None
+                headers = [(k, v) for k, v in start["headers"]]
+                content_type = next((v.decode("latin-1") for k, v in headers if k == b"content-type"), "")
+                body = message.get("body", b"")
+                if (
+                    not message.get("more_body", False)
+                    and len(body) >= self.minimum_size
+                    and content_type.startswith(_COMPRESSIBLE_TYPES)
+                    and not any(k == b"content-encoding" for k, _ in headers)
+                ):
+                    body = brotli.compress(body, quality=4) if encoding == "br" else gzip.compress(body, compresslevel=6)
+                    headers = [(k, v) for k, v in headers if k != b"content-length"]
+                    headers += [
+                        (b"content-encoding", encoding.encode()),
+                        (b"content-length", str(len(body)).encode()),
+                        (b"vary", b"Accept-Encoding"),
+                    ]
+                    message = {**message, "body": body}
+                await send({**start, "headers": headers})
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -6,27 +6,19 @@
 import asyncio
 from tortoise import Tortoise, run_async
 from dotenv import load_dotenv
-import os
 
 # 加载环境变量
 load_dotenv()
 
 # 从database模块导入所需的组件
-from database import Menu
+from database import Menu, get_db_url, get_db_display_url
 
 async def show_menus():
     """显示菜单数据"""
     try:
-        # 获取数据库配置参数
-        DB_USERNAME = os.getenv('DB_USERNAME', 'root')
-        DB_PASSWORD = os.getenv('DB_PASSWORD', 'password')
-        DB_HOST = os.getenv('DB_HOST', 'localhost')
-        DB_PORT = os.getenv('DB_PORT', '3306')
-        DB_NAME = os.getenv('DB_NAME', 'vue3_project')
-        
-        # 构建数据库连接URL
-        db_url = f"mysql://{DB_USERNAME}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-        print(f"正在连接到数据库: {DB_USERNAME}@{DB_HOST}:{DB_PORT}/{DB_NAME}")
+        # 获取数据库连接URL（由DB_BACKEND选择MySQL或SQLite）
+        db_url = get_db_url()
+        print(f"正在连接到数据库: {get_db_display_url()}")
         
         # 初始化Tortoise ORM（不依赖FastAPI应用）
         await Tortoise.init(
@@ -0,0 +1,106 @@
+"""
+单飞请求合并
+同一接口、相同参数的并发请求只计算一次：第一个请求开始计算，计算期间到达的相同请求等待同一个结果，
+结果只序列化一次，各请求共享序列化后的JSON。可以设置ttl在计算完成后的一小段时间内直接复用结果，
+用于吸收多个页面同时刷新、轮询周期对齐以及部署后客户端集中重连带来的重复查询。
+计算在独立的任务中执行，发起计算的请求被取消（客户端断开）不影响其他等待的请求；
+计算出错时所有等待的请求得到同一个错误，错误结果不复用。
+读副本和读主库的请求（见db_replicas.py）分别合并，写请求之后读主库的客户端不会拿到副本上计算的结果
+"""
+import asyncio
+import functools
+import json
+import os
+from time import monotonic
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+
+from db_replicas import read_connection
+from metrics import SINGLE_FLIGHT_REQUESTS
+
+# 计算完成后复用结果的时长（秒），0表示只合并并发请求
+COALESCE_TTL = float(os.getenv("COALESCE_TTL", "0"))
+
+
+def _normalize(value: Any) -> Hashable:
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_normalize(v) for v in value)
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+
+def request_key(kwargs: Dict[str, Any]) -> Tuple:
+    """规范化的请求参数：忽略未提供的参数，按参数名排序"""
+    return tuple(sorted((key, _normalize(value)) for key, value in kwargs.items() if value is not None))
+
+
+def _dumps(content: Any) -> bytes:
+    """与FastAPI默认的JSONResponse相同的序列化方式"""
+    return json.dumps(
+        jsonable_encoder(content), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+class SingleFlight:
+    """一个接口的进行中计算和可复用的结果，所有方法都在事件循环线程中调用"""
+
+    def __init__(self, ttl: float = COALESCE_TTL):
+        self.ttl = ttl
+        self.inflight: Dict[Hashable, asyncio.Future] = {}
+        # 键 -> (过期时间, 结果)，按写入顺序即过期顺序排列
+        self.results: Dict[Hashable, Tuple[float, bytes]] = {}
+
+    async def do(self, key: Hashable, compute: Callable[[], Awaitable[bytes]]) -> Tuple[bytes, str]:
+        """返回(结果, 来源)，来源为computed（本请求发起计算）、shared（等待进行中的计算）或cached（复用结果）"""
+        cached = self.results.get(key)
+        if cached is not None and cached[0] > monotonic():
+            return cached[1], "cached"
+        task = self.inflight.get(key)
+        source = "shared"
+        if task is None:
+            task = self.inflight[key] = asyncio.ensure_future(compute())
+            task.add_done_callback(functools.partial(self._done, key))
+            source = "computed"
+        # shield：本请求被取消时不取消共享的计算
+        return await asyncio.shield(task), source
+
+    def _done(self, key: Hashable, task: asyncio.Future):
+        del self.inflight[key]
+        # 取出异常，避免没有等待者时输出"exception was never retrieved"
+        if task.cancelled() or task.exception() is not None or self.ttl <= 0:
+            return
+        now = monotonic()
+        self.results.pop(key, None)
+        self.results[key] = (now + self.ttl, task.result())
+        # 清理已过期的结果（按过期时间排列，从头部开始）
+        while self.results:
+            oldest = next(iter(self.results))
+            if self.results[oldest][0] > now:
+                break
+            del self.results[oldest]
+
+
+def coalesce(ttl: float = COALESCE_TTL):
+    """接口装饰器：合并参数相同的并发请求，返回共享的JSON响应
+
+    只用于参数都是简单值（不含Request等对象）、结果与调用者无关的只读接口，放在@router.get之下
+    """
+    def decorator(func):
+        flight = SingleFlight(ttl)
+        route = func.__name__
+
+        @functools.wraps(func)
+        async def wrapper(**kwargs):
+            async def compute() -> bytes:
+                return _dumps(await func(**kwargs))
+
+            body, source = await flight.do((read_connection(), request_key(kwargs)), compute)
+            SINGLE_FLIGHT_REQUESTS.labels(route, source).inc()
+            return Response(body, media_type="application/json")
+
+        wrapper.flight = flight
+        return wrapper
+    return decorator
@@ -0,0 +1,109 @@
+"""
+预编译SQL模板
+热点接口的查询形状固定，只有参数不同，但每次请求都要经过ORM的QuerySet构建和SQL生成。
+SqlTemplate第一次执行时用ORM构建一次查询，得到带占位符的SQL、参数位置和各列的类型转换函数，
+按(连接, 形状)缓存；之后直接在原始连接（读副本路由见db_replicas.py）上绑定参数执行，结果与ORM的values()/values_list()相同（字典列表/元组列表）。
+编译方式：构建查询时每个参数传入一个唯一的哨兵值，在ORM生成的参数列表中找到哨兵的位置；不是哨兵的参数是查询中的常量。
+参数值原样绑定（只支持int/str参数），无法编译的查询（如参数经过转换：LIKE的%x%）以及SQL_TEMPLATES=0时使用ORM执行
+"""
+import os
+import types
+from typing import Any, Callable, Dict, Hashable, List, NamedTuple, Tuple
+
+from tortoise import connections
+from tortoise.queryset import ValuesListQuery, ValuesQuery
+
+from db_replicas import read_connection
+
+# 是否启用预编译SQL（0为全部使用ORM执行，便于对比和排查问题）
+SQL_TEMPLATES_ENABLED = os.getenv("SQL_TEMPLATES", "1") != "0"
+
+# 整数参数的哨兵值起点（不与实际参数值冲突，且在32位整数范围内）
+_INT_SENTINEL = 1_999_000_000
+
+
+class _Compiled(NamedTuple):
+    sql: str
+    params: List[Tuple[bool, Any]]  # (是否为参数, 参数名或常量值)
+    columns: List[Tuple[str, Callable]]  # (列别名, 类型转换函数)，不需要转换的列不在其中
+    keys: List[str]  # values_list的列别名顺序，values查询为None
+    flat: bool
+
+
+class SqlTemplate:
+    """一个固定形状的只读查询
+
+    build(*shape, **params)返回ORM的values()或values_list()查询，shape为决定SQL结构的可哈希值
+    （如选择的字段、是否有某个条件），params为绑定参数，参数名和类型在slots中声明
+    """
+
+    def __init__(self, name: str, build: Callable, **slots: type):
+        self.name = name
+        self.build = build
+        self.slots = slots
+        self._compiled: Dict[Hashable, _Compiled] = {}
+        self._failed: set = set()
+
+    def _sentinels(self) -> Dict[str, Any]:
+        return {
+            slot: _INT_SENTINEL + i if kind is int else f"\x00{self.name}:{slot}\x00"
+            for i, (slot, kind) in enumerate(self.slots.items())
+        }
+
+    def compile(self, *shape) -> _Compiled:
+        """用ORM构建一次查询，提取SQL、参数位置和列的类型转换函数"""
+        sentinels = self._sentinels()
+        by_value = {value: slot for slot, value in sentinels.items()}
+        query = self.build(*shape, **sentinels)
+        if not isinstance(query, (ValuesQuery, ValuesListQuery)) or query._single:
+            raise TypeError(f"SQL模板 {self.name} 只支持返回列表的values()/values_list()查询")
+        sql = query.sql()
+        _, values = query.query.get_parameterized_sql()
+        params = []
+        for value in values:
+            if isinstance(value, (int, str)) and value in by_value:
+                params.append((True, by_value[value]))
+            elif isinstance(value, str) and "\x00" in value:
+                raise ValueError(f"SQL模板 {self.name} 的参数在生成SQL时被转换: {value!r}")
+            else:
+                params.append((False, value))
+        if isinstance(query, ValuesQuery):
+            fields, keys, flat = query._fields_for_select, None, False
+        else:
+            fields, keys, flat = query.fields, list(query.fields), query._flat
+        columns = [(alias, query.resolve_to_python_value(query.model, field)) for alias, field in fields.items()]
+        if keys is None:
+            # 与ValuesQuery相同：原样返回的列（转换函数为普通函数）不再逐行处理
+            columns = [(alias, func) for alias, func in columns if not isinstance(func, types.LambdaType)]
+        return _Compiled(sql, params, columns, keys, flat)
+
+    def _get(self, connection: str, shape: Tuple) -> Any:
+        key = (connection, shape)
+        compiled = self._compiled.get(key)
+        if compiled is None and key not in self._failed:
+            try:
+                compiled = self._compiled[key] = self.compile(*shape)
+            except Exception as e:
+                print(f"SQL模板 {self.name}{shape} 编译失败，改用ORM执行: {e}")
+                self._failed.add(key)
+        return compiled
+
+    async def execute(self, *shape, **params) -> List:
+        """执行查询，返回值与ORM查询相同"""
+        connection = read_connection()
+        compiled = self._get(connection, shape) if SQL_TEMPLATES_ENABLED else None
+        if compiled is None:
+            return await self.build(*shape, **params)
+        rows = await connections.get(connection).execute_query_dict(
+            compiled.sql, [params[value] if is_param else value for is_param, value in compiled.params]
+        )
+        if compiled.keys is None:
+            for row in rows:
+                for alias, func in compiled.columns:
+                    row[alias] = func(row[alias])
+            return rows
+        columns = compiled.columns
+        if compiled.flat:
+            func = columns[0][1]
+            return [func(row["0"]) for row in rows]
+        return [tuple(func(row[alias]) for alias, func in columns) for row in rows]
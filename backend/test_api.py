@@ -1,24 +1,16 @@
 import asyncio
 from tortoise import Tortoise
-import os
 from dotenv import load_dotenv
 
 # 加载环境变量
 load_dotenv()
 
 # 从database模块导入所需的模型
-from database import Account, Menu
+from database import Account, Menu, get_db_url
 
 async def test_get_menu():
-    # 获取数据库配置
-    DB_USERNAME = os.getenv('DB_USERNAME', 'root')
-    DB_PASSWORD = os.getenv('DB_PASSWORD', 'password')
-    DB_HOST = os.getenv('DB_HOST', 'localhost')
-    DB_PORT = os.getenv('DB_PORT', '3306')
-    DB_NAME = os.getenv('DB_NAME', 'vue3_project')
-    
-    # 构建数据库连接URL
-    db_url = f"mysql://{DB_USERNAME}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+    # 获取数据库连接URL（由DB_BACKEND选择MySQL或SQLite）
+    db_url = get_db_url()
     
     try:
         # 初始化Tortoise ORM
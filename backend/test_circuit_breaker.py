@@ -0,0 +1,162 @@
+import asyncio
+
+from tortoise.exceptions import IntegrityError, OperationalError
+
+import db_guard
+from db_guard import CircuitBreaker, DatabaseUnavailable, QueryTimeout, deadline, guard_query
+
+
+def _breaker(**kwargs) -> CircuitBreaker:
+    options = dict(window=10, min_calls=4, error_rate=0.5, slow_rate=0.8, slow_query=1.0, cooldown=5)
+    options.update(kwargs)
+    return CircuitBreaker(**options)
+
+
+def _expire_cooldown(breaker: CircuitBreaker):
+    breaker.opened_at -= breaker.cooldown
+
+
+def test_stays_closed_below_min_calls():
+    """查询数不足min_calls时，即使全部失败也不打开"""
+    breaker = _breaker()
+    for _ in range(3):
+        breaker.record(True, 0.01)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+
+def test_opens_on_error_rate():
+    """失败比例达到阈值时打开，冷却期间拒绝查询"""
+    breaker = _breaker()
+    for failed in (False, True, False, True):
+        breaker.record(failed, 0.01)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+
+def test_opens_on_slow_rate():
+    """慢查询比例达到阈值时打开（查询本身都成功）"""
+    breaker = _breaker()
+    for elapsed in (2.0, 2.0, 2.0, 0.01, 2.0):
+        breaker.record(False, elapsed)
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_window_drops_old_outcomes():
+    """只统计最近window条查询，早期的失败移出窗口后不再计入"""
+    breaker = _breaker(window=4, min_calls=4)
+    breaker.record(True, 0.01)
+    for _ in range(6):
+        breaker.record(False, 0.01)
+    assert (len(breaker.outcomes), breaker.failures, breaker.slow) == (4, 0, 0)
+    breaker.record(True, 0.01)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_cancelled_queries_are_ignored():
+    """被取消的查询（failed为None）不计入"""
+    breaker = _breaker()
+    for _ in range(10):
+        breaker.record(None, 5.0)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert len(breaker.outcomes) == 0
+
+
+def test_half_open_allows_one_probe():
+    """冷却结束后进入半开状态，同一时间只放行一条探测查询"""
+    breaker = _breaker()
+    breaker._open()
+    assert not breaker.allow()
+    _expire_cooldown(breaker)
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+
+
+def test_successful_probe_closes():
+    """探测查询成功则关闭，并清空之前的统计"""
+    breaker = _breaker()
+    for _ in range(4):
+        breaker.record(True, 0.01)
+    _expire_cooldown(breaker)
+    assert breaker.allow()
+    breaker.record(False, 0.01)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert (len(breaker.outcomes), breaker.failures, breaker.slow) == (0, 0, 0)
+    assert breaker.allow()
+
+
+def test_failed_or_slow_probe_reopens():
+    """探测查询失败或为慢查询时重新打开，重新开始冷却"""
+    for failed, elapsed in ((True, 0.01), (False, 2.0)):
+        breaker = _breaker()
+        breaker._open()
+        _expire_cooldown(breaker)
+        assert breaker.allow()
+        breaker.record(failed, elapsed)
+        assert breaker.state == CircuitBreaker.OPEN
+        assert not breaker.allow()
+
+
+def test_cancelled_probe_allows_another_probe():
+    """探测查询被取消时保持半开，允许下一条探测查询"""
+    breaker = _breaker()
+    breaker._open()
+    _expire_cooldown(breaker)
+    assert breaker.allow()
+    breaker.record(None, 0.01)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+
+
+def test_guard_query():
+    """guard_query：拒绝熔断期间的查询，超时转换为QueryTimeout，唯一约束冲突不计为失败"""
+    async def run():
+        async def fail(exc):
+            raise exc
+
+        async def slow():
+            await asyncio.sleep(1)
+
+        breaker = db_guard.BREAKER = _breaker(window=4)
+        assert await guard_query(lambda: asyncio.sleep(0, "ok")) == "ok"
+
+        for _ in range(4):
+            try:
+                await guard_query(lambda: fail(IntegrityError("duplicate")))
+            except IntegrityError:
+                pass
+        assert breaker.state == CircuitBreaker.CLOSED and breaker.failures == 0
+
+        with deadline(0.05):
+            try:
+                await guard_query(slow)
+                raise AssertionError("应当超时")
+            except QueryTimeout:
+                pass
+        assert breaker.failures == 1
+
+        # 窗口中4条查询有2条失败，达到失败率阈值
+        try:
+            await guard_query(lambda: fail(OperationalError("connection lost")))
+        except OperationalError:
+            pass
+        assert breaker.state == CircuitBreaker.OPEN
+        try:
+            await guard_query(lambda: asyncio.sleep(0))
+            raise AssertionError("熔断期间应当拒绝查询")
+        except DatabaseUnavailable:
+            pass
+
+    saved = db_guard.BREAKER
+    try:
+        asyncio.run(run())
+    finally:
+        db_guard.BREAKER = saved
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"通过 {name}")
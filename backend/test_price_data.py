@@ -1,6 +1,6 @@
 import asyncio
 from tortoise import Tortoise
-from database import get_db_url, RealTimePrice, _BASE_PRICES
+from database import get_db_url, RealTimePrice, _BASE_PRICES, generate_schemas, load_instruments
 
 async def test_insert_price():
     """测试插入价格数据到数据库"""
@@ -13,24 +13,26 @@ async def test_insert_price():
         
         print(f"数据库连接成功: {get_db_url()}")
         
+        # 确保表结构和品牌ID缓存就绪
+        await generate_schemas()
+        await load_instruments()
+        
         # 尝试插入一条测试数据
         brand = list(_BASE_PRICES.keys())[0]  # 获取第一个品牌
         price = _BASE_PRICES[brand]
         
         print(f"尝试插入测试数据: 品牌={brand}, 价格={price}")
-        record = await RealTimePrice.create(
-            name=brand,
-            value=price
-        )
+        record = RealTimePrice.new_tick(brand, price)
+        await record.save()
         
-        print(f"数据插入成功，记录ID: {record.id}")
+        print(f"数据插入成功，品牌ID: {record.instrument_id}，时间戳: {record.ts}")
         
         # 尝试查询数据
         count = await RealTimePrice.all().count()
         print(f"当前数据库中real_time_price表的记录总数: {count}")
         
         # 查询最新的记录
-        latest_record = await RealTimePrice.filter(name=brand).order_by('-time').first()
+        latest_record = await RealTimePrice.filter(instrument_id=record.instrument_id).order_by('-ts').first()
         if latest_record:
             print(f"最新记录: 品牌={latest_record.name}, 时间={latest_record.time}, 价格={latest_record.value}")
         
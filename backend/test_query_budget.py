@@ -0,0 +1,91 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+
+# 默认使用SQLite内存数据库，无需MySQL即可运行
+os.environ.setdefault("DB_BACKEND", "sqlite")
+os.environ.setdefault("SQLITE_PATH", ":memory:")
+
+import httpx
+
+from main import app
+from query_trace import query_budget, QueryBudgetExceeded
+
+# 各接口允许的最大查询次数，接口改动导致查询变多时这里会报错
+GET_BUDGETS = {
+    "/api/home/getTableData": 1,
+    "/api/home/getCountData": 1,
+    "/api/home/getChartData": 4,
+    "/api/user/getUserData?page=1&limit=10": 2,
+    "/api/user/getUserData?page=1&limit=10&fields=name,addr": 2,
+    "/api/user/getSalespeople": 1,
+    "/api/mall/getRealTimePrice": 1,
+    "/api/mall/getRealTimePrice?name=苹果": 1,
+    # 增量拉取：内存窗口无法覆盖时（测试中价格生成任务已停止）用一条查询从数据库读取
+    "/api/mall/getRealTimePrice?since=0": 1,
+    "/api/mall/getRealTimePrice?since_ts=0&names=苹果,小米": 1,
+    # 技术指标由价格生成任务在内存中增量维护，不查询数据库
+    "/api/mall/getIndicators?names=苹果,小米": 0,
+    "/api/mall/getPriceAlerts?owner=admin": 1,
+    # 一天的收益率相关性读取小时聚合（一条查询）
+    "/api/mall/getCorrelation?window=86400": 1,
+    "/api/mall/getPriceHistory?name=苹果&limit=100": 1,
+    # 一天的时间范围会读取小时聚合，范围开头没有数据时再查一次之前的收盘价用于补齐
+    "/api/mall/getPriceHistory?name=苹果&start_time="
+    + (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d %H:%M:%S"): 2,
+}
+
+
+async def check_query_budgets() -> int:
+    """逐个接口检查查询次数是否在预算之内，返回超出预算的接口数"""
+    failures = 0
+    async with app.router.lifespan_context(app):
+        # 价格生成任务与接口共用连接，先停掉避免其查询被计入
+        from database import stop_price_generation
+        await stop_price_generation()
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            requests = [("GET", path, None, budget) for path, budget in GET_BUDGETS.items()]
+            requests.append(("POST", "/api/permission/getMenu", {"username": "admin", "password": "admin"}, 2))
+            # 批量as-of查询：所有品牌的价格序列用一条查询读取
+            day_ago = int((datetime.now() - timedelta(days=1)).timestamp() * 1000)
+            requests.append(("POST", "/api/mall/getPricesAsOf",
+                             {"names": ["苹果", "小米"], "timestamps": list(range(day_ago, day_ago + 3600000, 1000))}, 1))
+            # 批量请求：首页的表格和图表数据一次请求获取，查询数为各子请求之和
+            requests.append(("POST", "/api/batch",
+                             {"requests": [{"url": "/home/getTableData"}, {"url": "/home/getChartData"}]}, 5))
+            requests.append(("POST", "/api/mall/addPriceAlert",
+                             {"owner": "admin", "name": "苹果", "condition": "drop", "value": 3, "window": 300}, 1))
+
+            for method, path, body, budget in requests:
+                try:
+                    with query_budget(budget) as trace:
+                        response = await client.request(method, path, json=body)
+                        response.raise_for_status()
+                    print(f"通过 {method} {path}: {trace.count}/{budget} 条查询")
+                except QueryBudgetExceeded as e:
+                    failures += 1
+                    print(f"失败 {method} {path}: {e}")
+
+            # 并发的相同请求合并为一次计算，查询数与单个请求相同
+            try:
+                with query_budget(GET_BUDGETS["/api/home/getChartData"]) as trace:
+                    responses = await asyncio.gather(*(client.get("/api/home/getChartData") for _ in range(10)))
+                    assert len({response.content for response in responses}) == 1
+                print(f"通过 10个并发的 GET /api/home/getChartData: {trace.count} 条查询")
+            except QueryBudgetExceeded as e:
+                failures += 1
+                print(f"失败 10个并发的 GET /api/home/getChartData: {e}")
+
+    print(f"\n共 {len(requests)} 个接口，{failures} 个超出查询预算")
+    return failures
+
+
+def test_query_budgets():
+    failures = asyncio.run(check_query_budgets())
+    assert failures == 0, f"{failures} 个接口超出查询预算"
+
+
+if __name__ == "__main__":
+    raise SystemExit(1 if asyncio.run(check_query_budgets()) else 0)
@@ -112,6 +112,24 @@ export default {
       mock: false
     })
     },
+    // 增量获取价格数据（since为上次返回的游标seq，0表示只获取各品牌的最新价格）
+    getPriceDeltas(params) {
+    return request({
+      url: '/mall/getRealTimePrice',
+      method: 'get',
+      mock: false,
+      params: params
+    })
+    },
+    // 获取各品牌当前的技术指标（names为逗号分隔的品牌名称）
+    getIndicators(params) {
+    return request({
+      url: '/mall/getIndicators',
+      method: 'get',
+      mock: false,
+      params: params
+    })
+    },
     // 获取价格历史数据
     getPriceHistory(params) {
     return request({
@@ -121,4 +139,13 @@ export default {
       params: params
     })
     },
+    // 批量请求：requests为[{ method, url, params, body }]，返回与之一一对应的[{ status, body }]
+    batch(requests) {
+    return request({
+      url: '/batch',
+      method: 'post',
+      mock: false,
+      data: { requests }
+    })
+    },
 };
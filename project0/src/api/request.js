@@ -4,6 +4,8 @@ import config from "@/config/index.js";
 
 const service = axios.create({
   baseURL: config.baseApi,
+  // 携带cookie：后端在写请求之后通过cookie让同一客户端短时间内读主库（读写分离）
+  withCredentials: true,
 });
 const NETWORK_ERROR = "网络错误，请稍后重试";
 